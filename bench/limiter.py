@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+#rate limiter and admission control overhead, in process, no server or DB needed
+#
+#  python bench/limiter.py --ops 200000 --threads 8 --output ratelimit.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+import ratelimit
+from ratelimit import MemoryBackend, AdmissionControl, rate_limit
+
+
+def ns_per_op(elapsed, ops):
+    return round(elapsed / ops * 1e9, 1)
+
+
+def bench_take(ops, keys, threads):
+    backend = MemoryBackend()
+    per_thread = ops // threads
+
+    def work(offset):
+        for i in range(per_thread):
+            backend.take(f"bench:{(offset + i) % keys}", 1000.0, 1000.0)
+
+    workers = [threading.Thread(target=work, args=(t * per_thread,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return ns_per_op(time.perf_counter() - start, per_thread * threads)
+
+
+def bench_admission(ops):
+    control = AdmissionControl(limit=100, wait=0.1)
+    start = time.perf_counter()
+    for _ in range(ops):
+        control.acquire()
+        control.release()
+    return ns_per_op(time.perf_counter() - start, ops)
+
+
+def build_app(limited):
+    #same trivial view called straight through WSGI, with and without the decorator and admission hooks
+    app = Flask("bench")
+    if limited:
+        ratelimit.init_app(app)
+
+        @app.route("/ping")
+        @rate_limit("bench", "1000000000/second")
+        def ping():
+            return "ok"
+    else:
+        @app.route("/ping")
+        def ping():
+            return "ok"
+    return app
+
+
+def bench_requests(ops, rounds=5):
+    #alternating rounds, best of each, so machine noise does not land on one side
+    apps = {"plain": build_app(False), "limited": build_app(True)}
+    environ = EnvironBuilder(path="/ping", environ_base={"REMOTE_ADDR": "127.0.0.1"}).get_environ()
+    start_response = lambda status, headers: None
+    best = {}
+    for _ in range(rounds):
+        for name, app in apps.items():
+            start = time.perf_counter()
+            for _ in range(ops):
+                #a WSGI server always closes the body, that is where the admission slot is released
+                body = app(dict(environ), start_response)
+                b"".join(body)
+                body.close()
+            elapsed = ns_per_op(time.perf_counter() - start, ops)
+            best[name] = min(best.get(name, elapsed), elapsed)
+    best["overhead"] = round(best["limited"] - best["plain"], 1)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure rate limiter and admission control overhead")
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per variant and round")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {
+        "take_ns": {
+            "one_key": bench_take(args.ops, 1, 1),
+            "100k_keys": bench_take(args.ops, 100000, 1),
+            f"one_key_{args.threads}_threads": bench_take(args.ops, 1, args.threads),
+            f"100k_keys_{args.threads}_threads": bench_take(args.ops, 100000, args.threads),
+        },
+        "admission_acquire_release_ns": bench_admission(args.ops),
+        "request_ns": bench_requests(args.requests),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
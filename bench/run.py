@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+#load test driver, starts bench/server.py (unless --url is given), runs each scenario at the
+#requested concurrency and prints p50/p95/p99 latency, requests/sec and server peak RSS as JSON
+#
+#  python bench/seed.py --books 100000 --reviews 1000000
+#  python bench/run.py --concurrency 32 --duration 20 --output results.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#name -> (method, path, json body), {book}/{user}/{ids} are filled in per request
+SCENARIOS = {
+    "books_list": ("GET", "/books", None),
+    "books_page": ("GET", "/books?limit=50&sort=-points&fields=objectID,title,points", None),
+    "books_stream": ("GET", "/books?stream=1", None),
+    "book_detail": ("GET", "/books/{book}", None),
+    "book_ratings": ("GET", "/books/{book}/ratings", None),
+    "book_search": ("GET", "/books/search?q={word}&limit=20", None),
+    "reviews_by_book": ("GET", "/reviews?bookID={book}&limit=20", None),
+    "users_page": ("GET", "/users?limit=50", None),
+    "user_profiles": ("GET", "/users/profiles?ids={users}", None),
+    "archive_bulk": ("POST", "/books/archive", {"ids": "{ids}"}),
+    "comment": ("POST", "/comment", {"id": "{user}", "review": "bench review", "stars": 4, "bookID": "{book}"}),
+    "chat_open": ("POST", "/chat", {"user_id": "{user}", "target_user_id": "{user2}"}),
+}
+
+WORDS = ["the", "lost", "city", "night", "shadow", "king", "garden", "star", "ocean", "dream"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def fill(value, rng, args):
+    if isinstance(value, dict):
+        return {k: fill(v, rng, args) for k, v in value.items()}
+    if value == "{ids}":
+        return [rng.randint(1, args.books) for _ in range(20)]
+    if value == "{book}":
+        return rng.randint(1, args.books)
+    if value in ("{user}", "{user2}"):
+        return rng.randint(1, args.users)
+    return value
+
+
+def build_path(path, rng, args):
+    #{users} is a page of review authors
+    users = ",".join(str(rng.randint(1, args.users)) for _ in range(20))
+    return path.format(book=rng.randint(1, args.books), user=rng.randint(1, args.users), users=users,
+                       word=rng.choice(WORDS))
+
+
+def run_scenario(name, host, port, args, extra_headers=None):
+    method, path, body = SCENARIOS[name]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        local = []
+        local_errors = 0
+        headers = {"Content-Type": "application/json", **(extra_headers or {})}
+        while time.monotonic() < deadline:
+            url = build_path(path, rng, args)
+            payload = json.dumps(fill(body, rng, args)) if body is not None else None
+            start = time.perf_counter()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500 or response.status == 429:
+                    local_errors += 1
+            except Exception:
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.concurrency)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors[0], time.monotonic() - start)
+
+
+def run_socketio(url, args):
+    #rooms of two clients, each message is timed until the sender sees the room broadcast
+    import socketio
+
+    latencies = []
+    lock = threading.Lock()
+    clients = []
+    pending = {}
+
+    for i in range(args.rooms * 2):
+        client = socketio.Client(reconnection=False)
+        room = f"conversation_{i // 2 + 1}"
+
+        def on_messages(items, client_id=i):
+            #room messages arrive in batches, see fanout.py
+            for item in items:
+                sent = pending.pop((client_id, item["message"]), None)
+                if sent is not None:
+                    with lock:
+                        latencies.append(time.perf_counter() - sent)
+
+        client.on("messages", on_messages)
+        client.connect(url, wait_timeout=10)
+        client.emit("join", {"room": room, "username": f"bench{i}"})
+        clients.append((client, room, i))
+
+    deadline = time.monotonic() + args.duration
+    sent = [0]
+
+    def sender(client, room, client_id):
+        rng = random.Random(client_id)
+        seq = 0
+        while time.monotonic() < deadline:
+            text = f"bench-{client_id}-{seq}"
+            pending[(client_id, text)] = time.perf_counter()
+            client.emit("message", {"room": room, "message": text,
+                                    "sender_id": rng.randint(1, args.users), "receiver_id": rng.randint(1, args.users)})
+            seq += 1
+            time.sleep(args.message_interval)
+        with lock:
+            sent[0] += seq
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=sender, args=c) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    #let the last broadcasts arrive
+    time.sleep(1)
+    for client, _, _ in clients:
+        client.disconnect()
+
+    result = summarize(latencies, len(pending), elapsed)
+    result["sent"] = sent[0]
+    result["clients"] = len(clients)
+    return result
+
+
+def peak_rss_kb(pid):
+    #VmHWM is the peak resident set size, Linux only
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def limit_env(args):
+    #every bench client shares one IP, so "on" keeps the checks but raises the allowances out of the way
+    if args.rate_limits == "off":
+        return {"RATE_LIMIT_ENABLED": "false", "MAX_CONCURRENT_REQUESTS": "0"}
+    return {f"RATE_LIMIT_{name}": "1000000/second" for name in ("REGISTER", "COMMENT", "CHAT", "REVIEWS_BULK", "MESSAGE")}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def wait_for_server(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/db/pool")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up in {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP and Socket.IO endpoints")
+    parser.add_argument("--url", help="benchmark an already running server instead of starting bench/server.py")
+    parser.add_argument("--port", type=int, default=7100)
+    parser.add_argument("--async-mode", choices=["threading", "gevent"], default="threading",
+                        help="how bench/server.py serves the app")
+    parser.add_argument("--rate-limits", choices=["on", "off"], default="off",
+                        help="per-client limits and admission control, on adds their overhead to every request")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated, see SCENARIOS")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--books", type=int, default=10000, help="objectID range the seed created")
+    parser.add_argument("--users", type=int, default=1000, help="user id range the seed created")
+    parser.add_argument("--rooms", type=int, default=0, help="Socket.IO rooms to simulate, 0 skips")
+    parser.add_argument("--message-interval", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        target = args.url.rstrip("/")
+        host, _, port = target.split("://", 1)[-1].partition(":")
+        port = int(port or 80)
+    else:
+        host, port = "127.0.0.1", args.port
+        target = f"http://{host}:{port}"
+        server = subprocess.Popen([sys.executable, os.path.join(HERE, "server.py"), "--host", host, "--port", str(port),
+                                   "--async-mode", args.async_mode],
+                                  env={**os.environ, **limit_env(args), "SLOW_REQUEST_MS": os.getenv("SLOW_REQUEST_MS", "0")})
+    try:
+        wait_for_server(host, port)
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "scenarios": {},
+        }
+        for name in [s for s in args.scenarios.split(",") if s]:
+            if name not in SCENARIOS:
+                sys.exit(f"Unknown scenario {name}, options: {', '.join(SCENARIOS)}")
+            print(f"running {name}", file=sys.stderr)
+            report["scenarios"][name] = run_scenario(name, host, port, args)
+        if args.rooms:
+            print("running socketio", file=sys.stderr)
+            report["socketio"] = run_socketio(target, args)
+        if server is not None:
+            report["server_peak_rss_kb"] = peak_rss_kb(server.pid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+-- base tables for a local benchmark database, matching the columns app.py reads and writes
+-- seed.py applies this and then src/migrations/*.sql in order
+CREATE DATABASE IF NOT EXISTS bookreview_DB;
+USE bookreview_DB;
+
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(255) NOT NULL,
+    password VARCHAR(255),
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    profilePic VARCHAR(512),
+    email VARCHAR(255),
+    uid VARCHAR(128)
+);
+
+CREATE TABLE IF NOT EXISTS books (
+    objectID INT PRIMARY KEY,
+    image VARCHAR(512),
+    title VARCHAR(512),
+    url VARCHAR(512),
+    author VARCHAR(255),
+    num_comments INT,
+    points INT,
+    genre VARCHAR(64),
+    ranking INT
+);
+
+CREATE TABLE IF NOT EXISTS archived_books LIKE books;
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id INT,
+    review TEXT,
+    stars INT,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reviewID INT AUTO_INCREMENT PRIMARY KEY,
+    bookID INT
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id INT AUTO_INCREMENT PRIMARY KEY,
+    user1_id INT NOT NULL,
+    user2_id INT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    sender_id INT NOT NULL,
+    receiver_id INT NOT NULL,
+    message_text TEXT,
+    conversation_id INT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
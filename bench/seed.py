@@ -0,0 +1,171 @@
+import os
+import sys
+import glob
+import random
+import argparse
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+#seeded dataset generator for the benchmark database
+#python bench/seed.py --books 100000 --reviews 1000000 --users 10000 --messages 1000000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS = os.path.join(HERE, "..", "src", "migrations")
+
+GENRES = ["Fantasy", "SciFi", "Mystery", "Romance", "Horror", "History", "Biography", "Poetry", "Thriller", "Comics"]
+WORDS = ("the a of and lost city night river shadow king queen garden winter summer star house ocean "
+         "secret war peace fire glass iron silver dream road stone empire song wind heart").split()
+AUTHORS = [f"{first} {last}" for first in ("Ann", "Ben", "Cara", "Dev", "Eli", "Fay", "Gus", "Hana", "Ivo", "Jun")
+           for last in ("Smith", "Ito", "Okafor", "Novak", "Silva", "Khan", "Berg", "Moreau", "Lee", "Park")]
+
+
+def connect(database=None):
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASSWORD", "rootpassword"),
+        database=database,
+    )
+
+
+def run_sql_file(cursor, path):
+    with open(path) as f:
+        sql = f.read()
+    #statements end with ';' at the end of a line, comments are whole lines
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    for statement in "\n".join(lines).split(";\n"):
+        if statement.strip():
+            cursor.execute(statement)
+
+
+def create_schema(conn):
+    cursor = conn.cursor()
+    run_sql_file(cursor, os.path.join(HERE, "schema.sql"))
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS, "*.sql"))):
+        print(f"applying {os.path.basename(path)}")
+        run_sql_file(cursor, path)
+    conn.commit()
+    cursor.close()
+
+
+def truncate(conn):
+    cursor = conn.cursor()
+    for table in ("messages", "conversations", "reviews", "book_review_stats", "archived_books",
+                  "books", "users", "email_outbox", "sync_checkpoints", "unread_counters"):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    conn.commit()
+    cursor.close()
+
+
+def insert_chunks(conn, sql, rows, chunk_size):
+    cursor = conn.cursor()
+    chunk = []
+    total = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            cursor.executemany(sql, chunk)
+            conn.commit()
+            total += len(chunk)
+            chunk = []
+            print(f"  {total}", end="\r", flush=True)
+    if chunk:
+        cursor.executemany(sql, chunk)
+        conn.commit()
+        total += len(chunk)
+    cursor.close()
+    print(f"  {total} rows")
+
+
+def title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+
+
+def gen_users(rng, n):
+    for i in range(1, n + 1):
+        yield (f"user{i}", "benchpassword", f"user{i}@bench.local", f"uid-{i:08d}", f"https://pics.bench.local/{i}.png")
+
+
+def gen_books(rng, n):
+    for i in range(1, n + 1):
+        yield (i, f"https://img.bench.local/{i}.jpg", title(rng), f"https://books.bench.local/{i}",
+               rng.choice(AUTHORS), rng.randint(0, 500), rng.randint(0, 10000), rng.choice(GENRES), i)
+
+
+def gen_reviews(rng, n, users, books, start):
+    for _ in range(n):
+        created_at = start + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        yield (rng.randint(1, users), title(rng), rng.randint(1, 5), rng.randint(1, books), created_at)
+
+
+def gen_conversations(rng, n, users):
+    seen = set()
+    while len(seen) < n:
+        a, b = rng.randint(1, users), rng.randint(1, users)
+        pair = (min(a, b), max(a, b))
+        if a != b and pair not in seen:
+            seen.add(pair)
+            yield pair
+
+
+def gen_messages(rng, n, conversations, pairs):
+    for _ in range(n):
+        conversation_id = rng.randint(1, conversations)
+        a, b = pairs[conversation_id - 1]
+        sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+        yield (sender, receiver, title(rng), conversation_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and seed the benchmark database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--reviews", type=int, default=10000)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-schema", action="store_true", help="tables and migrations already exist")
+    args = parser.parse_args()
+
+    max_pairs = args.users * (args.users - 1) // 2
+    if args.conversations > max_pairs:
+        sys.exit(f"--conversations can be at most {max_pairs} with {args.users} users")
+
+    rng = random.Random(args.seed)
+
+    conn = connect()
+    if not args.skip_schema:
+        create_schema(conn)
+    conn.database = "bookreview_DB"
+    truncate(conn)
+
+    print("users")
+    insert_chunks(conn, "INSERT INTO users (username, password, email, uid, profilePic) VALUES (%s, %s, %s, %s, %s)",
+                  gen_users(rng, args.users), args.chunk_size)
+    print("books")
+    insert_chunks(conn, "INSERT INTO books (objectID, image, title, url, author, num_comments, points, genre, ranking) "
+                        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                  gen_books(rng, args.books), args.chunk_size)
+    print("reviews")
+    insert_chunks(conn, "INSERT INTO reviews (id, review, stars, bookID, created_at) VALUES (%s, %s, %s, %s, %s)",
+                  gen_reviews(rng, args.reviews, args.users, args.books, datetime(2024, 1, 1)), args.chunk_size)
+    print("conversations")
+    pairs = list(gen_conversations(rng, args.conversations, args.users))
+    insert_chunks(conn, "INSERT INTO conversations (user1_id, user2_id) VALUES (%s, %s)", iter(pairs), args.chunk_size)
+    print("messages")
+    insert_chunks(conn, "INSERT INTO messages (sender_id, receiver_id, message_text, conversation_id) VALUES (%s, %s, %s, %s)",
+                  gen_messages(rng, args.messages, args.conversations, pairs), args.chunk_size)
+    conn.close()
+
+    #rating summaries for the seeded reviews
+    sys.path.insert(0, os.path.join(HERE, "..", "src"))
+    os.environ.setdefault("DB_NAME", "bookreview_DB")
+    import review_stats
+    print(f"book_review_stats: {review_stats.rebuild()} books")
+
+
+if __name__ == "__main__":
+    main()
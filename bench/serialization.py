@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import gzip
+import random
+import argparse
+
+import brotli
+import msgpack
+import orjson
+
+#serialization CPU time and bytes on the wire for the books table, no server or DB needed
+#rows come from the same generator as seed.py
+#
+#  python bench/serialization.py --books 10000 --output serialization.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import gen_books
+from pagination import BOOKS
+from encoding import to_columns, GZIP_LEVEL, BROTLI_QUALITY
+
+
+def jsonify_dumps(result):
+    #what flask.jsonify does outside debug mode
+    return json.dumps(result, sort_keys=True, separators=(",", ":")).encode()
+
+
+ENCODERS = {
+    "jsonify": jsonify_dumps,
+    "orjson": orjson.dumps,
+    "msgpack": lambda result: msgpack.packb(result, use_bin_type=True),
+}
+
+COMPRESSORS = {
+    "none": lambda body: body,
+    "gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL),
+    "br": lambda body: brotli.compress(body, quality=BROTLI_QUALITY),
+}
+
+
+def best_of(func, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response encodings on generated books rows")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = [dict(zip(BOOKS.columns, row)) for row in gen_books(rng, args.books)]
+    shapes = {"objects": rows, "columns": to_columns(rows)}
+
+    report = {"books": args.books, "results": []}
+    for shape, result in shapes.items():
+        for encoder, dumps in ENCODERS.items():
+            body, encode_time = best_of(dumps, result, args.repeat)
+            for compressor, compress in COMPRESSORS.items():
+                wire, compress_time = best_of(compress, body, args.repeat)
+                report["results"].append({
+                    "shape": shape,
+                    "encoder": encoder,
+                    "compression": compressor,
+                    "encode_ms": round(encode_time * 1000, 3),
+                    "compress_ms": round(compress_time * 1000, 3),
+                    "total_ms": round((encode_time + compress_time) * 1000, 3),
+                    "bytes": len(wire),
+                })
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
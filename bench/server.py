@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+#runs the app for benchmarks with Firebase and SMTP stubbed, started by run.py or by hand
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the app with local Firebase/SMTP stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7000)
+    parser.add_argument("--async-mode", choices=["threading", "gevent"], default="threading",
+                        help="gevent runs the app the way src/serve.py does in production")
+    args = parser.parse_args()
+
+    server_options = {"allow_unsafe_werkzeug": True}
+    if args.async_mode == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+        os.environ["SOCKETIO_ASYNC_MODE"] = "gevent"
+        os.environ["DB_USE_PURE"] = "true"
+        server_options = {}
+
+    sys.path.insert(0, HERE)
+    sys.path.insert(0, SRC)
+    import stubs
+    stubs.install_firebase()
+    stubs.start_smtp()
+
+    import app
+
+    app.socketio.run(app.app, host=args.host, port=args.port, **server_options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+#Socket.IO load test: thousands of WebSocket clients in rooms, a few senders per room
+#reports the server's memory per connection, how many emits the fan-out made for the messages sent
+#(coalescing) and delivery latency, once per fan-out window so runs with and without batching compare
+#
+#  python bench/sockets.py --sockets 2000 --room-size 10 --windows 0,5 --duration 15 --output sockets.json
+#
+#clients speak Engine.IO 4 over WebSocket directly and run as greenlets, so one process can hold thousands
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+if __name__ == "__main__":
+    from gevent import monkey
+    monkey.patch_all()
+
+import gevent
+import gevent.pool
+import simple_websocket
+
+from run import percentile, peak_rss_kb, wait_for_server, git_commit
+
+
+def rss_kb(pid):
+    #current resident set size, Linux only
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def get_json(host, port, path):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+class SimClient:
+    #one simulated browser tab, answers pings and counts what it receives
+    def __init__(self, url, index, room, user_id):
+        self.index = index
+        self.room = room
+        self.user_id = user_id
+        self.ws = simple_websocket.Client.connect(url)
+        self.packets = 0
+        self.items = 0
+        self.latencies = []
+        self.closed = False
+        self._open()
+
+    def _open(self):
+        #connect to the default namespace without waiting for the Engine.IO open packet ("0{...}"),
+        #the client sometimes drops it when it arrives in the same segment as the handshake response
+        self.ws.send("40")
+        while True:
+            packet = self.ws.receive(timeout=10)
+            if packet is None:
+                raise RuntimeError("no namespace connect reply")
+            if packet.startswith("40"):
+                break
+        self.emit("join", {"room": self.room, "username": f"sim{self.index}", "user_id": self.user_id})
+
+    def emit(self, event, data):
+        self.ws.send("42" + json.dumps([event, data]))
+
+    def read_loop(self):
+        while not self.closed:
+            try:
+                packet = self.ws.receive(timeout=1)
+            except Exception:
+                return
+            if packet is None:
+                continue
+            if packet == "2":
+                self.ws.send("3")
+                continue
+            if not packet.startswith("42"):
+                continue
+            self.packets += 1
+            event, *args = json.loads(packet[2:])
+            if event == "messages":
+                now = time.time() * 1000
+                for item in args[0]:
+                    self.items += 1
+                    self.latencies.append(now - item["sent_at"])
+
+    def close(self):
+        self.closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+def start_server(port, window_ms, args):
+    env = {
+        **os.environ,
+        "FANOUT_WINDOW_MS": str(window_ms),
+        "RATE_LIMIT_MESSAGE": "1000000/second",
+        "SLOW_REQUEST_MS": os.getenv("SLOW_REQUEST_MS", "0"),
+    }
+    return subprocess.Popen([sys.executable, os.path.join(HERE, "server.py"), "--host", "127.0.0.1",
+                             "--port", str(port), "--async-mode", "gevent"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_window(window_ms, args):
+    host, port = "127.0.0.1", args.port
+    server = start_server(port, window_ms, args)
+    try:
+        wait_for_server(host, port)
+        url = f"ws://{host}:{port}/socket.io/?EIO=4&transport=websocket"
+        #let the app finish its first request and start its workers before measuring
+        get_json(host, port, "/chat/realtime")
+        gevent.sleep(1)
+        rss_before = rss_kb(server.pid)
+
+        rooms = max(1, args.sockets // args.room_size)
+        pool = gevent.pool.Pool(args.connect_concurrency)
+        start = time.monotonic()
+        clients = pool.map(lambda i: SimClient(url, i, f"conversation_{i % rooms + 1}", i + 1), range(args.sockets))
+        connect_seconds = time.monotonic() - start
+        readers = [gevent.spawn(client.read_loop) for client in clients]
+        gevent.sleep(1)
+        rss_connected = rss_kb(server.pid)
+        before = get_json(host, port, "/chat/realtime")["fanout"]
+
+        #a few members of every room talk, the rest only listen
+        members = {}
+        for client in clients:
+            members.setdefault(client.room, []).append(client)
+        senders = [(client, room_members) for room_members in members.values() for client in room_members[:args.senders]]
+        deadline = time.monotonic() + args.duration
+        sent = [0]
+
+        def send_loop(client, room_members):
+            rng = random.Random(client.index)
+            while time.monotonic() < deadline:
+                receiver = rng.choice(room_members)
+                client.emit("message", {"room": client.room, "message": "bench", "sender_id": client.user_id,
+                                        "receiver_id": receiver.user_id})
+                sent[0] += 1
+                gevent.sleep(args.message_interval * rng.uniform(0.5, 1.5))
+
+        start = time.monotonic()
+        gevent.joinall([gevent.spawn(send_loop, client, room_members) for client, room_members in senders])
+        elapsed = time.monotonic() - start
+        #let the last batches arrive
+        gevent.sleep(1)
+        after = get_json(host, port, "/chat/realtime")["fanout"]
+
+        for client in clients:
+            client.close()
+        gevent.joinall(readers, timeout=5)
+
+        latencies = sorted(latency for client in clients for latency in client.latencies)
+        packets = sum(client.packets for client in clients)
+        items = sum(client.items for client in clients)
+        emits = after["emits"] - before["emits"]
+        published = after["published"] - before["published"]
+        return {
+            "window_ms": window_ms,
+            "sockets": len(clients),
+            "rooms": rooms,
+            "connect_seconds": round(connect_seconds, 2),
+            "server_rss_kb": {"idle": rss_before, "connected": rss_connected, "peak": peak_rss_kb(server.pid)},
+            "rss_per_socket_kb": round((rss_connected - rss_before) / len(clients), 2) if rss_before and rss_connected else None,
+            "messages_sent": sent[0],
+            "messages_per_sec": round(sent[0] / elapsed, 1),
+            "server_published": published,
+            "server_emits": emits,
+            "server_emits_per_sec": round(emits / elapsed, 1),
+            "messages_per_emit": round(published / emits, 2) if emits else None,
+            "packets_received": packets,
+            "deliveries": items,
+            "deliveries_per_sec": round(items / elapsed, 1),
+            "latency_p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+            "latency_p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        }
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO presence/fan-out load test")
+    parser.add_argument("--port", type=int, default=7200)
+    parser.add_argument("--sockets", type=int, default=2000)
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="sockets connecting at once")
+    parser.add_argument("--senders", type=int, default=2, help="sending members per room")
+    parser.add_argument("--message-interval", type=float, default=0.2, help="seconds between a sender's messages")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--windows", default="0,5", help="FANOUT_WINDOW_MS values to run, comma separated")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "runs": [],
+    }
+    for window in args.windows.split(","):
+        print(f"running window {window} ms", file=sys.stderr)
+        report["runs"].append(run_window(float(window), args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
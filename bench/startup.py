@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+#cold start cost of a worker: interpreter + `import app`, create_app(), and the first and second request
+#every run is a fresh process with no Firebase credentials, MySQL or SMTP, so this also checks that the
+#app boots without them. Requests go through the Flask test client, no server is started.
+#
+#  python bench/startup.py --runs 10 --path /limits/stats --output startup.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.abspath(os.path.join(HERE, "..", "src"))
+
+#modules that should only be imported once something needs them
+LAZY_MODULES = ["firebase_admin", "google.auth", "mysql.connector", "smtplib", "email.mime.multipart", "cryptography.x509"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+import app
+imported = time.perf_counter()
+loaded = [m for m in {lazy!r} if m in sys.modules]
+fresh = app.create_app()
+created = time.perf_counter()
+client = app.app.test_client()
+timings = []
+for _ in range(2):
+    t = time.perf_counter()
+    response = client.get({path!r})
+    status = response.status_code
+    response.close()
+    timings.append(time.perf_counter() - t)
+print(json.dumps({{
+    "import_s": imported - start,
+    "create_app_s": created - imported,
+    "first_request_s": timings[0],
+    "second_request_s": timings[1],
+    "status": status,
+    "loaded": loaded,
+}}))
+"""
+
+
+def run_once(path, env):
+    probe = PROBE.format(src=SRC, path=path, lazy=LAZY_MODULES)
+    start = time.perf_counter()
+    #a scratch working directory, nothing should depend on being started from src/
+    output = subprocess.run([sys.executable, "-c", probe], env=env, cwd=HERE, capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - start
+    if output.returncode != 0:
+        sys.exit(f"probe failed:\n{output.stderr[-2000:]}")
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_s"] = wall
+    return result
+
+
+def summarize(values):
+    ms = lambda v: round(v * 1000, 2)
+    return {"min_ms": ms(min(values)), "median_ms": ms(statistics.median(values)), "max_ms": ms(max(values))}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import, app factory and first request latency")
+    parser.add_argument("--runs", type=int, default=10, help="fresh processes to start")
+    parser.add_argument("--path", default="/limits/stats", help="GET path for the first/second request")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    #point everything external at nothing, the probe must not need it
+    env.setdefault("FIREBASE_CREDENTIALS", "/nonexistent/firebase.json")
+    env.setdefault("DB_HOST", "127.0.0.1")
+    env.setdefault("DB_PORT", "1")
+    env.setdefault("SMTP_HOST", "127.0.0.1")
+    env.setdefault("SMTP_PORT", "1")
+
+    #one warm-up so .pyc files exist
+    run_once(args.path, env)
+    runs = [run_once(args.path, env) for _ in range(args.runs)]
+
+    report = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "path": args.path,
+        "runs": args.runs,
+        "status": runs[-1]["status"],
+        #should stay empty, these are imported by the request or background thread that needs them
+        "lazy_modules_loaded_by_import": runs[-1]["loaded"],
+    }
+    for key in ["process_s", "import_s", "create_app_s", "first_request_s", "second_request_s"]:
+        report[key[:-2]] = summarize([run[key] for run in runs])
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
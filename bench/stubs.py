@@ -0,0 +1,82 @@
+import os
+import uuid
+import threading
+
+#local stand-ins for Firebase and SMTP so the app can run without credentials or network
+
+_users = {}
+_lock = threading.Lock()
+
+
+class _User:
+    def __init__(self, uid, email, display_name):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+
+class _Page:
+    def __init__(self, users, start, page_size):
+        self.users = users[start:start + page_size]
+        self._next = start + page_size if start + page_size < len(users) else None
+        self._all = users
+        self._page_size = page_size
+        self.next_page_token = str(self._next) if self._next is not None else ""
+
+    def get_next_page(self):
+        return _Page(self._all, self._next, self._page_size) if self._next is not None else None
+
+
+def install_firebase():
+    import firebase_admin
+    from firebase_admin import auth, credentials
+
+    credentials.Certificate = lambda path: None
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+
+    def create_user(email=None, password=None, display_name=None, **kwargs):
+        with _lock:
+            if email in _users:
+                raise auth.EmailAlreadyExistsError("EMAIL_EXISTS", None, None)
+            user = _users[email] = _User(uuid.uuid4().hex[:28], email, display_name)
+        return user
+
+    def get_user_by_email(email, **kwargs):
+        with _lock:
+            if email not in _users:
+                raise auth.UserNotFoundError(f"No user record found for {email}")
+            return _users[email]
+
+    def list_users(page_token=None, max_results=1000, **kwargs):
+        with _lock:
+            users = list(_users.values())
+        return _Page(users, int(page_token or 0), max_results)
+
+    auth.create_user = create_user
+    auth.get_user_by_email = get_user_by_email
+    auth.list_users = list_users
+    auth.generate_email_verification_link = lambda email, **kwargs: f"https://bench.local/verify?email={email}"
+
+
+def start_smtp(host="127.0.0.1", port=8025):
+    #aiosmtpd sink that accepts and drops every message, returns None when aiosmtpd is not installed
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        return None
+
+    class Sink:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            Sink.received += 1
+            return "250 OK"
+
+    controller = Controller(Sink(), hostname=host, port=port)
+    controller.start()
+    os.environ["SMTP_HOST"] = host
+    os.environ["SMTP_PORT"] = str(port)
+    os.environ["SMTP_STARTTLS"] = "false"
+    os.environ.setdefault("SENDER_EMAIL", "bench@bench.local")
+    os.environ["SENDER_PASSWORD"] = ""
+    return controller
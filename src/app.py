@@ -1,589 +1,122 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO, join_room, leave_room, send
-import mysql.connector
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
-#firebase
-import firebase_admin
-from firebase_admin import auth 
-from firebase_admin import credentials
-#email provider for sending email
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from datetime import datetime
-#import socketio
 
 load_dotenv()
 
-#retrieve email and password from environment variables
-SENDER_EMAIL = os.getenv('SENDER_EMAIL') 
-SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
+#local modules read their settings from the environment, so import them after load_dotenv()
+#nothing here touches Firebase, MySQL or SMTP, they are set up on first use (firebase_app.py, db.py, mailer.py)
+import metrics
+import encoding
+import replicas
+import ratelimit
+from db import pool_stats, PoolExhaustedError
+from replicas import replica_set
+from pagination import PaginationError
+from cache import catalog_cache
+from mailer import outbox_stats
+from chat_writer import message_writer
+from history import conversation_history
+from archive import BulkRequestError
+from search import book_index
+from ratelimit import limiter_stats
+from review_import import ReviewImportError
+from profiles import ProfileLookupError, profile_stats
+from background import start_background
+#routes, one blueprint per area
+import routes_ops
+import routes_users
+import routes_books
+import routes_reviews
+import routes_chat
+from routes_chat import socketio, fanout
+from presence import presence
+from unread import unread_counters
 
 import logging
 
 # Set up logging (adjust level as necessary)
 logging.basicConfig(level=logging.INFO)
 
-
-app = Flask(__name__)
-CORS(app)
-socketio = SocketIO(app)
-
-#initialize Firebase Admin SDK
-cred = credentials.Certificate("config/hybridtechnologies-miniproject-firebase-adminsdk-l99aa-210da4ec8d.json")
-firebase_admin.initialize_app(cred)
-
-@app.get("/") # Like flask, declares get method and url
-def root(): # dBecause we use ASGI, async is added here. If the 3rd party does not support it, then remove async
-    host=os.getenv("DB_HOST", "localhost"),  # You can change 'localhost' to the service name 'db' if you're using Docker for MySQL.
-    user=os.getenv("DB_USER", "user"),
-    password=os.getenv("DB_PASSWORD", "userpassword"),
-    database=os.getenv("DB_NAME", "bookreview_DB")
-    
-    print(host, user, password)
-    return {"host": host, "user": user, "password": password, "database": database}
-
-def get_db_connection():
-    conn = mysql.connector.connect(
-    #can change 'localhost' to the service name 'db' if using Docker for MySQL.
-        host=os.getenv("DB_HOST", "localhost"),  
-        user=os.getenv("DB_USER", "user"),
-        password=os.getenv("DB_PASSWORD", "userpassword"),
-        database=os.getenv("DB_NAME", "bookreview_DB")
+BLUEPRINTS = [routes_ops.bp, routes_users.bp, routes_books.bp, routes_reviews.bp, routes_chat.bp]
+
+
+def create_app():
+    app = Flask(__name__)
+    CORS(app)
+    #per route latency histograms and the slow request log
+    metrics.init_app(app)
+    #gzip/brotli for large responses, see encoding.py
+    encoding.init_app(app)
+    #global in-flight cap, stats endpoints stay reachable while it sheds load
+    ratelimit.init_app(app, exempt=("/metrics", "/db/pool", "/limits/stats"))
+    #clients that just wrote read from the primary for a few seconds, see replicas.py
+    replicas.init_app(app)
+    #async mode and message queue are set by serve.py, the default picks threading for the dev server
+    #SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) shares rooms between worker processes
+    socketio.init_app(
+        app,
+        async_mode=os.getenv("SOCKETIO_ASYNC_MODE") or None,
+        message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None,
     )
 
-    return conn
-
-#route to display users
-@app.route('/users', methods=['GET'])
-def get_users():
-    conn = get_db_connection()
-    #obj used to interact with db: cursor **
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    # format result into a list of dictionaries
-    result = [
-        {"id": user[0], 
-        "username": user[1], 
-        "password": user[2], 
-        "created_at": user[3].strftime('%Y-%m-%d %H:%M:%S'), 
-        "profilePic": user[4]}
-        for user in users
-    ]
-
-    # return {}
-    return jsonify(result)
-
-@app.route('/users/<int:id>/profilePic', methods=['PUT'])
-def update_profilePic(id):
-    data = request.get_json()  # Get the JSON payload from the request
-    profilePic = data.get('profilePic')  # Extract profilePic from the payload
-
-    if not profilePic:
-        return jsonify({"error": "No profilePicture link provided"}), 400
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute(
-        "UPDATE users SET profilePic = %s WHERE id = %s", (profilePic, id)
-        )
-
-        conn.commit()
-
-        if cursor.rowcount == 0:
-                return jsonify({"error": "User not found"}), 404
-
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-
-    finally:
-        # Close the cursor and the connection
-        cursor.close()
-        conn.close()
-
-    return jsonify({"message": "Profile picture updated successfully!"}), 200
-
-
-#route to display books
-@app.route('/books', methods=['GET'])
-def get_books():
-    conn = get_db_connection()
-    #obj used to interact with db: cursor **
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM bookreview_DB.books")
-    books = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    #format result into a list of dictionaries
-    result = [
-        {"objectID": book[0],
-        "image": book[1], 
-        "title": book[2], 
-        "url": book[3], 
-        "author": book[4],
-        "num_comments": book[5],
-        "points": book[6],
-        "genre": book[7],
-        "ranking": book[8]}
-        for book in books
-    ]
-
-    #return {} eeee
-    return jsonify(result)
-
-
-#API for registering a new user
-@app.route('/register', methods=['POST'])
-def register():
-    #get username, password, and email from the request
-    data = request.json
-    logging.info(f"Incoming registration data: {data}")
-    
-    username = data.get('username')
-    password = data.get('password')
-    email = data.get('email')
-
-    logging.info(f"Registering user - Username: {username}, Email: {email}, Password Length: {len(password) if password else 'N/A'}")
-
-    if not username or not password or not email:
-        return jsonify({"error": "Username, password, and email are required"}), 400
-
-    #firebase email-password authentication 
-    try:
-        #attempt to create the user in Firebase
-        try:
-            user = auth.create_user(email=email, password=password, display_name=username)
-            uid = user.uid
-            logging.info(f"User created in Firebase with UID: {uid}")
-        except auth.EmailAlreadyExistsError:
-            #if user exists, fetch the user and send verification email
-            existing_user = auth.get_user_by_email(email)
-            uid = existing_user.uid
-            logging.info(f"User with email {email} already exists in Firebase. Sending verification email.")
-            try:
-                send_verification_email(email)
-                logging.info(f"attempting to send verification to {email}")
-                #return jsonify({"message": "Verification email resent. Please check your inbox."}), 200
-            except Exception as e:
-                logging.error("Error sending verification email:", exc_info=True)
-                return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
-        except Exception as e:
-            logging.error("Error creating user in Firebase:", exc_info=True)
-            return jsonify({"error": "Failed to create user in Firebase", "details": str(e)}), 501
-
-    except Exception as e:
-        logging.error("Firebase authentication process failed:", exc_info=True)
-        return jsonify({"error": "Firebase authentication process failed", "details": str(e)}), 500
-
-    #connect to the database and store the user
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        #insert new user into bookreview_DB
-        cursor.execute(
-            "INSERT INTO bookreview_DB.users (username, password, email, uid) VALUES (%s, %s, %s, %s)",
-            (username, password, email, uid)
-        )
-        conn.commit()
-        logging.info(f"User {username} stored in MySQL database with UID: {uid}")
-        return jsonify({"message": "User registered successfully"}), 201
-    except Exception as e:
-        conn.rollback()
-        logging.error("Error storing user in MySQL database:", exc_info=True)
-        return jsonify({"error": "Failed to store user in MySQL database", "details": str(e)}), 501
-    finally:
-        cursor.close()
-        conn.close()
-
-
-def send_verification_email(email):
-    #generate link for verification
-    try:
-        verification_link = auth.generate_email_verification_link(email)
-        logging.info(f"le email is {email}")
-        logging.info(f"Sender email is {SENDER_EMAIL}")
-    except Exception as e:
-        print(f"Error generating verification link: {e}")
-        return
-
-    #email content
-    #subject = "Verify Your Email"
-    #body = f"Please verify your email by clicking this link: {verification_link}"
-    subject = f"{username} VERIFY UR EMAIL PLEASE"
-    body = f"CLICK THE LINK NOW: {verification_link}"
-
-    #MIME email message
-    msg = MIMEMultipart()
-    msg['From'] = SENDER_EMAIL
-    msg['To'] = email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-    
-    try:
-        # Send email using smtplib (this example uses Gmail's SMTP server)
-        logging.info("Starting SMTP server connection...")
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            # Start TLS and log the progress
-            logging.info("Connected to SMTP server.")
-            server.ehlo()
-            logging.info("EHLO sent.")
-            server.starttls()
-            logging.info("TLS session started.")
-            server.ehlo()
-            logging.info("EHLO sent again after TLS.")
-            logging.info(f"Attempting to log in with SENDER_EMAIL: {SENDER_EMAIL}")
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            logging.info("Logged into SMTP server.")
-            server.sendmail(SENDER_EMAIL, email, msg.as_string())
-            logging.info("Email sent.")
-            # can add insert values logic here for new users
-
-    except smtplib.SMTPException as e:
-        print(f"SMTP error sending email: {e}")
-    except Exception as e:
-        print(f"General error sending email: {e}")
-
-# @app.route('/register', methods=['POST'])
-# def register():
-#     # Get username, password, and email from the request
-#     data = request.json
-#     logging.info(f"Incoming registration data: {data}")
-
-#     username = data.get('username')
-#     password = data.get('password')
-#     email = data.get('email')
-
-#     logging.info(f"Registering user - Username: {username}, Email: {email}, Password Length: {len(password) if password else 'N/A'}")
-
-#     if not username or not password or not email:
-#         return jsonify({"error": "Username, password, and email are required"}), 400
-
-#     # Firebase email-password authentication
-#     try:
-#         # Attempt to create the user in Firebase
-#         try:
-#             user = auth.create_user(email=email, password=password, display_name=username)
-#             uid = user.uid
-#             logging.info(f"User created in Firebase with UID: {uid}")
-
-#             # Generate and send verification email
-#             try:
-#                 verification_link = auth.generate_email_verification_link(email)
-#                 logging.info(f"Verification email sent to {email}")
-#                 return jsonify({"message": "User registered successfully. Verification email sent."}), 201
-#             except Exception as e:
-#                 logging.error("Error sending verification email:", exc_info=True)
-#                 return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
-
-#         except auth.EmailAlreadyExistsError:
-#             # If user exists, fetch the user and send verification email again
-#             existing_user = auth.get_user_by_email(email)
-#             uid = existing_user.uid
-#             logging.info(f"User with email {email} already exists in Firebase. Sending verification email.")
-#             try:
-#                 verification_link = auth.generate_email_verification_link(email)
-#                 logging.info(f"Verification email resent to {email}, {verification_link}")
-#                 return jsonify({"message": "Verification email resent. Please check your inbox."}), 200
-#             except Exception as e:
-#                 logging.error("Error sending verification email:", exc_info=True)
-#                 return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
-
-#     except Exception as e:
-#         logging.error("Firebase authentication process failed:", exc_info=True)
-#         return jsonify({"error": "Firebase authentication process failed", "details": str(e)}), 500
-
-#     # Connect to the database and store the user
-#     conn = get_db_connection()
-#     cursor = conn.cursor()
-
-#     try:
-#         # Insert new user into bookReview_DB
-#         cursor.execute(
-#             "INSERT INTO bookReview_DB.users (username, password, email, uid) VALUES (%s, %s, %s, %s)",
-#             (username, password, email, uid)
-#         )
-#         conn.commit()
-#         logging.info(f"User {username} stored in MySQL database with UID: {uid}")
-#         return jsonify({"message": "User registered successfully"}), 201
-#     except Exception as e:
-#         conn.rollback()
-#         logging.error("Error storing user in MySQL database:", exc_info=True)
-#         return jsonify({"error": "Failed to store user in MySQL database", "details": str(e)}), 501
-#     finally:
-#         cursor.close()
-#         conn.close()
-
-# Function to log all existing Firebase users
-def log_all_firebase_users():
-    # Initialize an empty list to hold user info
-    users_list = []
-    page = auth.list_users()
-
-    # Iterate through each page of users
-    while page:
-        for user in page.users:
-            users_list.append({
-                "uid": user.uid,
-                "email": user.email,
-                "display_name": user.display_name
-            })
-        page = page.get_next_page()
-
-    logging.info(f"Existing Firebase users: {users_list}")
-
-#API for handling bookmarks, adding
-@app.route('/books/archive/<int:id>', methods=['POST'])
-def archive_book(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        #retrieve book data from books table based on the objectID (id)
-        cursor.execute("SELECT objectID, title, image, url, author, genre, num_comments, points, ranking FROM bookreview_DB.books WHERE objectID = %s", (id,))
-        book = cursor.fetchone()
-
-        if book:
-            #insert the book into the archived_books table
-            cursor.execute("""
-                INSERT INTO bookreview_DB.archived_books (objectID, title, image, url, author, genre, num_comments, points, ranking)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, book)
-            conn.commit()
-
-
-        return jsonify({"message": "Book archived successfully"}), 200
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
-
-#API for handling bookmarks, removing
-@app.route('/books/archive/<int:id>', methods=['DELETE'])
-def unarchive_book(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        #retrieve book data from archived_books table based on the objectID (id)
-        cursor.execute("SELECT objectID, title, image, url, author, genre, num_comments, points, ranking FROM bookreview_DB.archived_books WHERE objectID = %s", (id,))
-        book = cursor.fetchone()
-
-        if book:
-            #delete the book from the archived_books table based on objectID
-            cursor.execute("DELETE FROM bookreview_DB.archived_books WHERE objectID = %s", (id,))
-            conn.commit()
-
-
-        return jsonify({"message": "Book unarchived successfully"}), 200
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
-
-#route to display archived books
-@app.route('/books/archive', methods=['GET'])
-def get_archived_books():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    #selecting from the archived books table
-    cursor.execute("SELECT * FROM bookreview_DB.archived_books")
-
-    archived_books = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    result = [
-        {"objectID": book[0],
-        "image": book[1], 
-        "title": book[2], 
-        "url": book[3], 
-        "author": book[4],
-        "num_comments": book[5],
-        "points": book[6],
-        "genre": book[7],
-        "ranking": book[8]}
-        for book in archived_books
-    ]
-
-    return jsonify(result)
-
-# @app.route('/reviews', methods=['DELETE'])
-# def review():
-#     #add in deleting review and removing it from DB logic
-
-# @app.route('/users', methods=['PUT'])
-# def profilePic():
-#     #add in inserting links for profile pictures
-
-@app.route('/message', methods=['POST'])
-def message_user():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-
-#////////////////////////////////////////////////////////////////////////////////////////
-#route to display reviews
-@app.route('/reviews', methods=['GET'])
-def get_reviews():
-    conn = get_db_connection()
-    #obj used to interact with db: cursor **
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM bookreview_DB.reviews")
-    reviews = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    # format result into a list of dictionaries
-    result = [
-        {"id": review[0], "review": review[1], "stars": review[2], "created_at": review[3].strftime('%Y-%m-%d %H:%M:%S'), "reviewID": review[4], "bookID": review[5]}
-        for review in reviews
-    ]
-
-
-    # return {}
-    return jsonify(result)
-
-#API for adding a review
-@app.route('/comment', methods=['POST'])
-def comment():
-    data = request.json
-    id = data.get('id')
-    review = data.get('review')
-    stars = data.get('stars')
-    bookID = data.get('bookID')
-
-    #connect to the database **
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-
-        cursor.execute(
-            #%s is placeholder for string **
-            "INSERT INTO bookreview_DB.reviews (id, review, stars, bookID) VALUES (%s, %s, %s, %s)",
-            (id, review, stars, bookID)
-        )
-        conn.commit()
-
-        return jsonify({"message": "User commented successfully"}), 201
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
-
-@app.route('/remove/<int:id>', methods=['DELETE'])
-def delete_review(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        #delete the book from the archived_books table based on objectID
-        cursor.execute("DELETE FROM bookreview_DB.reviews WHERE reviewID = %s", (id,))
-        conn.commit()
-
-
-        return jsonify({"message": "Review deleted successfully"}), 200
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
-
-@app.route('/chat', methods=['POST'])
-def create_chat():
-    data = request.json
-    user_id = data.get("user_id")
-    target_user_id = data.get("target_user_id")
-
-    #connect to db
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    #check if a conversation already exists
-    cursor.execute("""
-        SELECT conversation_id FROM conversations
-        WHERE (user1_id = %s AND user2_id = %s) OR (user1_id = %s AND user2_id = %s)
-    """, (user_id, target_user_id, target_user_id, user_id))
-    result = cursor.fetchone()
-
-    if result:
-        room_name = f"conversation_{result['conversation_id']}"
-    else:
-        #create new conversation if it doesn't exist
-        cursor.execute("""
-            INSERT INTO conversations (user1_id, user2_id)
-            VALUES (%s, %s)
-        """, (user_id, target_user_id))
-        conn.commit()
-        conversation_id = cursor.lastrowid
-        room_name = f"conversation_{conversation_id}"
-
-    cursor.close()
-    conn.close()
-
-    #return room name to frontend
-    return jsonify({"room": room_name})
-
-@socketio.on('join')
-def handle_join(data):
-    join_room(data['room'])
-    send(f"{data['username']} has joined the room.", room=data['room'])
-
-@socketio.on('message')
-def handle_message(data):
-    room = data['room']
-    message_text = data['message']
-    sender_id = data['sender_id']
-    receiver_id = data['receiver_id']
-    #extract conversation_id from room name
-    conversation_id = int(data['room'].split('_')[-1])  
-
-    # Store the message in the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO messages (sender_id, receiver_id, message_text, conversation_id)
-            VALUES (%s, %s, %s, %s)
-        """, (sender_id, receiver_id, message_text, conversation_id))
-        conn.commit()
-    except Exception as e:
-        print(f"Database error: {e}")
-    finally:
-        cursor.close()
-        conn.close()
-
-    # Broadcast message to the room
-    send(message_text, room=room)
-
-@socketio.on('leave')
-def handle_leave(data):
-    leave_room(data['room'])
-    send(f"{data['username']} has left the room.", room=data['room'])
-
-#might have to change to soketio
+    #behind serve.py's load balancer every request comes from the proxy, TRUSTED_PROXIES=<number of proxies in
+    #front of the app> takes the client address (rate limits, read-your-writes) from X-Forwarded-For instead.
+    #leave it at 0 when clients connect directly, they could otherwise pick any address they like
+    trusted_proxies = int(os.getenv("TRUSTED_PROXIES", "0"))
+    if trusted_proxies:
+        #outermost, so the Socket.IO and admission middlewares see the client address too
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies, x_proto=trusted_proxies)
+
+    #mail worker, chat writer, replica monitor and search indexer start with the first request
+    @app.before_request
+    def _start_background():
+        start_background()
+
+    #connections come from the shared pool in db.py, conn.close() returns them to the pool
+    @app.errorhandler(PoolExhaustedError)
+    def handle_pool_exhausted(e):
+        return jsonify({"error": str(e)}), 503
+
+    @app.errorhandler(PaginationError)
+    def handle_pagination_error(e):
+        return jsonify({"error": str(e)}), 400
+
+    @app.errorhandler(BulkRequestError)
+    def handle_bulk_request_error(e):
+        return jsonify({"error": str(e)}), 400
+
+    @app.errorhandler(ReviewImportError)
+    def handle_review_import_error(e):
+        return jsonify({"error": str(e)}), 400
+
+    @app.errorhandler(ProfileLookupError)
+    def handle_profile_lookup_error(e):
+        return jsonify({"error": str(e)}), 400
+
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+
+    metrics.register_collector("db_pool", pool_stats)
+    metrics.register_collector("db_replicas", replica_set.stats)
+    metrics.register_collector("catalog_cache", catalog_cache.stats)
+    metrics.register_collector("chat_writer", message_writer.stats)
+    metrics.register_collector("conversation_history", conversation_history.stats)
+    metrics.register_collector("search_index", book_index.stats)
+    metrics.register_collector("email_outbox", outbox_stats)
+    metrics.register_collector("limiter", limiter_stats)
+    metrics.register_collector("user_profiles", profile_stats)
+    metrics.register_collector("chat_presence", presence.stats)
+    metrics.register_collector("chat_fanout", fanout.stats)
+    metrics.register_collector("chat_unread", unread_counters.stats)
+    return app
+
+
+#serve.py, the Dockerfile and the benchmarks use app.app and app.socketio
+app = create_app()
+
+#development server, use serve.py for production (gevent workers with WebSocket support)
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=7000)
-
+    socketio.run(app, host='0.0.0.0', port=7000, allow_unsafe_werkzeug=True)
@@ -0,0 +1,104 @@
+import os
+
+#set-based bookmark (archive) operations
+#every statement works on a whole list of objectIDs, and is a no-op for ids already in the wanted state
+
+ARCHIVE_BULK_MAX = int(os.getenv("ARCHIVE_BULK_MAX", "500"))
+
+ARCHIVE_COLUMNS = "objectID, title, image, url, author, genre, num_comments, points, ranking"
+
+
+class BulkRequestError(ValueError):
+    pass
+
+
+def parse_ids(data):
+    ids = data.get("ids") if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise BulkRequestError("ids must be a non-empty list")
+    if len(ids) > ARCHIVE_BULK_MAX:
+        raise BulkRequestError(f"At most {ARCHIVE_BULK_MAX} ids per request")
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        raise BulkRequestError("ids must be integers")
+    #keep the caller's order, drop repeats
+    return list(dict.fromkeys(ids))
+
+
+def _placeholders(ids):
+    return ", ".join(["%s"] * len(ids))
+
+
+def archive_ids(cursor, ids):
+    #copy the books straight across, the unique key on archived_books.objectID makes repeats a no-op
+    cursor.execute(f"""
+        INSERT INTO bookreview_DB.archived_books ({ARCHIVE_COLUMNS})
+        SELECT {ARCHIVE_COLUMNS} FROM bookreview_DB.books WHERE objectID IN ({_placeholders(ids)})
+        ON DUPLICATE KEY UPDATE objectID = archived_books.objectID
+    """, ids)
+    return cursor.rowcount
+
+
+def unarchive_ids(cursor, ids):
+    cursor.execute(
+        f"DELETE FROM bookreview_DB.archived_books WHERE objectID IN ({_placeholders(ids)})", ids
+    )
+    return cursor.rowcount
+
+
+def bulk_archive(conn, ids):
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        #one read tells us which ids exist and which are already archived, for the per-id outcome
+        cursor.execute(f"""
+            SELECT b.objectID, a.objectID IS NOT NULL
+            FROM bookreview_DB.books b
+            LEFT JOIN bookreview_DB.archived_books a ON a.objectID = b.objectID
+            WHERE b.objectID IN ({_placeholders(ids)})
+            FOR UPDATE
+        """, ids)
+        state = {object_id: bool(archived) for object_id, archived in cursor.fetchall()}
+
+        if any(not archived for archived in state.values()):
+            archive_ids(cursor, ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    results = {}
+    for i in ids:
+        if i not in state:
+            results[i] = "not_found"
+        elif state[i]:
+            results[i] = "already_archived"
+        else:
+            results[i] = "archived"
+    return results
+
+
+def bulk_unarchive(conn, ids):
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(f"""
+            SELECT objectID FROM bookreview_DB.archived_books
+            WHERE objectID IN ({_placeholders(ids)})
+            FOR UPDATE
+        """, ids)
+        archived = {row[0] for row in cursor.fetchall()}
+
+        if archived:
+            unarchive_ids(cursor, list(archived))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {i: "unarchived" if i in archived else "not_archived" for i in ids}
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+
+from flask import request, jsonify, g
+
+from cache import TTLCache
+from metrics import timed_call
+
+#local Firebase ID token verification
+#Google's signing certificates are fetched once and kept for as long as their Cache-Control allows,
+#and tokens that already verified are remembered (by hash) until they expire, so a request costs no network call
+
+FIREBASE_CERTS_URL = os.getenv(
+    "FIREBASE_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
+#when false, requests without a token still go through, a token that is sent must be valid
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "false").lower() in ("1", "true", "yes")
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+#allowed clock skew in seconds
+AUTH_CLOCK_SKEW = int(os.getenv("AUTH_CLOCK_SKEW", "60"))
+#used when Google sends no max-age
+_DEFAULT_CERT_TTL = 3600
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class CertificateFetchError(Exception):
+    #Google's certificates could not be loaded and none are cached, tokens can't be checked right now
+    pass
+
+
+class CertificateCache:
+    def __init__(self, url=FIREBASE_CERTS_URL, fetch=None):
+        self.url = url
+        self._fetch = fetch or self._http_fetch
+        self._keys = {}
+        self._expires_at = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _http_fetch(self):
+        #imported here, requests is only needed for the first token and for refreshes
+        import requests
+        with timed_call("firebase", "fetch_certificates"):
+            response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else _DEFAULT_CERT_TTL
+        return response.json(), max_age
+
+    def _refresh(self):
+        from cryptography.x509 import load_pem_x509_certificate
+        certs, max_age = self._fetch()
+        self._keys = {
+            kid: load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certs.items()
+        }
+        self._expires_at = time.monotonic() + max_age
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+        logging.info(f"Loaded {len(self._keys)} Firebase signing certificates, valid for {max_age}s")
+
+    def _stale(self, kid):
+        if time.monotonic() >= self._expires_at:
+            return True
+        #an unknown kid can mean Google rotated keys early, but don't let bad tokens force a fetch every request
+        return kid not in self._keys and time.monotonic() - self._refreshed_at > 60
+
+    def get_key(self, kid):
+        if self._stale(kid):
+            with self._lock:
+                #another thread may have refreshed while we waited
+                if self._stale(kid):
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        if not self._keys:
+                            logging.error("Could not fetch Firebase certificates:", exc_info=True)
+                            raise CertificateFetchError("Could not fetch token signing certificates") from e
+                        #keep using the keys we have and try again in a minute
+                        logging.warning("Could not refresh Firebase certificates, using cached ones", exc_info=True)
+                        self._expires_at = time.monotonic() + 60
+        key = self._keys.get(kid)
+        if key is None:
+            raise InvalidTokenError("Token signed with an unknown key")
+        return key
+
+
+class TokenVerifier:
+    def __init__(self, project_id=None, certificates=None, cache_size=AUTH_TOKEN_CACHE_SIZE):
+        self._project_id = project_id
+        self.certificates = certificates or CertificateCache()
+        self.cache = TTLCache(max_entries=cache_size)
+
+    @property
+    def project_id(self):
+        if self._project_id is None:
+            self._project_id = FIREBASE_PROJECT_ID
+        if self._project_id is None:
+            #fall back to the project of the firebase_admin app, initializing it if needed
+            from firebase_app import get_firebase_app
+            self._project_id = get_firebase_app().project_id
+        return self._project_id
+
+    def verify(self, token):
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+        claims = self.cache.get(token_key)
+        if claims is not None:
+            return claims
+
+        #PyJWT pulls in cryptography, imported with the first token instead of at startup
+        import jwt
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidTokenError(str(e))
+        if header.get("alg") != "RS256":
+            raise InvalidTokenError("Token must be signed with RS256")
+
+        key = self.certificates.get_key(header.get("kid"))
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=f"https://securetoken.google.com/{self.project_id}",
+                leeway=AUTH_CLOCK_SKEW,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidTokenError(str(e))
+
+        if not claims.get("sub"):
+            raise InvalidTokenError("Token has no subject")
+        if claims.get("auth_time", 0) > time.time() + AUTH_CLOCK_SKEW:
+            raise InvalidTokenError("Token auth_time is in the future")
+        claims["uid"] = claims["sub"]
+
+        ttl = claims["exp"] - time.time()
+        if ttl > 0:
+            self.cache.set(token_key, claims, len(token), ttl=ttl)
+        return claims
+
+
+token_verifier = TokenVerifier()
+
+
+def _bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer "):].strip()
+    return None
+
+
+def require_auth(f):
+    #puts the verified claims in g.user, 401 when the token is missing (with AUTH_REQUIRED) or invalid,
+    #503 while the signing certificates can't be fetched
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        g.user = None
+        token = _bearer_token()
+        if token is None:
+            if AUTH_REQUIRED:
+                return jsonify({"error": "Missing bearer token"}), 401
+            return f(*args, **kwargs)
+        try:
+            g.user = token_verifier.verify(token)
+        except InvalidTokenError as e:
+            return jsonify({"error": "Invalid token", "details": str(e)}), 401
+        except CertificateFetchError as e:
+            return jsonify({"error": str(e)}), 503
+        return f(*args, **kwargs)
+    return wrapper
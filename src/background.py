@@ -0,0 +1,48 @@
+import os
+import time
+import logging
+import threading
+
+from mailer import start_worker
+from chat_writer import message_writer
+from unread import unread_counters
+from history import conversation_history
+from replicas import start_monitor
+from search import start_indexer
+
+#background threads of a worker process: email outbox, chat write-behind, unread counters, replica checks,
+#search index
+#started once, by the first HTTP request or Socket.IO connect (see create_app() in app.py), so importing
+#the app or building one for a test opens no DB connections. serve.py starts them as soon as a worker boots.
+
+#MAIL_WORKER_ENABLED=false to run the outbox worker in a separate process
+MAIL_WORKER_ENABLED = os.getenv("MAIL_WORKER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+_started = False
+_lock = threading.Lock()
+
+
+def start_background():
+    global _started
+    if _started:
+        return
+    with _lock:
+        if _started:
+            return
+        #set first so a failing worker does not get the others started twice on the next request
+        _started = True
+        start = time.perf_counter()
+        if MAIL_WORKER_ENABLED:
+            start_worker()
+
+        message_writer.add_listener(conversation_history.on_persisted)
+        message_writer.start()
+        #unread counters are written in batches too
+        unread_counters.start()
+
+        #replica health/lag checks, no-op without DB_REPLICA_HOSTS
+        start_monitor()
+
+        #search index over the books table, loaded in the background
+        start_indexer()
+        logging.info(f"Background workers started in {time.perf_counter() - start:.3f}s")
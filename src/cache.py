@@ -0,0 +1,175 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import request, jsonify, Response
+
+from encoding import negotiate, encode, negotiate_coding, compress
+from replicas import replica_set, DB_REPLICA_MAX_LAG
+
+#in-process TTL + LRU cache for serialized responses and single rows
+#values are kept until they expire, the entry count or byte cap is hit, or a write invalidates them
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+#rough per entry overhead for the key, tuple and dict slot
+_ENTRY_OVERHEAD = 128
+
+#builds read from replicas, which can be up to DB_REPLICA_MAX_LAG (whole) seconds behind,
+#so for that long after an invalidation freshly built bodies are served but not cached
+REPLICA_SETTLE_SECONDS = DB_REPLICA_MAX_LAG + 1 if replica_set.replicas else 0
+
+
+class TTLCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        #key -> (value, size, expires_at), oldest first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, size, ttl=None):
+        size += _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            #would evict everything else, not worth caching
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self._stats["invalidations"] += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            keys = [k for k in self._entries if k.startswith(prefix)]
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_entries"] = self.max_entries
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+catalog_cache = TTLCache()
+
+#prefix -> monotonic time of its last invalidate()
+_invalidated_at = {}
+
+
+def _cacheable(prefix, started):
+    #a body built while an invalidation happened may hold the old rows, and so may replica reads shortly after one
+    at = _invalidated_at.get(prefix)
+    if at is None:
+        return True
+    if at >= started:
+        return False
+    return not (REPLICA_SETTLE_SECONDS and time.monotonic() - at < REPLICA_SETTLE_SECONDS)
+
+
+def request_key(prefix):
+    #same query args in any order share one entry
+    args = sorted(request.args.items(multi=True))
+    return f"{prefix}:{urlencode(args)}"
+
+
+def cached_json(prefix, build, not_found="Not found"):
+    #serve a cached body with a strong ETag, a matching If-None-Match gets a 304
+    #without touching the DB or serializing anything
+    #bodies are cached per media type (shape= is a query arg so it is in the key already),
+    #compressed copies are cached next to them under the body's ETag
+    key = f"{request_key(prefix)}|{negotiate()}"
+    started = time.monotonic()
+    entry = catalog_cache.get(key)
+    if entry is None:
+        result = build()
+        if result is None:
+            #misses are not cached so a later insert shows up straight away
+            return jsonify({"error": not_found}), 404
+        body, mimetype = encode(result)
+        etag = hashlib.sha1(body).hexdigest()
+        entry = (body, mimetype, etag)
+        if _cacheable(prefix, started):
+            catalog_cache.set(key, entry, len(body))
+
+    body, mimetype, etag = entry
+    coding = negotiate_coding(len(body))
+    if coding is not None:
+        body_etag = etag
+        #every representation needs its own ETag
+        etag = f"{etag}-{coding}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if coding is not None:
+            compressed_key = f"{key}|{coding}|{body_etag}"
+            compressed = catalog_cache.get(compressed_key)
+            if compressed is None:
+                compressed = compress(body, coding)
+                if _cacheable(prefix, started):
+                    catalog_cache.set(compressed_key, compressed, len(compressed))
+            body = compressed
+        response = Response(body, mimetype=mimetype)
+        if coding is not None:
+            response.headers["Content-Encoding"] = coding
+    response.set_etag(etag)
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def invalidate(*prefixes):
+    for prefix in prefixes:
+        #before the delete, so a build that already read the old rows does not put them back
+        _invalidated_at[prefix] = time.monotonic()
+        catalog_cache.delete_prefix(prefix + ":")
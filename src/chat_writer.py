@@ -0,0 +1,192 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from db import get_db_connection
+
+#write-behind persistence for chat messages
+#handle_message broadcasts first and hands the row to this buffer, a background thread
+#writes the buffer with one multi-row INSERT when it reaches the batch size or the flush interval passes
+
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", "200"))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.25"))
+CHAT_BUFFER_SIZE = int(os.getenv("CHAT_BUFFER_SIZE", "10000"))
+#how long a sender waits for room in a full buffer before writing its message directly
+CHAT_BUFFER_PUT_TIMEOUT = float(os.getenv("CHAT_BUFFER_PUT_TIMEOUT", "1"))
+CHAT_FLUSH_RETRIES = int(os.getenv("CHAT_FLUSH_RETRIES", "3"))
+
+INSERT_MESSAGES = """
+    INSERT INTO messages (sender_id, receiver_id, message_text, conversation_id)
+    VALUES (%s, %s, %s, %s)
+"""
+
+
+def _insert_rows(rows):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        #mysql.connector rewrites executemany INSERT ... VALUES into one multi-row statement
+        cursor.executemany(INSERT_MESSAGES, rows)
+        conn.commit()
+        #id of the first row, a single multi-row insert gets consecutive auto-increment ids
+        return cursor.lastrowid
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class MessageWriter:
+    def __init__(self, insert=_insert_rows, batch_size=CHAT_BATCH_SIZE, flush_interval=CHAT_FLUSH_INTERVAL,
+                 buffer_size=CHAT_BUFFER_SIZE, put_timeout=CHAT_BUFFER_PUT_TIMEOUT, retries=CHAT_FLUSH_RETRIES):
+        self._insert = insert
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        #items are (row, enqueued_at)
+        self._buffer = queue.Queue(maxsize=buffer_size)
+        #called with (rows, first_id) after every committed batch
+        self._listeners = []
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "persisted": 0,
+            "batches": 0,
+            "batch_size_last": 0,
+            "batch_size_max": 0,
+            "lag_seconds_last": 0.0,
+            "lag_seconds_max": 0.0,
+            "lag_seconds_total": 0.0,
+            "backpressure_waits": 0,
+            "direct_writes": 0,
+            "flush_errors": 0,
+            "dropped": 0,
+        }
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, sender_id, receiver_id, message_text, conversation_id):
+        row = (sender_id, receiver_id, message_text, conversation_id)
+        item = (row, time.monotonic())
+        try:
+            self._buffer.put_nowait(item)
+        except queue.Full:
+            #backpressure, slow the sender down until the writer catches up
+            self._bump("backpressure_waits")
+            try:
+                self._buffer.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                #still full, persist this one synchronously rather than lose it,
+                #it can get its id ahead of buffered rows so listeners must not assume ids arrive in order
+                self._bump("direct_writes")
+                self._persist([item])
+                return
+        self._bump("enqueued")
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _drain(self):
+        items = []
+        while len(items) < self.batch_size:
+            try:
+                items.append(self._buffer.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _persist(self, items):
+        rows = [row for row, _ in items]
+        for attempt in range(self.retries + 1):
+            try:
+                first_id = self._insert(rows)
+                break
+            except Exception:
+                self._bump("flush_errors")
+                logging.error(f"Error persisting {len(rows)} chat messages (attempt {attempt + 1}):", exc_info=True)
+                if attempt == self.retries:
+                    self._bump("dropped", len(rows))
+                    return
+                time.sleep(min(0.1 * (2 ** attempt), 2))
+
+        now = time.monotonic()
+        lag = now - min(enqueued_at for _, enqueued_at in items)
+        with self._lock:
+            self._stats["persisted"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["batch_size_last"] = len(rows)
+            self._stats["batch_size_max"] = max(self._stats["batch_size_max"], len(rows))
+            self._stats["lag_seconds_last"] = lag
+            self._stats["lag_seconds_max"] = max(self._stats["lag_seconds_max"], lag)
+            self._stats["lag_seconds_total"] += lag
+
+        for listener in self._listeners:
+            try:
+                listener(rows, first_id)
+            except Exception:
+                logging.error("Chat writer listener failed:", exc_info=True)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._buffer.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            #give the batch until the flush interval to fill up
+            deadline = time.monotonic() + self.flush_interval
+            items = [first]
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._buffer.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._persist(items)
+        self.flush()
+
+    def flush(self):
+        #write whatever is buffered, used on shutdown
+        while True:
+            items = self._drain()
+            if not items:
+                return
+            self._persist(items)
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["buffered"] = self._buffer.qsize()
+        stats["batch_size_avg"] = stats["persisted"] / stats["batches"] if stats["batches"] else 0
+        stats["lag_seconds_avg"] = stats["lag_seconds_total"] / stats["batches"] if stats["batches"] else 0
+        return stats
+
+
+message_writer = MessageWriter()
+#flush on shutdown so buffered messages are not lost
+atexit.register(message_writer.stop)
@@ -0,0 +1,73 @@
+import os
+
+from db import get_db_connection
+from cache import TTLCache
+
+#conversation lookup for create_chat, and the participants of a conversation for the routes that read it
+#pairs are stored as (min, max) under the uq_conversations_pair key (migrations/004_conversation_pairs.sql)
+#so one upsert finds or creates the row, and a pair -> conversation_id LRU skips the DB entirely
+
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "10000"))
+#pair ids never change once created, the TTL only ages out cold pairs
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "86400"))
+
+conversation_cache = TTLCache(ttl=CONVERSATION_CACHE_TTL, max_entries=CONVERSATION_CACHE_SIZE)
+#conversation_id -> (user1_id, user2_id)
+members_cache = TTLCache(ttl=CONVERSATION_CACHE_TTL, max_entries=CONVERSATION_CACHE_SIZE)
+
+
+def canonical_pair(user_id, target_user_id):
+    user_id, target_user_id = int(user_id), int(target_user_id)
+    return (min(user_id, target_user_id), max(user_id, target_user_id))
+
+
+def get_or_create_conversation(user_id, target_user_id):
+    pair = canonical_pair(user_id, target_user_id)
+    conversation_id = conversation_cache.get(pair)
+    if conversation_id is not None:
+        return conversation_id
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        #atomic under concurrent calls, on a duplicate LAST_INSERT_ID(expr) makes lastrowid the existing id
+        cursor.execute("""
+            INSERT INTO conversations (user1_id, user2_id)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE conversation_id = LAST_INSERT_ID(conversation_id)
+        """, pair)
+        conn.commit()
+        conversation_id = cursor.lastrowid
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    conversation_cache.set(pair, conversation_id, 0)
+    return conversation_id
+
+
+def conversation_members(conversation_id):
+    #(user1_id, user2_id), None when there is no such conversation
+    pair = members_cache.get(conversation_id)
+    if pair is not None:
+        return pair
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT user1_id, user2_id FROM conversations WHERE conversation_id = %s", (conversation_id,)
+        )
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if row is None:
+        return None
+    pair = (row[0], row[1])
+    members_cache.set(conversation_id, pair, 0)
+    return pair
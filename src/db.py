@@ -0,0 +1,263 @@
+import os
+import time
+import threading
+import logging
+import weakref
+from collections import deque
+
+from metrics import wrap_cursor
+
+#process-wide mysql connection pool
+#routes keep calling get_db_connection() and conn.close(), close() just hands the connection back
+#nothing connects (or imports the driver) until the first get_db_connection()
+
+#pool settings, same style as the DB_* env vars
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+#max age in seconds, an older connection is closed and reopened on its next checkout (keep it below MySQL's
+#wait_timeout), 0 disables
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+#seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+#ping connections when they are checked out
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+#pure python driver, its sockets can be monkey patched by gevent/eventlet (serve.py turns this on)
+#when off the driver picks for itself, the C extension if it is installed
+DB_USE_PURE = os.getenv("DB_USE_PURE", "false").lower() in ("1", "true", "yes")
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+def _connect(host=None, port=None):
+    #host/port default to the primary, replicas.py passes its own
+    import mysql.connector
+    #use_pure=False makes mysql-connector 8.0.28 fail when the C extension is missing, so only pass True
+    extra = {"use_pure": True} if DB_USE_PURE else {}
+    return mysql.connector.connect(
+        #can change 'localhost' to the service name 'db' if using Docker for MySQL.
+        host=host or os.getenv("DB_HOST", "localhost"),
+        port=int(port or os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "user"),
+        password=os.getenv("DB_PASSWORD", "userpassword"),
+        database=os.getenv("DB_NAME", "bookreview_DB"),
+        **extra
+    )
+
+
+class PooledConnection:
+    #wraps a raw connection so close() returns it to the pool instead of closing the socket
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._returned = False
+        #a route that never calls close() still gives its slot back once the wrapper is garbage collected
+        self._finalizer = weakref.finalize(self, pool._leaked.append, raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        #statement timings for /metrics
+        return wrap_cursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._returned:
+            return
+        self._returned = True
+        self._finalizer.detach()
+        self._pool._checkin(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, connect=_connect, size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW,
+                 recycle=DB_POOL_RECYCLE, timeout=DB_POOL_TIMEOUT, pre_ping=DB_POOL_PRE_PING):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+
+        #idle connections as (raw, created_at)
+        self._idle = deque()
+        self._open = 0
+        #raw connections whose wrapper was garbage collected without close(), filled by the finalizer
+        #(which can run in any thread, even one holding the lock) and drained under the lock
+        self._leaked = deque()
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "ping_failures": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "exhausted": 0,
+            "leaked": 0,
+        }
+
+    def _new_connection(self):
+        raw = self._connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return raw, time.monotonic()
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _reclaim_leaked(self):
+        #lock held, frees the slots of leaked connections, returns the raw connections to close
+        leaked = []
+        while self._leaked:
+            leaked.append(self._leaked.popleft())
+        if leaked:
+            self._open -= len(leaked)
+            self._stats["leaked"] += len(leaked)
+            logging.warning(f"DB pool: {len(leaked)} connection(s) were never closed, reclaimed")
+            self._cond.notify(len(leaked))
+        return leaked
+
+    def _is_usable(self, raw, created_at):
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            with self._cond:
+                self._stats["recycled"] += 1
+            return False
+        if self.pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                return False
+        return True
+
+    def connection(self):
+        start = time.monotonic()
+        waited = False
+        leaked = []
+
+        try:
+            with self._cond:
+                while True:
+                    leaked.extend(self._reclaim_leaked())
+                    if self._idle:
+                        raw, created_at = self._idle.pop()
+                        break
+                    if self._open < self.size + self.max_overflow:
+                        #reserve the slot now, connect outside the lock
+                        self._open += 1
+                        raw = None
+                        break
+
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._stats["exhausted"] += 1
+                        logging.warning(f"DB pool exhausted: {self._open} connections open, waited {self.timeout}s")
+                        raise PoolExhaustedError("Timed out waiting for a database connection")
+                    #a leaked connection's finalizer can't notify, so look for reclaimed slots every second
+                    self._cond.wait(min(remaining, 1))
+
+                elapsed = time.monotonic() - start
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_seconds_total"] += elapsed
+                    self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], elapsed)
+        finally:
+            for leaked_raw in leaked:
+                self._close_raw(leaked_raw)
+
+        try:
+            if raw is not None and not self._is_usable(raw, created_at):
+                self._close_raw(raw)
+                raw = None
+            if raw is None:
+                raw, created_at = self._new_connection()
+        except Exception:
+            #give the slot back if we could not open a connection
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _checkin(self, raw, created_at):
+        #clear any transaction the route left open
+        try:
+            raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if healthy and len(self._idle) < self.size:
+                self._idle.append((raw, created_at))
+                raw = None
+            else:
+                #overflow connection or broken one, close it
+                self._open -= 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._close_raw(raw)
+
+    def dispose(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self):
+        with self._cond:
+            leaked = self._reclaim_leaked()
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["max_overflow"] = self.max_overflow
+            stats["open"] = self._open
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._open - len(self._idle)
+        for raw in leaked:
+            self._close_raw(raw)
+        checkouts = stats["checkouts"] or 1
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / checkouts
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_db_connection():
+    return get_pool().connection()
+
+
+def pool_stats():
+    return get_pool().stats()
@@ -0,0 +1,110 @@
+import os
+import gzip
+
+import brotli
+import msgpack
+import orjson
+from flask import request, Response
+
+#negotiated response encodings for the read endpoints
+#  Accept: application/msgpack            MessagePack instead of JSON
+#  ?shape=columns                         lists as {"columns": [...], "rows": [[...], ...]}, keys sent once
+#  Accept-Encoding: br / gzip             compressed once the body is over COMPRESS_MIN_SIZE bytes
+#JSON is written with orjson, plain Accept: application/json clients get the same objects as before
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+#older clients ask for the x- type
+MEDIA_TYPES = [JSON, MSGPACK, "application/x-msgpack"]
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+#quality 11 is far too slow per request, 5 is close to gzip's speed and noticeably smaller
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+def negotiate():
+    best = request.accept_mimetypes.best_match(MEDIA_TYPES, default=JSON)
+    return MSGPACK if best != JSON else JSON
+
+
+def wants_columns():
+    return request.args.get("shape") == "columns"
+
+
+def _columns(rows):
+    #every row of a list endpoint has the same keys in the same order
+    columns = list(rows[0]) if rows else []
+    return {"columns": columns, "rows": [list(row.values()) for row in rows]}
+
+
+def to_columns(result):
+    if isinstance(result, list):
+        return _columns(result)
+    if isinstance(result, dict) and isinstance(result.get("items"), list):
+        shaped = _columns(result["items"])
+        shaped.update((k, v) for k, v in result.items() if k != "items")
+        return shaped
+    #single objects are left alone
+    return result
+
+
+def _default(value):
+    #Decimal from AVG(), anything else the DB hands back
+    return str(value)
+
+
+def dumps(result, mimetype=JSON):
+    if mimetype == MSGPACK:
+        return msgpack.packb(result, default=_default, use_bin_type=True)
+    return orjson.dumps(result, default=_default)
+
+
+def encode(result):
+    #returns (body, mimetype) for the current request
+    mimetype = negotiate()
+    if wants_columns():
+        result = to_columns(result)
+    return dumps(result, mimetype), mimetype
+
+
+def negotiate_coding(size):
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    accepted = request.accept_encodings
+    if accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def respond(result, status=200):
+    #drop-in for jsonify(result) on endpoints that support the encodings above
+    body, mimetype = encode(result)
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def init_app(app):
+    @app.after_request
+    def _compress(response):
+        #streamed bodies, 304s and responses cache.py already compressed are passed through
+        if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+            return response
+        if "Content-Encoding" in response.headers:
+            return response
+        response.vary.add("Accept-Encoding")
+        coding = negotiate_coding(response.content_length or 0)
+        if coding is None:
+            return response
+        response.set_data(compress(response.get_data(), coding))
+        response.headers["Content-Encoding"] = coding
+        return response
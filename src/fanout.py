@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import threading
+
+#coalesced Socket.IO fan-out
+#handlers publish(room, event, item) instead of emitting, a background thread collects everything published to
+#a room within FANOUT_WINDOW_MS and emits it as one event carrying a list, so a busy room costs one packet per
+#member per window instead of one per message. Items published with a key replace an older item with the same key
+#in the batch (an unread count only needs its latest value). FANOUT_WINDOW_MS=0 emits every item right away.
+
+FANOUT_WINDOW_MS = float(os.getenv("FANOUT_WINDOW_MS", "5"))
+#longer batches are split into several emits
+FANOUT_MAX_BATCH = int(os.getenv("FANOUT_MAX_BATCH", "100"))
+
+
+class FanOut:
+    def __init__(self, emit, window=FANOUT_WINDOW_MS / 1000, max_batch=FANOUT_MAX_BATCH):
+        #emit(event, items, room)
+        self._emit = emit
+        self.window = window
+        self.max_batch = max_batch
+        #(event, room) -> {key: item}, in publish order
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats = {"published": 0, "replaced": 0, "emits": 0, "flushes": 0, "batch_size_max": 0, "emit_errors": 0}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="socketio-fanout", daemon=True)
+                self._thread.start()
+
+    def publish(self, room, event, item, key=None):
+        if not self.window:
+            with self._lock:
+                self._stats["published"] += 1
+            self._send(event, room, [item])
+            return
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            self._stats["published"] += 1
+            items = self._pending.get((event, room))
+            if items is None:
+                items = self._pending[(event, room)] = {}
+                #first item of this window
+                self._wakeup.set()
+            if key is None:
+                #never collides with a caller's key, the dict only grows within a window
+                key = (None, len(items))
+            elif key in items:
+                self._stats["replaced"] += 1
+            items[key] = item
+
+    def _send(self, event, room, items):
+        try:
+            self._emit(event, items, room)
+        except Exception:
+            logging.error(f"Fan-out emit of {event} to {room} failed:", exc_info=True)
+            with self._lock:
+                self._stats["emit_errors"] += 1
+            return
+        with self._lock:
+            self._stats["emits"] += 1
+            self._stats["batch_size_max"] = max(self._stats["batch_size_max"], len(items))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._stats["flushes"] += 1
+        for (event, room), items in pending.items():
+            items = list(items.values())
+            for i in range(0, len(items), self.max_batch):
+                self._send(event, room, items[i:i + self.max_batch])
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            #let the rest of the window's messages arrive
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                logging.error("Fan-out flush failed:", exc_info=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_batches"] = len(self._pending)
+        stats["window_ms"] = self.window * 1000
+        stats["items_per_emit"] = stats["published"] / stats["emits"] if stats["emits"] else 0
+        return stats
@@ -0,0 +1,48 @@
+import os
+import logging
+import threading
+
+from metrics import timed_call
+
+#Firebase Admin SDK, initialized on first use instead of at import
+#firebase_admin and google.auth take a few hundred ms to import and need the service account file,
+#so processes that never call Firebase (tests, benchmarks, the search indexer) skip both
+#
+#  auth = get_auth()
+#  auth.create_user(...)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#relative paths are taken from this directory, not the working directory
+FIREBASE_CREDENTIALS = os.getenv(
+    "FIREBASE_CREDENTIALS", "config/hybridtechnologies-miniproject-firebase-adminsdk-l99aa-210da4ec8d.json")
+
+_app = None
+_initialized = False
+_lock = threading.Lock()
+
+
+def credentials_path(path=FIREBASE_CREDENTIALS):
+    return path if os.path.isabs(path) else os.path.join(HERE, path)
+
+
+def get_firebase_app():
+    global _app, _initialized
+    if not _initialized:
+        with _lock:
+            #another thread may have initialized while we waited
+            if not _initialized:
+                import firebase_admin
+                from firebase_admin import credentials
+                with timed_call("firebase", "initialize_app"):
+                    _app = firebase_admin.initialize_app(credentials.Certificate(credentials_path()))
+                _initialized = True
+                logging.info("Firebase Admin SDK initialized")
+    return _app
+
+
+def get_auth():
+    #firebase_admin.auth, with the default app initialized
+    get_firebase_app()
+    from firebase_admin import auth
+    return auth
@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from db import get_db_connection
+
+#conversation history, newest first, keyset paginated on (conversation_id, message_id)
+#the last HISTORY_BUFFER_SIZE messages of recently used conversations are kept in a ring buffer
+#that chat_writer.py appends to after every committed batch, so a room join usually needs no query
+
+HISTORY_BUFFER_SIZE = int(os.getenv("HISTORY_BUFFER_SIZE", "50"))
+HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", "1000"))
+#buffers are reloaded after this many seconds
+HISTORY_TTL = float(os.getenv("HISTORY_TTL", "300"))
+#with a message queue other workers persist messages too and only this worker's reach its buffers,
+#so they are only kept long enough to answer a burst of joins to the same room
+HISTORY_SHARED_TTL = float(os.getenv("HISTORY_SHARED_TTL", "3"))
+if os.getenv("SOCKETIO_MESSAGE_QUEUE"):
+    HISTORY_TTL = min(HISTORY_TTL, HISTORY_SHARED_TTL)
+HISTORY_DEFAULT_LIMIT = int(os.getenv("HISTORY_DEFAULT_LIMIT", "50"))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "200"))
+
+MESSAGE_COLUMNS = ["message_id", "sender_id", "receiver_id", "message_text", "conversation_id"]
+
+
+def _to_message(row):
+    return dict(zip(MESSAGE_COLUMNS, row))
+
+
+def query_messages(conversation_id, before=None, limit=HISTORY_DEFAULT_LIMIT):
+    #newest first, uses the (conversation_id, message_id) index from migrations/003_messages_index.sql
+    sql = f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages WHERE conversation_id = %s"
+    params = [conversation_id]
+    if before is not None:
+        sql += " AND message_id < %s"
+        params.append(before)
+    sql += " ORDER BY message_id DESC LIMIT %s"
+    params.append(limit)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return [_to_message(row) for row in rows]
+
+
+class _Buffer:
+    def __init__(self, messages, has_older, size):
+        #oldest first, newest at the right
+        self.messages = deque(reversed(messages), maxlen=size)
+        #False when the DB has nothing older than what is buffered
+        self.has_older = has_older
+        self.loaded_at = time.monotonic()
+
+    def append(self, message):
+        #ids usually arrive in order, but a message the chat writer persisted directly under backpressure
+        #gets its id ahead of rows still buffered, so those are placed by id rather than dropped
+        message_id = message["message_id"]
+        position = len(self.messages)
+        while position and self.messages[position - 1]["message_id"] > message_id:
+            position -= 1
+        if position and self.messages[position - 1]["message_id"] == message_id:
+            return
+        if len(self.messages) == self.messages.maxlen:
+            #oldest one drops out of the ring, it is only in the DB now
+            self.has_older = True
+            if position == 0:
+                return
+            self.messages.popleft()
+            position -= 1
+        self.messages.insert(position, message)
+
+
+class ConversationHistory:
+    def __init__(self, query=query_messages, buffer_size=HISTORY_BUFFER_SIZE,
+                 max_conversations=HISTORY_MAX_CONVERSATIONS, ttl=HISTORY_TTL):
+        self._query = query
+        self.buffer_size = buffer_size
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._buffers = OrderedDict()
+        #messages persisted while a buffer is being loaded, merged in once it is installed
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._stats = {"buffer_hits": 0, "buffer_misses": 0, "loads": 0, "evictions": 0}
+
+    def _get_buffer(self, conversation_id):
+        with self._lock:
+            buffer = self._buffers.get(conversation_id)
+            if buffer is not None and time.monotonic() - buffer.loaded_at > self.ttl:
+                del self._buffers[conversation_id]
+                buffer = None
+            if buffer is not None:
+                self._buffers.move_to_end(conversation_id)
+                return buffer
+            self._loading.setdefault(conversation_id, [])
+
+        #load outside the lock, one extra row tells us whether anything older exists
+        try:
+            messages = self._query(conversation_id, None, self.buffer_size + 1)
+        except Exception:
+            with self._lock:
+                self._loading.pop(conversation_id, None)
+            raise
+        has_older = len(messages) > self.buffer_size
+        buffer = _Buffer(messages[:self.buffer_size], has_older, self.buffer_size)
+
+        with self._lock:
+            for message in self._loading.pop(conversation_id, []):
+                buffer.append(message)
+            self._buffers[conversation_id] = buffer
+            self._stats["loads"] += 1
+            while len(self._buffers) > self.max_conversations:
+                self._buffers.popitem(last=False)
+                self._stats["evictions"] += 1
+        return buffer
+
+    def page(self, conversation_id, before=None, limit=HISTORY_DEFAULT_LIMIT):
+        limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        buffer = self._get_buffer(conversation_id)
+
+        with self._lock:
+            newest_first = [m for m in reversed(buffer.messages)
+                            if before is None or m["message_id"] < before]
+            #the buffer is enough when it has a full page, or when it holds the whole conversation
+            served = len(newest_first) >= limit or not buffer.has_older
+            if served:
+                self._stats["buffer_hits"] += 1
+                more = len(newest_first) > limit or buffer.has_older
+                items = newest_first[:limit]
+            else:
+                self._stats["buffer_misses"] += 1
+
+        if not served:
+            items = self._query(conversation_id, before, limit + 1)
+            more = len(items) > limit
+            items = items[:limit]
+
+        next_cursor = items[-1]["message_id"] if more and items else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def on_persisted(self, rows, first_id):
+        #chat_writer listener, rows are (sender_id, receiver_id, message_text, conversation_id)
+        if first_id is None:
+            return
+        with self._lock:
+            for offset, (sender_id, receiver_id, message_text, conversation_id) in enumerate(rows):
+                message = {
+                    "message_id": first_id + offset,
+                    "sender_id": sender_id,
+                    "receiver_id": receiver_id,
+                    "message_text": message_text,
+                    "conversation_id": conversation_id,
+                }
+                buffer = self._buffers.get(conversation_id)
+                if buffer is not None:
+                    buffer.append(message)
+                elif conversation_id in self._loading:
+                    self._loading[conversation_id].append(message)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["conversations"] = len(self._buffers)
+        return stats
+
+
+conversation_history = ConversationHistory()
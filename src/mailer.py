@@ -0,0 +1,384 @@
+import os
+import time
+import logging
+import threading
+
+from db import get_db_connection
+from replicas import get_read_connection
+from metrics import timed_call
+from firebase_app import get_auth
+
+#email outbox, register() only inserts a row into email_outbox (migrations/002_email_outbox.sql)
+#and a background worker sends batches over one authenticated SMTP session that it keeps open
+#smtplib and the MIME classes are imported by the worker when it first needs them, not by the web process at startup
+
+SENDER_EMAIL = os.getenv('SENDER_EMAIL')
+SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+#turn off for a local stand-in like aiosmtpd that does not speak TLS
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", "5"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+#retry after base * 2^attempts seconds, capped
+MAIL_RETRY_BASE = int(os.getenv("MAIL_RETRY_BASE", "30"))
+MAIL_RETRY_MAX = int(os.getenv("MAIL_RETRY_MAX", "3600"))
+#rows stuck in 'sending' this long (worker died mid batch) are picked up again
+MAIL_CLAIM_TIMEOUT = int(os.getenv("MAIL_CLAIM_TIMEOUT", "600"))
+#sent rows are deleted after this many days (failed ones are kept for inspection), 0 keeps everything
+MAIL_RETENTION_DAYS = int(os.getenv("MAIL_RETENTION_DAYS", "7"))
+#seconds between purges and rows deleted per statement
+MAIL_PURGE_INTERVAL = float(os.getenv("MAIL_PURGE_INTERVAL", "3600"))
+MAIL_PURGE_BATCH = int(os.getenv("MAIL_PURGE_BATCH", "1000"))
+#seconds the per-status counts in outbox_stats() are reused, /metrics scrapes would run the query every time
+MAIL_STATS_TTL = float(os.getenv("MAIL_STATS_TTL", "30"))
+
+
+def enqueue_email(kind, recipient, username=None, conn=None):
+    #conn can be passed to enqueue inside the caller's transaction, otherwise commits on its own
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO bookreview_DB.email_outbox (kind, recipient, username) VALUES (%s, %s, %s)",
+            (kind, recipient, username)
+        )
+        if own_conn:
+            conn.commit()
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+
+    _wakeup.set()
+
+
+def build_verification_message(email, username):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    #generate link for verification
+    auth = get_auth()
+    with timed_call("firebase", "generate_email_verification_link"):
+        verification_link = auth.generate_email_verification_link(email)
+
+    subject = f"{username} VERIFY UR EMAIL PLEASE"
+    body = f"CLICK THE LINK NOW: {verification_link}"
+
+    #MIME email message
+    msg = MIMEMultipart()
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+MESSAGE_BUILDERS = {
+    "verification": build_verification_message,
+}
+
+
+class SMTPSession:
+    #one logged in SMTP connection reused across batches, reopened when the server drops it
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, starttls=SMTP_STARTTLS,
+                 sender=SENDER_EMAIL, password=SENDER_PASSWORD):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.sender = sender
+        self.password = password
+        self.server = None
+        self.connects = 0
+
+    def _open(self):
+        import smtplib
+        logging.info(f"Opening SMTP session to {self.host}:{self.port}")
+        with timed_call("smtp", "connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+            server.ehlo()
+            if self.starttls:
+                server.starttls()
+                server.ehlo()
+            if self.password:
+                server.login(self.sender, self.password)
+        self.server = server
+        self.connects += 1
+
+    def _alive(self):
+        if self.server is None:
+            return False
+        import smtplib
+        try:
+            return self.server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def ensure_open(self):
+        if not self._alive():
+            self.close()
+            self._open()
+
+    def send(self, msg):
+        import smtplib
+        try:
+            with timed_call("smtp", "sendmail"):
+                self.server.sendmail(self.sender, msg['To'], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            #server closed the idle session, reconnect once and retry
+            self.close()
+            self._open()
+            self.server.sendmail(self.sender, msg['To'], msg.as_string())
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+_wakeup = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {"sent": 0, "retried": 0, "failed": 0, "batches": 0, "last_batch_size": 0, "purged": 0}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def claim_batch(conn, batch_size=MAIL_BATCH_SIZE):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        #SKIP LOCKED lets several workers share the outbox without sending twice
+        cursor.execute("""
+            SELECT id, kind, recipient, username, attempts FROM bookreview_DB.email_outbox
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+               OR (status = 'sending' AND claimed_at < NOW() - INTERVAL %s SECOND)
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (MAIL_CLAIM_TIMEOUT, batch_size))
+        rows = cursor.fetchall()
+        if rows:
+            cursor.executemany(
+                "UPDATE bookreview_DB.email_outbox SET status = 'sending', claimed_at = NOW() WHERE id = %s",
+                [(row["id"],) for row in rows]
+            )
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _retry_delay(attempts):
+    return min(MAIL_RETRY_BASE * (2 ** attempts), MAIL_RETRY_MAX)
+
+
+def send_batch(session, rows):
+    #returns (sent ids, [(id, attempts, error, delay)] to retry, [(id, attempts, error)] given up on)
+    sent, retry, failed = [], [], []
+    try:
+        session.ensure_open()
+    except Exception as e:
+        logging.error("Could not open SMTP session:", exc_info=True)
+        for row in rows:
+            retry.append((row["id"], row["attempts"] + 1, str(e), _retry_delay(row["attempts"])))
+        return sent, retry, failed
+
+    for row in rows:
+        attempts = row["attempts"] + 1
+        try:
+            msg = MESSAGE_BUILDERS[row["kind"]](row["recipient"], row["username"])
+            session.send(msg)
+            sent.append(row["id"])
+        except Exception as e:
+            logging.error(f"Error sending {row['kind']} email to {row['recipient']}:", exc_info=True)
+            if attempts >= MAIL_MAX_ATTEMPTS:
+                failed.append((row["id"], attempts, str(e)))
+            else:
+                retry.append((row["id"], attempts, str(e), _retry_delay(row["attempts"])))
+    return sent, retry, failed
+
+
+def record_results(conn, sent, retry, failed):
+    cursor = conn.cursor()
+    try:
+        if sent:
+            cursor.executemany(
+                "UPDATE bookreview_DB.email_outbox SET status = 'sent', attempts = attempts + 1, sent_at = NOW() WHERE id = %s",
+                [(i,) for i in sent]
+            )
+        if retry:
+            cursor.executemany("""
+                UPDATE bookreview_DB.email_outbox
+                SET status = 'pending', attempts = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s
+            """, [(attempts, error[:255], delay, i) for i, attempts, error, delay in retry])
+        if failed:
+            cursor.executemany(
+                "UPDATE bookreview_DB.email_outbox SET status = 'failed', attempts = %s, last_error = %s WHERE id = %s",
+                [(attempts, error[:255], i) for i, attempts, error in failed]
+            )
+        conn.commit()
+    finally:
+        cursor.close()
+
+    _bump("sent", len(sent))
+    _bump("retried", len(retry))
+    _bump("failed", len(failed))
+
+
+def process_once(session, batch_size=MAIL_BATCH_SIZE):
+    conn = get_db_connection()
+    try:
+        rows = claim_batch(conn, batch_size)
+        if not rows:
+            return 0
+        sent, retry, failed = send_batch(session, rows)
+        record_results(conn, sent, retry, failed)
+    finally:
+        conn.close()
+
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["last_batch_size"] = len(rows)
+    return len(rows)
+
+
+def purge_sent(retention_days=MAIL_RETENTION_DAYS, batch_size=MAIL_PURGE_BATCH):
+    #deletes sent rows older than the retention in small batches so no statement holds locks for long
+    if retention_days <= 0:
+        return 0
+    purged = 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        while True:
+            #uses idx_email_outbox_sent (migrations/009_email_outbox_retention.sql)
+            cursor.execute(
+                "DELETE FROM bookreview_DB.email_outbox WHERE status = 'sent' AND sent_at < NOW() - INTERVAL %s DAY LIMIT %s",
+                (retention_days, batch_size)
+            )
+            deleted = cursor.rowcount
+            conn.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    finally:
+        cursor.close()
+        conn.close()
+
+    _bump("purged", purged)
+    return purged
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self, session=None, batch_size=MAIL_BATCH_SIZE, poll_interval=MAIL_POLL_INTERVAL):
+        super().__init__(name="email-outbox", daemon=True)
+        self.session = session or SMTPSession()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._next_purge = 0
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + MAIL_PURGE_INTERVAL
+        try:
+            purge_sent()
+        except Exception:
+            logging.error("Email outbox purge error:", exc_info=True)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._purge_if_due()
+            try:
+                #keep going while full batches come back, otherwise wait for an enqueue or the poll interval
+                if process_once(self.session, self.batch_size) == self.batch_size:
+                    continue
+            except Exception:
+                logging.error("Email outbox worker error:", exc_info=True)
+            _wakeup.wait(self.poll_interval)
+            _wakeup.clear()
+        self.session.close()
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = OutboxWorker()
+            _worker.start()
+    return _worker
+
+
+def stop_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker.join(timeout=10)
+            _worker = None
+
+
+#(monotonic time, counts) of the last status query
+_status_counts = (None, {})
+
+
+def _query_status_counts():
+    #a replica is fine, the counts are only for monitoring
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT status, COUNT(*) FROM bookreview_DB.email_outbox GROUP BY status")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def status_counts(ttl=MAIL_STATS_TTL):
+    global _status_counts
+    fetched_at, counts = _status_counts
+    now = time.monotonic()
+    if fetched_at is None or now - fetched_at >= ttl:
+        counts = _query_status_counts()
+        _status_counts = (now, counts)
+    return counts
+
+
+def outbox_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["worker_running"] = _worker is not None and _worker.is_alive()
+    stats["smtp_connects"] = _worker.session.connects if _worker is not None else 0
+
+    counts = status_counts()
+    stats["queue_depth"] = counts.get("pending", 0) + counts.get("sending", 0)
+    stats["by_status"] = counts
+    return stats
@@ -0,0 +1,247 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+#request, query, external call and Socket.IO timings, rendered as Prometheus text on /metrics
+#METRICS_SAMPLE_RATE=0 turns timing off, every hook then costs one comparison
+
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1"))
+#requests slower than this many milliseconds are logged, 0 disables
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def sampled():
+    if METRICS_SAMPLE_RATE >= 1:
+        return True
+    if METRICS_SAMPLE_RATE <= 0:
+        return False
+    return random.random() < METRICS_SAMPLE_RATE
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        #label values -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+request_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+query_latency = Histogram("db_query_duration_seconds", "MySQL statement latency by normalized SQL", ("query",))
+external_latency = Histogram("external_call_duration_seconds", "Firebase and SMTP call latency", ("service", "call", "outcome"))
+socketio_latency = Histogram("socketio_handler_duration_seconds", "Socket.IO handler duration", ("event",))
+socketio_events = CounterMetric("socketio_events_total", "Socket.IO events received", ("event",))
+slow_requests = CounterMetric("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ("route",))
+rate_limited = CounterMetric("rate_limited_total", "Requests and events rejected by a rate limit", ("rule",))
+requests_shed = CounterMetric("requests_shed_total", "Requests rejected by admission control")
+
+METRICS = [request_latency, query_latency, external_latency, socketio_latency, socketio_events, slow_requests,
+           rate_limited, requests_shed]
+
+#name -> function returning a dict of numbers, rendered as gauges (pool, cache, writer stats...)
+_collectors = {}
+
+
+def register_collector(prefix, collect):
+    _collectors[prefix] = collect
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"VALUES \((?:%s, )*%s\)(?:, \((?:%s, )*%s\))*", re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'[^']*'|\b\d+\b")
+_normalized = {}
+
+
+def normalize_sql(sql):
+    #one label per statement shape: whitespace collapsed, IN lists and VALUES rows folded, literals replaced
+    label = _normalized.get(sql)
+    if label is None:
+        label = _WHITESPACE_RE.sub(" ", sql).strip()
+        label = _IN_LIST_RE.sub("IN (...)", label)
+        label = _VALUES_RE.sub("VALUES (...)", label)
+        label = _LITERAL_RE.sub("?", label)
+        #statements are built from a fixed set in the code, the cap only guards against surprises
+        if len(_normalized) < 1000:
+            _normalized[sql] = label
+    return label
+
+
+class TimedCursor:
+    #wraps a mysql.connector cursor and times execute/executemany
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params, *args, **kwargs)
+        finally:
+            query_latency.observe(time.perf_counter() - start, normalize_sql(sql))
+
+    def executemany(self, sql, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_params, *args, **kwargs)
+        finally:
+            query_latency.observe(time.perf_counter() - start, normalize_sql(sql))
+
+
+def wrap_cursor(cursor):
+    return TimedCursor(cursor) if sampled() else cursor
+
+
+@contextmanager
+def timed_call(service, call):
+    #with timed_call("firebase", "create_user"): ...
+    if not sampled():
+        yield
+        return
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        external_latency.observe(time.perf_counter() - start, service, call, outcome)
+
+
+def timed_event(event):
+    #decorator for Socket.IO handlers, goes under @socketio.on(...)
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not sampled():
+                return f(*args, **kwargs)
+            socketio_events.inc(event)
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                socketio_latency.observe(time.perf_counter() - start, event)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    from flask import request, g
+
+    @app.before_request
+    def _start_timer():
+        is_sampled = sampled()
+        if is_sampled or SLOW_REQUEST_MS:
+            g._metrics = (time.perf_counter(), is_sampled)
+
+    @app.after_request
+    def _record(response):
+        timing = g.pop("_metrics", None)
+        if timing is None:
+            return response
+        start, is_sampled = timing
+        elapsed = time.perf_counter() - start
+        #the url rule keeps ids out of the label, unmatched paths share one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        if is_sampled:
+            request_latency.observe(elapsed, request.method, route, response.status_code)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            slow_requests.inc(route)
+            logging.warning(f"Slow request: {request.method} {request.full_path} took {elapsed * 1000:.0f}ms ({response.status_code})")
+        return response
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for prefix, collect in list(_collectors.items()):
+        try:
+            values = collect()
+        except Exception:
+            logging.error(f"Metrics collector {prefix} failed:", exc_info=True)
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
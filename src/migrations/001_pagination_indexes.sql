@@ -0,0 +1,15 @@
+-- composite (sort column, primary key) indexes used by keyset pagination in pagination.py
+USE bookreview_DB;
+
+CREATE INDEX idx_books_ranking ON books (ranking, objectID);
+CREATE INDEX idx_books_points ON books (points, objectID);
+CREATE INDEX idx_books_num_comments ON books (num_comments, objectID);
+
+CREATE INDEX idx_archived_books_ranking ON archived_books (ranking, objectID);
+CREATE INDEX idx_archived_books_points ON archived_books (points, objectID);
+CREATE INDEX idx_archived_books_num_comments ON archived_books (num_comments, objectID);
+
+CREATE INDEX idx_reviews_created_at ON reviews (created_at, reviewID);
+CREATE INDEX idx_reviews_stars ON reviews (stars, reviewID);
+
+CREATE INDEX idx_users_created_at ON users (created_at, id);
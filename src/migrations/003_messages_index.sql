@@ -0,0 +1,4 @@
+-- composite index for conversation history, newest first per conversation (history.py)
+USE bookreview_DB;
+
+CREATE INDEX idx_messages_conversation ON messages (conversation_id, message_id);
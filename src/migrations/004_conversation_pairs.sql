@@ -0,0 +1,13 @@
+-- store conversation pairs as (min, max) and make them unique (conversations.py)
+USE bookreview_DB;
+
+-- swap reversed pairs, assignments in a single-table UPDATE run left to right
+UPDATE conversations
+SET user1_id = (@tmp := user1_id), user1_id = user2_id, user2_id = @tmp
+WHERE user1_id > user2_id;
+
+-- duplicate rooms created by the old check-then-insert race have to be merged before the key can be added:
+-- SELECT user1_id, user2_id, GROUP_CONCAT(conversation_id) FROM conversations
+-- GROUP BY user1_id, user2_id HAVING COUNT(*) > 1;
+
+ALTER TABLE conversations ADD UNIQUE KEY uq_conversations_pair (user1_id, user2_id);
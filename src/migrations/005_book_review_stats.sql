@@ -0,0 +1,19 @@
+-- per-book review aggregates kept up to date by review_stats.py
+-- backfill with `python review_stats.py rebuild` after creating the table
+USE bookreview_DB;
+
+CREATE TABLE IF NOT EXISTS book_review_stats (
+    bookID INT PRIMARY KEY,
+    review_count INT NOT NULL DEFAULT 0,
+    stars_sum INT NOT NULL DEFAULT 0,
+    stars_1 INT NOT NULL DEFAULT 0,
+    stars_2 INT NOT NULL DEFAULT 0,
+    stars_3 INT NOT NULL DEFAULT 0,
+    stars_4 INT NOT NULL DEFAULT 0,
+    stars_5 INT NOT NULL DEFAULT 0,
+    latest_review_at DATETIME
+);
+
+-- /reviews?bookID= pages and latest_review_at recompute
+CREATE INDEX idx_reviews_book ON reviews (bookID, reviewID);
+CREATE INDEX idx_reviews_book_created_at ON reviews (bookID, created_at);
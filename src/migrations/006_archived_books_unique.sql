@@ -0,0 +1,9 @@
+-- one bookmark per book, lets archive.py insert with ON DUPLICATE KEY UPDATE
+USE bookreview_DB;
+
+-- rebuild the table with the key, INSERT IGNORE keeps the first copy of any duplicate bookmark
+CREATE TABLE archived_books_dedup LIKE archived_books;
+ALTER TABLE archived_books_dedup ADD UNIQUE KEY uq_archived_books_object (objectID);
+INSERT IGNORE INTO archived_books_dedup SELECT * FROM archived_books;
+RENAME TABLE archived_books TO archived_books_old, archived_books_dedup TO archived_books;
+DROP TABLE archived_books_old;
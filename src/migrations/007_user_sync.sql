@@ -0,0 +1,25 @@
+-- Firebase -> MySQL user reconciliation (user_sync.py)
+USE bookreview_DB;
+
+-- batches are diffed by uid
+CREATE INDEX idx_users_uid ON users (uid);
+
+-- last sync pass that saw the user in Firebase, rows left behind are missing from Firebase
+ALTER TABLE users ADD COLUMN sync_run INT;
+
+-- one row per job, the page token is saved with each batch so an interrupted pass resumes
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    job VARCHAR(64) PRIMARY KEY,
+    run_id INT NOT NULL,
+    page_token VARCHAR(255),
+    pages INT NOT NULL DEFAULT 0,
+    seen INT NOT NULL DEFAULT 0,
+    inserted INT NOT NULL DEFAULT 0,
+    updated INT NOT NULL DEFAULT 0,
+    unchanged INT NOT NULL DEFAULT 0,
+    duplicates INT NOT NULL DEFAULT 0,
+    missing_in_firebase INT,
+    started_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    finished_at DATETIME
+);
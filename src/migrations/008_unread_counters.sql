@@ -0,0 +1,10 @@
+-- per-user unread message counts per conversation, written in batches by unread.py
+USE bookreview_DB;
+
+CREATE TABLE IF NOT EXISTS unread_counters (
+    user_id INT NOT NULL,
+    conversation_id INT NOT NULL,
+    unread INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, conversation_id)
+);
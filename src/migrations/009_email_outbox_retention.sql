@@ -0,0 +1,4 @@
+-- mailer.purge_sent() deletes sent rows past MAIL_RETENTION_DAYS, this keeps it from scanning every sent row
+USE bookreview_DB;
+
+CREATE INDEX idx_email_outbox_sent ON email_outbox (status, sent_at);
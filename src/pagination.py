@@ -0,0 +1,228 @@
+import os
+import json
+import base64
+from datetime import datetime
+
+#keyset (cursor) pagination and field projection for the list endpoints
+#pages are ordered by (sort column, primary key) and the cursor holds the last row's values,
+#so every page is an index range scan instead of OFFSET or a full table read
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def _format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value is not None else None
+
+
+class Resource:
+    def __init__(self, table, key, columns, sortable, formatters=None):
+        self.table = table
+        #primary key, used as the tie breaker so the order is total
+        self.key = key
+        #column names in the order of the table (same order SELECT * returned)
+        self.columns = columns
+        #columns with an index on (column, key), see migrations/001_pagination_indexes.sql
+        self.sortable = sortable
+        self.formatters = formatters or {}
+
+    def format_value(self, column, value):
+        formatter = self.formatters.get(column)
+        return formatter(value) if formatter else value
+
+
+USERS = Resource(
+    table="bookreview_DB.users",
+    key="id",
+    columns=["id", "username", "password", "created_at", "profilePic"],
+    sortable=["id", "created_at"],
+    formatters={"created_at": _format_datetime},
+)
+
+BOOKS = Resource(
+    table="bookreview_DB.books",
+    key="objectID",
+    columns=["objectID", "image", "title", "url", "author", "num_comments", "points", "genre", "ranking"],
+    sortable=["objectID", "ranking", "points", "num_comments"],
+)
+
+ARCHIVED_BOOKS = Resource(
+    table="bookreview_DB.archived_books",
+    key="objectID",
+    columns=["objectID", "image", "title", "url", "author", "num_comments", "points", "genre", "ranking"],
+    sortable=["objectID", "ranking", "points", "num_comments"],
+)
+
+REVIEWS = Resource(
+    table="bookreview_DB.reviews",
+    key="reviewID",
+    columns=["id", "review", "stars", "created_at", "reviewID", "bookID"],
+    sortable=["reviewID", "created_at", "stars"],
+    formatters={"created_at": _format_datetime},
+)
+
+
+def encode_cursor(sort, value, key):
+    if isinstance(value, datetime):
+        value = _format_datetime(value)
+    raw = json.dumps([sort, value, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort, value, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise PaginationError("Invalid cursor")
+    return sort, value, key
+
+
+def parse_fields(resource, args):
+    fields = args.get("fields")
+    if not fields:
+        return list(resource.columns)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in resource.columns]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def parse_sort(resource, args):
+    #sort=points for ascending, sort=-points for descending
+    sort = args.get("sort") or resource.key
+    descending = sort.startswith("-")
+    column = sort.lstrip("-")
+    if column not in resource.sortable:
+        raise PaginationError(f"Cannot sort by {column}, sortable fields: {', '.join(resource.sortable)}")
+    return sort, column, descending
+
+
+def parse_limit(args):
+    try:
+        limit = int(args.get("limit", PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be at least 1")
+    return min(limit, PAGE_MAX_LIMIT)
+
+
+def wants_page(args):
+    #without limit/after the endpoints keep returning the plain list the frontend already uses
+    return "limit" in args or "after" in args
+
+
+def order_by(resource, column, descending):
+    #key as the tie breaker so equal sort values keep a stable order
+    direction = "DESC" if descending else "ASC"
+    if column == resource.key:
+        return f"{column} {direction}"
+    return f"{column} {direction}, {resource.key} {direction}"
+
+
+def build_list_query(resource, args, where=None):
+    #unpaginated SELECT, ordered only when sort= is given so the plain list query stays as it was
+    fields = parse_fields(resource, args)
+    sql = f"SELECT {', '.join(fields)} FROM {resource.table}"
+    if where:
+        sql += " WHERE " + where
+    if args.get("sort"):
+        _, column, descending = parse_sort(resource, args)
+        sql += f" ORDER BY {order_by(resource, column, descending)}"
+    return sql, fields
+
+
+def build_page_query(resource, args, where=None, params=()):
+    fields = parse_fields(resource, args)
+    sort, column, descending = parse_sort(resource, args)
+    limit = parse_limit(args)
+
+    #always select the sort column and key so the next cursor can be built
+    select = list(fields)
+    for extra in (column, resource.key):
+        if extra not in select:
+            select.append(extra)
+
+    conditions = [where] if where else []
+    params = list(params)
+
+    after = args.get("after")
+    if after:
+        cursor_sort, value, key = decode_cursor(after)
+        if cursor_sort != sort:
+            raise PaginationError("Cursor does not match the requested sort")
+        op = "<" if descending else ">"
+        if column == resource.key:
+            conditions.append(f"{resource.key} {op} %s")
+            params.append(key)
+        else:
+            #expanded form of (column, key) > (value, key) so MySQL can range scan the index
+            conditions.append(f"({column} {op} %s OR ({column} = %s AND {resource.key} {op} %s))")
+            params.extend([value, value, key])
+
+    sql = f"SELECT {', '.join(select)} FROM {resource.table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    #fetch one extra row to know whether there is a next page
+    sql += f" ORDER BY {order_by(resource, column, descending)} LIMIT %s"
+    params.append(limit + 1)
+
+    return sql, params, {"fields": fields, "select": select, "sort": sort, "column": column, "limit": limit}
+
+
+def fetch_page(conn, resource, args, where=None, params=()):
+    sql, params, plan = build_page_query(resource, args, where, params)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    limit = plan["limit"]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    select = plan["select"]
+    fields = plan["fields"]
+    items = []
+    for row in rows:
+        values = dict(zip(select, row))
+        items.append({f: resource.format_value(f, values[f]) for f in fields})
+
+    next_cursor = None
+    if has_more and rows:
+        last = dict(zip(select, rows[-1]))
+        next_cursor = encode_cursor(plan["sort"], last[plan["column"]], last[resource.key])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def fetch_all(conn, resource, args, where=None, params=()):
+    #unpaginated list, still honours fields= so clients only pull the columns they render, and sort=
+    sql, fields = build_list_query(resource, args, where)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    return [
+        {f: resource.format_value(f, value) for f, value in zip(fields, row)}
+        for row in rows
+    ]
+
+
+def list_resource(conn, resource, args, where=None, params=()):
+    if wants_page(args):
+        return fetch_page(conn, resource, args, where, params)
+    return fetch_all(conn, resource, args, where, params)
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import threading
+
+#who is online in which chat room, per worker process
+#a socket registers a user in a room on 'join', 'heartbeat' events keep it alive and it is dropped on
+#'leave', on disconnect or once it has not sent anything for PRESENCE_TTL seconds (a client that vanished
+#without closing its socket). A user counts as online while any of its sockets (tabs) is in the room.
+#with several workers each one knows only its own sockets, the presence events still reach every worker's
+#clients through the message queue
+
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "60"))
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "10"))
+
+
+class _Socket:
+    __slots__ = ("user_id", "rooms", "seen")
+
+    def __init__(self, user_id, now):
+        self.user_id = user_id
+        self.rooms = set()
+        self.seen = now
+
+
+class PresenceRegistry:
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        #sid -> _Socket
+        self._sockets = {}
+        #room -> user_id -> set of sids
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._stats = {"joins": 0, "leaves": 0, "expired": 0}
+
+    def join(self, sid, room, user_id):
+        #returns True when the user was not online in the room before
+        now = time.monotonic()
+        with self._lock:
+            socket = self._sockets.get(sid)
+            if socket is None:
+                socket = self._sockets[sid] = _Socket(user_id, now)
+            socket.seen = now
+            socket.rooms.add(room)
+            users = self._rooms.setdefault(room, {})
+            sids = users.get(user_id)
+            first = sids is None
+            if first:
+                sids = users[user_id] = set()
+            sids.add(sid)
+            self._stats["joins"] += 1
+        return first
+
+    def _remove(self, sid, room, user_id):
+        #lock held, returns True when that was the user's last socket in the room
+        users = self._rooms.get(room)
+        if not users or user_id not in users:
+            return False
+        sids = users[user_id]
+        sids.discard(sid)
+        if sids:
+            return False
+        del users[user_id]
+        if not users:
+            del self._rooms[room]
+        return True
+
+    def leave(self, sid, room):
+        #returns the user id that went offline in the room, or None
+        with self._lock:
+            socket = self._sockets.get(sid)
+            if socket is None or room not in socket.rooms:
+                return None
+            socket.rooms.discard(room)
+            self._stats["leaves"] += 1
+            return socket.user_id if self._remove(sid, room, socket.user_id) else None
+
+    def heartbeat(self, sid):
+        #False when the socket is not registered (never joined, or expired), the client should join again
+        socket = self._sockets.get(sid)
+        if socket is None:
+            return False
+        socket.seen = time.monotonic()
+        return True
+
+    def disconnect(self, sid):
+        #returns [(room, user_id)] that went offline
+        with self._lock:
+            return self._drop(sid)
+
+    def _drop(self, sid):
+        socket = self._sockets.pop(sid, None)
+        if socket is None:
+            return []
+        return [(room, socket.user_id) for room in socket.rooms if self._remove(sid, room, socket.user_id)]
+
+    def sweep(self):
+        #drops sockets that have been silent for longer than the TTL, returns [(room, user_id)] that went offline
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            stale = [sid for sid, socket in self._sockets.items() if socket.seen < cutoff]
+            offline = []
+            for sid in stale:
+                offline.extend(self._drop(sid))
+            self._stats["expired"] += len(stale)
+        return offline
+
+    def is_online(self, room, user_id):
+        return user_id in self._rooms.get(room, ())
+
+    def online(self, room):
+        with self._lock:
+            return list(self._rooms.get(room, ()))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sockets"] = len(self._sockets)
+            stats["rooms"] = len(self._rooms)
+            stats["room_members"] = sum(len(users) for users in self._rooms.values())
+        return stats
+
+
+presence = PresenceRegistry()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _sweep_loop(on_offline, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            offline = presence.sweep()
+            if offline:
+                on_offline(offline)
+        except Exception:
+            logging.error("Presence sweep failed:", exc_info=True)
+
+
+def start_sweeper(on_offline, interval=PRESENCE_SWEEP_INTERVAL):
+    #on_offline([(room, user_id)]) is called for users whose sockets expired, started once per process
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_loop, args=(on_offline, interval), name="presence-sweeper", daemon=True)
+            _sweeper.start()
@@ -0,0 +1,143 @@
+import os
+import time
+
+from cache import TTLCache, REPLICA_SETTLE_SECONDS
+from replicas import get_read_connection
+
+#public user profiles (username, profilePic) for rendering reviews and chat rooms
+#GET /users/profiles?ids=1,2,3&uids=abc answers a whole page of authors in one call: cached profiles come
+#from a bounded LRU, the rest are fetched together in one WHERE id IN (...) OR uid IN (...) query
+#update_profilePic and register() invalidate, other workers' changes show up after PROFILE_CACHE_TTL
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+#ids + uids per request
+PROFILE_BATCH_MAX = int(os.getenv("PROFILE_BATCH_MAX", "100"))
+
+PUBLIC_FIELDS = ["id", "username", "profilePic"]
+
+#id -> public profile, and uid -> id for lookups by Firebase uid (a uid never moves to another id)
+profile_cache = TTLCache(ttl=PROFILE_CACHE_TTL, max_entries=PROFILE_CACHE_SIZE)
+uid_cache = TTLCache(ttl=PROFILE_CACHE_TTL, max_entries=PROFILE_CACHE_SIZE)
+
+#monotonic time of the last invalidate_profile()
+_invalidated_at = 0
+
+
+class ProfileLookupError(ValueError):
+    pass
+
+
+def _split(args, name):
+    #?ids=1,2&ids=3 and ?ids=1,2,3 are the same
+    values = []
+    for value in args.getlist(name):
+        values.extend(v.strip() for v in value.split(",") if v.strip())
+    return values
+
+
+def parse_lookup(args):
+    ids = _split(args, "ids")
+    uids = _split(args, "uids")
+    if not ids and not uids:
+        raise ProfileLookupError("ids or uids is required")
+    if len(ids) + len(uids) > PROFILE_BATCH_MAX:
+        raise ProfileLookupError(f"At most {PROFILE_BATCH_MAX} ids and uids per request")
+    try:
+        ids = [int(i) for i in ids]
+    except ValueError:
+        raise ProfileLookupError("ids must be integers")
+    #keep the caller's order, drop repeats
+    return list(dict.fromkeys(ids)), list(dict.fromkeys(uids))
+
+
+def _to_profile(row):
+    return dict(zip(PUBLIC_FIELDS, row[:len(PUBLIC_FIELDS)]))
+
+
+def query_profiles(ids, uids):
+    #one query for both kinds of key, PRIMARY and idx_users_uid (migrations/007_user_sync.sql)
+    conditions, params = [], []
+    if ids:
+        conditions.append(f"id IN ({', '.join(['%s'] * len(ids))})")
+        params.extend(ids)
+    if uids:
+        conditions.append(f"uid IN ({', '.join(['%s'] * len(uids))})")
+        params.extend(uids)
+
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT {', '.join(PUBLIC_FIELDS)}, uid FROM bookreview_DB.users WHERE {' OR '.join(conditions)}",
+            params
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return [(_to_profile(row), row[-1]) for row in rows]
+
+
+def _cacheable(started):
+    #rows read while an invalidation happened may be the old ones, and so may replica reads shortly after one
+    if _invalidated_at >= started:
+        return False
+    return not (REPLICA_SETTLE_SECONDS and time.monotonic() - _invalidated_at < REPLICA_SETTLE_SECONDS)
+
+
+def get_profiles(ids, uids):
+    #returns {"ids": {id: profile}, "uids": {uid: profile}, "not_found": {"ids": [...], "uids": [...]}}
+    #at most one query, none when every profile is cached
+    by_id, by_uid = {}, {}
+    missing_ids, missing_uids = [], []
+    for user_id in ids:
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            missing_ids.append(user_id)
+        else:
+            by_id[user_id] = profile
+    for uid in uids:
+        user_id = uid_cache.get(uid)
+        profile = profile_cache.get(user_id) if user_id is not None else None
+        if profile is None:
+            missing_uids.append(uid)
+        else:
+            by_uid[uid] = profile
+
+    if missing_ids or missing_uids:
+        started = time.monotonic()
+        rows = query_profiles(missing_ids, missing_uids)
+        cache = _cacheable(started)
+        for profile, uid in rows:
+            if cache:
+                profile_cache.set(profile["id"], profile, 0)
+                if uid:
+                    uid_cache.set(uid, profile["id"], 0)
+            by_id[profile["id"]] = profile
+            if uid:
+                by_uid[uid] = profile
+
+    #misses are not cached so a user who just registered shows up straight away
+    return {
+        "ids": {str(i): by_id[i] for i in ids if i in by_id},
+        "uids": {uid: by_uid[uid] for uid in uids if uid in by_uid},
+        "not_found": {"ids": [i for i in ids if i not in by_id], "uids": [u for u in uids if u not in by_uid]},
+    }
+
+
+def invalidate_profile(user_id=None, uid=None):
+    global _invalidated_at
+    _invalidated_at = time.monotonic()
+    if uid is not None:
+        if user_id is None:
+            user_id = uid_cache.get(uid)
+        uid_cache.delete(uid)
+    if user_id is not None:
+        profile_cache.delete(user_id)
+
+
+def profile_stats():
+    stats = profile_cache.stats()
+    stats["uids"] = uid_cache.stats()["entries"]
+    return stats
@@ -0,0 +1,257 @@
+import os
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+from flask import request, g, jsonify
+from werkzeug.wsgi import ClosingIterator
+from flask_socketio import emit
+
+from metrics import rate_limited, requests_shed
+
+#per-client token buckets and a global concurrency limit
+#  @rate_limit("register", "5/minute")         per uid (after require_auth) or per IP, 429 + Retry-After
+#  @socket_rate_limit("message", "10/second")  per socket, over the limit the event is dropped
+#  init_app(app)                               at most MAX_CONCURRENT_REQUESTS in flight, 503 beyond that
+#buckets live in this process unless RATE_LIMIT_STORAGE is a redis:// URL, which several workers can share
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory")
+#idle buckets are dropped oldest first past this many keys
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+#0 turns admission control off
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "100"))
+#how long a request may wait for a slot before it is shed
+ADMISSION_WAIT = float(os.getenv("ADMISSION_WAIT", "0.1"))
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rule(rule):
+    #"5/minute" -> (tokens per second, burst), the burst is the whole allowance
+    try:
+        count, period = rule.split("/")
+        count = float(count)
+        seconds = PERIODS[period.strip()]
+    except (ValueError, KeyError):
+        raise ValueError(f"Bad rate limit {rule!r}, expected e.g. 5/minute")
+    return count / seconds, count
+
+
+def configured_rule(name, default):
+    #RATE_LIMIT_REGISTER=10/minute overrides the default of the "register" limit
+    return os.getenv(f"RATE_LIMIT_{name.upper()}", default)
+
+
+class MemoryBackend:
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        #key -> [tokens, last refill], least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        #returns (allowed, seconds until cost tokens are available)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, 0
+            return False, (cost - bucket[0]) / rate
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets)}
+
+
+_REDIS_TAKE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed, retry = 0, 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBackend:
+    #same bucket math as MemoryBackend in one Lua script, so workers share limits atomically
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, retry = self._take(keys=[self.prefix + key], args=[rate, burst, cost])
+        return bool(allowed), float(retry)
+
+    def stats(self):
+        return {}
+
+
+def create_backend(storage=RATE_LIMIT_STORAGE):
+    if storage.startswith("redis://") or storage.startswith("rediss://"):
+        return RedisBackend(storage)
+    return MemoryBackend()
+
+
+backend = create_backend()
+
+
+def check(rule_name, rate, burst, key):
+    try:
+        allowed, retry_after = backend.take(f"{rule_name}:{key}", rate, burst)
+    except Exception:
+        #a shared backend that is down should not take the API with it
+        logging.error(f"Rate limit backend failed for {rule_name}, letting the request through:", exc_info=True)
+        return True, 0
+    if not allowed:
+        rate_limited.inc(rule_name)
+    return allowed, retry_after
+
+
+def client_key():
+    user = getattr(g, "user", None)
+    if user and user.get("uid"):
+        return "uid:" + user["uid"]
+    return "ip:" + (request.remote_addr or "unknown")
+
+
+def _retry_header(retry_after):
+    return str(max(1, math.ceil(retry_after)))
+
+
+def rate_limit(name, default):
+    #goes under @require_auth so authenticated callers are limited per uid
+    rate, burst = parse_rule(configured_rule(name, default))
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+            allowed, retry_after = check(name, rate, burst, client_key())
+            if not allowed:
+                response = jsonify({"error": "Too many requests", "retry_after": round(retry_after, 3)})
+                response.status_code = 429
+                response.headers["Retry-After"] = _retry_header(retry_after)
+                return response
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def socket_rate_limit(name, default):
+    #per connection, the client gets a 'rate_limited' event instead of the handler running
+    rate, burst = parse_rule(configured_rule(name, default))
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+            allowed, retry_after = check(name, rate, burst, "sid:" + request.sid)
+            if not allowed:
+                emit("rate_limited", {"event": name, "retry_after": round(retry_after, 3)})
+                return None
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class AdmissionControl:
+    def __init__(self, limit=MAX_CONCURRENT_REQUESTS, wait=ADMISSION_WAIT):
+        self.limit = limit
+        self.wait = wait
+        self.enabled = limit > 0
+        #one lock for the counter and the waiters, cheaper than a Semaphore plus a stats lock
+        self._cond = threading.Condition(threading.Lock())
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+
+    def acquire(self):
+        with self._cond:
+            if self.in_flight >= self.limit:
+                if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout=self.wait):
+                    self.shed += 1
+                    requests_shed.inc()
+                    return False
+            self.in_flight += 1
+            if self.in_flight > self.peak:
+                self.peak = self.in_flight
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {"limit": self.limit, "in_flight": self.in_flight, "peak": self.peak, "shed": self.shed}
+
+
+admission = AdmissionControl()
+
+
+def limiter_stats():
+    stats = admission.stats()
+    stats["enabled"] = RATE_LIMIT_ENABLED
+    stats.update(backend.stats())
+    return stats
+
+
+class AdmissionMiddleware:
+    #WSGI level so shed requests never build a Flask context, and a slot is held until the
+    #response body is fully sent (streamed lists included)
+    def __init__(self, wsgi_app, control, exempt=()):
+        self.wsgi_app = wsgi_app
+        self.control = control
+        self.exempt = set(exempt)
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") in self.exempt:
+            return self.wsgi_app(environ, start_response)
+        if not self.control.acquire():
+            body = b'{"error":"Server busy, try again shortly"}\n'
+            start_response("503 SERVICE UNAVAILABLE", [("Content-Type", "application/json"),
+                                                       ("Content-Length", str(len(body))), ("Retry-After", "1")])
+            return [body]
+        try:
+            return ClosingIterator(self.wsgi_app(environ, start_response), self.control.release)
+        except BaseException:
+            self.control.release()
+            raise
+
+
+def init_app(app, exempt=()):
+    #exempt paths (metrics, pool stats) still answer when the app is saturated
+    #call before SocketIO(app) so Socket.IO traffic, which wraps outside this, is not counted
+    if admission.enabled:
+        app.wsgi_app = AdmissionMiddleware(app.wsgi_app, admission, exempt)
@@ -0,0 +1,212 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import partial
+
+from flask import request, has_request_context
+
+from db import ConnectionPool, get_db_connection, _connect
+
+#read/write splitting, writes and background jobs keep using get_db_connection() (the primary),
+#GET handlers call get_read_connection() which picks a replica round robin
+#a replica is skipped while it is unreachable, replication is stopped or it lags more than
+#DB_REPLICA_MAX_LAG seconds, with none left reads go to the primary
+#after a client writes, its reads stay on the primary for DB_STICKY_SECONDS so it sees its own writes
+#(keyed by the caller's bearer token, or its address for anonymous calls, see _client(); serve.py's sticky
+#load balancing keeps a client on one worker)
+
+#host[:port],host[:port]
+DB_REPLICA_HOSTS = os.getenv("DB_REPLICA_HOSTS", "")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+DB_STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "5"))
+#clients tracked for stickiness, expired entries are dropped when this is reached
+DB_STICKY_MAX_CLIENTS = int(os.getenv("DB_STICKY_MAX_CLIENTS", "100000"))
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def parse_hosts(value):
+    hosts = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.partition(":")
+        hosts.append((host, int(port or 3306)))
+    return hosts
+
+
+def replication_lag(conn):
+    #seconds behind the primary, None when replication is not running
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            #MariaDB and MySQL before 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not row:
+        return None
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return float(lag) if lag is not None else None
+
+
+class Replica:
+    def __init__(self, host, port, pool):
+        self.name = f"{host}:{port}"
+        self.pool = pool
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+
+class ReplicaSet:
+    def __init__(self, hosts, connect=_connect, max_lag=DB_REPLICA_MAX_LAG, lag_probe=replication_lag):
+        #connect(host, port) and lag_probe(conn) can be swapped for fakes
+        self.replicas = [Replica(host, port, ConnectionPool(connect=partial(connect, host, port))) for host, port in hosts]
+        self.max_lag = max_lag
+        self.lag_probe = lag_probe
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "sticky_reads": 0, "fallbacks": 0, "checks": 0}
+
+    def _bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                conn = replica.pool.connection()
+                try:
+                    lag = self.lag_probe(conn)
+                finally:
+                    conn.close()
+                replica.lag = lag
+                replica.error = None if lag is not None else "replication not running"
+                healthy = lag is not None and lag <= self.max_lag
+            except Exception as e:
+                replica.lag = None
+                replica.error = str(e)
+                healthy = False
+            if healthy != replica.healthy:
+                logging.warning(f"Replica {replica.name} is now {'healthy' if healthy else 'unhealthy'} "
+                                f"(lag={replica.lag}, error={replica.error})")
+            replica.healthy = healthy
+            replica.checked_at = time.time()
+        self._bump("checks")
+
+    def choose(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        with self._lock:
+            self._next = (self._next + 1) % len(healthy)
+            return healthy[self._next]
+
+    def connection(self, sticky=False):
+        if sticky:
+            self._bump("sticky_reads")
+            return get_db_connection()
+        replica = self.choose()
+        if replica is None:
+            self._bump("fallbacks" if self.replicas else "primary_reads")
+            return get_db_connection()
+        try:
+            conn = replica.pool.connection()
+        except Exception as e:
+            #take it out until the next check says otherwise
+            logging.warning(f"Replica {replica.name} failed, reading from the primary: {e}")
+            replica.healthy = False
+            replica.error = str(e)
+            self._bump("fallbacks")
+            return get_db_connection()
+        self._bump("replica_reads")
+        return conn
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["replicas"] = len(self.replicas)
+        stats["healthy"] = sum(1 for r in self.replicas if r.healthy)
+        return stats
+
+    def status(self):
+        stats = self.stats()
+        stats["members"] = [
+            {"name": r.name, "healthy": r.healthy, "lag": r.lag, "error": r.error, "checked_at": r.checked_at,
+             "pool": r.pool.stats()}
+            for r in self.replicas
+        ]
+        return stats
+
+
+replica_set = ReplicaSet(parse_hosts(DB_REPLICA_HOSTS))
+
+#client -> monotonic time until which its reads go to the primary
+_recent_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _client():
+    #the token is the same on the write and on the reads after it, whether or not the read route checks it.
+    #a write only marks the key after it succeeded, and write routes verify the token they get.
+    #anonymous callers fall back to their address, which is the proxy's unless TRUSTED_PROXIES is set (app.py)
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return "token:" + hashlib.sha256(header.encode()).hexdigest()[:32]
+    return "ip:" + (request.remote_addr or "unknown")
+
+
+def mark_write(client, seconds=DB_STICKY_SECONDS):
+    now = time.monotonic()
+    with _writers_lock:
+        if len(_recent_writers) >= DB_STICKY_MAX_CLIENTS:
+            for key in [k for k, until in _recent_writers.items() if until <= now]:
+                del _recent_writers[key]
+        _recent_writers[client] = now + seconds
+
+
+def is_sticky(client):
+    until = _recent_writers.get(client)
+    return until is not None and until > time.monotonic()
+
+
+def get_read_connection():
+    #same contract as get_db_connection(), close() when done
+    if not replica_set.replicas:
+        return get_db_connection()
+    sticky = has_request_context() and is_sticky(_client())
+    return replica_set.connection(sticky=sticky)
+
+
+def _monitor_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            replica_set.check()
+        except Exception:
+            logging.error("Replica check failed:", exc_info=True)
+
+
+def start_monitor(interval=DB_REPLICA_CHECK_INTERVAL):
+    if not replica_set.replicas:
+        return
+    #first check before serving so reads only go to replicas known to be good
+    replica_set.check()
+    threading.Thread(target=_monitor_loop, args=(interval,), name="replica-monitor", daemon=True).start()
+
+
+def init_app(app):
+    @app.after_request
+    def _remember_writer(response):
+        if replica_set.replicas and request.method in WRITE_METHODS and response.status_code < 400:
+            mark_write(_client())
+        return response
@@ -0,0 +1,169 @@
+import os
+import json
+import logging
+
+from review_stats import reviews_added
+
+#bulk review ingestion for the partner feed, POST /reviews/bulk
+#the body is a JSON array or NDJSON (Content-Type: application/x-ndjson, read line by line) and is
+#processed REVIEW_IMPORT_CHUNK_SIZE rows at a time: one validation pass, one executemany and one
+#book_review_stats update per chunk, each chunk in its own transaction
+#bad rows are reported by position and skipped, the rest of the batch still goes in
+
+REVIEW_IMPORT_CHUNK_SIZE = int(os.getenv("REVIEW_IMPORT_CHUNK_SIZE", "1000"))
+REVIEW_IMPORT_MAX_ROWS = int(os.getenv("REVIEW_IMPORT_MAX_ROWS", "100000"))
+#errors listed in the response, the counts always cover every row
+REVIEW_IMPORT_MAX_ERRORS = int(os.getenv("REVIEW_IMPORT_MAX_ERRORS", "1000"))
+#reviews.review is TEXT
+REVIEW_MAX_BYTES = 65535
+
+INSERT_REVIEW = "INSERT INTO bookreview_DB.reviews (id, review, stars, bookID) VALUES (%s, %s, %s, %s)"
+
+
+class ReviewImportError(ValueError):
+    pass
+
+
+def iter_json_array(stream):
+    try:
+        rows = json.load(stream)
+    except ValueError:
+        raise ReviewImportError("Body must be a JSON array of reviews")
+    if not isinstance(rows, list):
+        raise ReviewImportError("Body must be a JSON array of reviews")
+    if len(rows) > REVIEW_IMPORT_MAX_ROWS:
+        raise ReviewImportError(f"At most {REVIEW_IMPORT_MAX_ROWS} reviews per request")
+    return enumerate(rows)
+
+
+def iter_ndjson(stream):
+    #blank lines are skipped but still counted so row numbers match line numbers
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, None
+
+
+def as_int(value):
+    #bools are ints in python, "4" from a CSV export is fine
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def check_row(row):
+    #returns ((id, review, stars, bookID), None) or (None, error)
+    if not isinstance(row, dict):
+        return None, "not a JSON object"
+    user_id = as_int(row.get("id"))
+    if user_id is None:
+        return None, "id must be an integer"
+    book_id = as_int(row.get("bookID"))
+    if book_id is None:
+        return None, "bookID must be an integer"
+    stars = as_int(row.get("stars"))
+    if stars is None or not 1 <= stars <= 5:
+        return None, "stars must be an integer from 1 to 5"
+    review = row.get("review")
+    if not isinstance(review, str) or not review.strip():
+        return None, "review must be a non-empty string"
+    if len(review.encode()) > REVIEW_MAX_BYTES:
+        return None, f"review is longer than {REVIEW_MAX_BYTES} bytes"
+    return (user_id, review, stars, book_id), None
+
+
+def _existing(cursor, table, column, values):
+    if not values:
+        return set()
+    values = list(values)
+    cursor.execute(
+        f"SELECT {column} FROM bookreview_DB.{table} WHERE {column} IN ({', '.join(['%s'] * len(values))})",
+        values
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def validate_chunk(cursor, chunk):
+    #field checks row by row, then one lookup each for the chunk's books and users
+    candidates, errors = [], []
+    for index, row in chunk:
+        values, error = check_row(row)
+        if error:
+            errors.append((index, error))
+        else:
+            candidates.append((index, values))
+
+    books = _existing(cursor, "books", "objectID", {values[3] for _, values in candidates})
+    users = _existing(cursor, "users", "id", {values[0] for _, values in candidates})
+
+    valid = []
+    for index, values in candidates:
+        if values[3] not in books:
+            errors.append((index, f"book {values[3]} does not exist"))
+        elif values[0] not in users:
+            errors.append((index, f"user {values[0]} does not exist"))
+        else:
+            valid.append((index, values))
+    return valid, errors
+
+
+def insert_chunk(conn, chunk):
+    #returns (inserted count, [(row index, error)]), a failed chunk is rolled back on its own
+    cursor = conn.cursor()
+    valid, errors = [], []
+    try:
+        conn.start_transaction()
+        valid, errors = validate_chunk(cursor, chunk)
+        if valid:
+            cursor.executemany(INSERT_REVIEW, [values for _, values in valid])
+            reviews_added(cursor, [(values[3], values[2]) for _, values in valid])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Review import chunk of {len(chunk)} rows failed:", exc_info=True)
+        failed = {index for index, _ in errors}
+        errors = errors + [(index, f"not inserted: {e}") for index, _ in chunk if index not in failed]
+        return 0, errors
+    finally:
+        cursor.close()
+    return len(valid), errors
+
+
+def import_reviews(conn, rows, chunk_size=REVIEW_IMPORT_CHUNK_SIZE):
+    #rows is an iterable of (row number, parsed row or None when the line was not valid JSON)
+    result = {"received": 0, "inserted": 0, "failed": 0, "errors": [], "truncated": False}
+
+    def record(inserted, errors):
+        result["inserted"] += inserted
+        result["failed"] += len(errors)
+        room = REVIEW_IMPORT_MAX_ERRORS - len(result["errors"])
+        result["errors"].extend({"row": index, "error": error} for index, error in sorted(errors)[:max(room, 0)])
+
+    chunk = []
+    for index, row in rows:
+        if result["received"] >= REVIEW_IMPORT_MAX_ROWS:
+            #NDJSON has no length up front, stop reading instead of holding the connection forever
+            result["truncated"] = True
+            break
+        result["received"] += 1
+        if row is None:
+            record(0, [(index, "invalid JSON")])
+            continue
+        chunk.append((index, row))
+        if len(chunk) == chunk_size:
+            record(*insert_chunk(conn, chunk))
+            chunk = []
+    if chunk:
+        record(*insert_chunk(conn, chunk))
+
+    result["errors"].sort(key=lambda error: error["row"])
+    result["errors_truncated"] = result["failed"] > len(result["errors"])
+    return result
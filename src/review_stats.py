@@ -0,0 +1,178 @@
+import sys
+import argparse
+
+from db import get_db_connection
+from replicas import get_read_connection
+
+#per-book review aggregates in book_review_stats (migrations/005_book_review_stats.sql)
+#comment(), delete_review() and review_import.py update the row in the same transaction as the reviews,
+#`python review_stats.py rebuild` recomputes everything and `check` reports drift
+
+STAR_VALUES = [1, 2, 3, 4, 5]
+HISTOGRAM_COLUMNS = [f"stars_{n}" for n in STAR_VALUES]
+
+
+def _histogram_params(stars, sign=1):
+    return [sign if stars == n else 0 for n in STAR_VALUES]
+
+
+def review_added(cursor, book_id, stars):
+    cursor.execute(f"""
+        INSERT INTO bookreview_DB.book_review_stats
+            (bookID, review_count, stars_sum, {', '.join(HISTOGRAM_COLUMNS)}, latest_review_at)
+        VALUES (%s, 1, %s, {', '.join(['%s'] * len(STAR_VALUES))}, NOW())
+        ON DUPLICATE KEY UPDATE
+            review_count = review_count + 1,
+            stars_sum = stars_sum + VALUES(stars_sum),
+            {', '.join(f'{c} = {c} + VALUES({c})' for c in HISTOGRAM_COLUMNS)},
+            latest_review_at = NOW()
+    """, [book_id, stars or 0] + _histogram_params(stars))
+
+
+def reviews_added(cursor, reviews):
+    #bulk version of review_added, reviews is [(book_id, stars)], one statement for all the books in it
+    per_book = {}
+    for book_id, stars in reviews:
+        totals = per_book.setdefault(book_id, [0, 0] + [0] * len(STAR_VALUES))
+        totals[0] += 1
+        totals[1] += stars or 0
+        for i, value in enumerate(_histogram_params(stars)):
+            totals[2 + i] += value
+    if not per_book:
+        return 0
+
+    row = f"(%s, {', '.join(['%s'] * (2 + len(STAR_VALUES)))}, NOW())"
+    params = []
+    for book_id, totals in per_book.items():
+        params.append(book_id)
+        params.extend(totals)
+    cursor.execute(f"""
+        INSERT INTO bookreview_DB.book_review_stats
+            (bookID, review_count, stars_sum, {', '.join(HISTOGRAM_COLUMNS)}, latest_review_at)
+        VALUES {', '.join([row] * len(per_book))}
+        ON DUPLICATE KEY UPDATE
+            review_count = review_count + VALUES(review_count),
+            stars_sum = stars_sum + VALUES(stars_sum),
+            {', '.join(f'{c} = {c} + VALUES({c})' for c in HISTOGRAM_COLUMNS)},
+            latest_review_at = NOW()
+    """, params)
+    return len(per_book)
+
+
+def review_removed(cursor, book_id, stars):
+    cursor.execute(f"""
+        UPDATE bookreview_DB.book_review_stats
+        SET review_count = review_count - 1,
+            stars_sum = stars_sum - %s,
+            {', '.join(f'{c} = {c} - %s' for c in HISTOGRAM_COLUMNS)},
+            latest_review_at = (SELECT MAX(created_at) FROM bookreview_DB.reviews WHERE bookID = %s)
+        WHERE bookID = %s
+    """, [stars or 0] + _histogram_params(stars) + [book_id, book_id])
+
+
+def get_book_stats(book_id):
+    conn = get_read_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT review_count, stars_sum, {', '.join(HISTOGRAM_COLUMNS)}, latest_review_at
+            FROM bookreview_DB.book_review_stats WHERE bookID = %s
+        """, (book_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return format_stats(book_id, row)
+
+
+def format_stats(book_id, row):
+    if not row or not row["review_count"]:
+        return {"bookID": book_id, "count": 0, "average": None,
+                "histogram": {str(n): 0 for n in STAR_VALUES}, "latest_review_at": None}
+
+    latest = row["latest_review_at"]
+    return {
+        "bookID": book_id,
+        "count": row["review_count"],
+        "average": round(row["stars_sum"] / row["review_count"], 2),
+        "histogram": {str(n): row[f"stars_{n}"] for n in STAR_VALUES},
+        "latest_review_at": latest.strftime('%Y-%m-%d %H:%M:%S') if latest else None,
+    }
+
+
+AGGREGATE_SELECT = f"""
+    SELECT bookID, COUNT(*), COALESCE(SUM(stars), 0),
+        {', '.join(f'SUM(stars = {n})' for n in STAR_VALUES)}, MAX(created_at)
+    FROM bookreview_DB.reviews
+    GROUP BY bookID
+"""
+
+
+def rebuild():
+    #recompute every row from reviews in one transaction
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM bookreview_DB.book_review_stats")
+        cursor.execute(f"""
+            INSERT INTO bookreview_DB.book_review_stats
+                (bookID, review_count, stars_sum, {', '.join(HISTOGRAM_COLUMNS)}, latest_review_at)
+            {AGGREGATE_SELECT}
+        """)
+        rebuilt = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return rebuilt
+
+
+def check():
+    #compare stored aggregates with a fresh GROUP BY, returns the books that drifted
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(AGGREGATE_SELECT)
+        expected = {row[0]: tuple(int(v) for v in row[1:-1]) for row in cursor.fetchall()}
+        cursor.execute(f"""
+            SELECT bookID, review_count, stars_sum, {', '.join(HISTOGRAM_COLUMNS)}
+            FROM bookreview_DB.book_review_stats
+        """)
+        stored = {row[0]: tuple(int(v) for v in row[1:]) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+    drift = []
+    for book_id in set(expected) | set(stored):
+        #a stored row with zero reviews is the same as no row
+        want = expected.get(book_id)
+        have = stored.get(book_id)
+        if have is not None and have[0] == 0:
+            have = None
+        if want != have:
+            drift.append({"bookID": book_id, "expected": want, "stored": have})
+    return drift
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Backfill or verify book_review_stats")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Rebuilt review stats for {rebuild()} books")
+    else:
+        drift = check()
+        for entry in drift:
+            print(entry)
+        print(f"{len(drift)} books out of sync")
+        sys.exit(1 if drift else 0)
@@ -0,0 +1,166 @@
+import os
+
+from flask import Blueprint, request, jsonify
+
+from db import get_db_connection
+from replicas import get_read_connection
+from pagination import list_resource, fetch_all, BOOKS, ARCHIVED_BOOKS
+from streaming import wants_stream, stream_response
+from encoding import respond
+from cache import cached_json, invalidate
+from auth_tokens import require_auth
+from archive import archive_ids, unarchive_ids, bulk_archive, bulk_unarchive, parse_ids
+from search import book_index, SearchError, SEARCH_DEFAULT_LIMIT
+
+bp = Blueprint("books", __name__)
+
+#how long a search waits for the first load before answering 503
+SEARCH_READY_TIMEOUT = float(os.getenv("SEARCH_READY_TIMEOUT", "2"))
+
+#route to display books
+@bp.route('/books', methods=['GET'])
+def get_books():
+    #full catalog streamed in fetchmany() batches, skips the cache
+    if wants_stream():
+        return stream_response(BOOKS, request.args)
+
+    def build():
+        conn = get_read_connection()
+        try:
+            #supports ?limit=&after=&sort=&fields=, see pagination.py
+            return list_resource(conn, BOOKS, request.args)
+        finally:
+            conn.close()
+
+    #catalog rarely changes, served from cache.py with an ETag
+    return cached_json("books", build)
+
+#route to search books by title/author/genre, answered from the in-memory index in search.py
+@bp.route('/books/search', methods=['GET'])
+def search_books():
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    if not book_index.wait_ready(SEARCH_READY_TIMEOUT):
+        return jsonify({"error": "Search index is still loading"}), 503
+
+    try:
+        #?q= matches word prefixes, ?genre= filters, ?sort=points|ranking|num_comments (default relevance)
+        result = book_index.search(
+            q=request.args.get('q', ''),
+            genre=request.args.get('genre'),
+            sort=request.args.get('sort'),
+            limit=limit,
+        )
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return respond(result)
+
+#route to display a single book
+@bp.route('/books/<int:id>', methods=['GET'])
+def get_book(id):
+    def build():
+        conn = get_read_connection()
+        try:
+            rows = fetch_all(conn, BOOKS, request.args, where="objectID = %s", params=(id,))
+        finally:
+            conn.close()
+        return rows[0] if rows else None
+
+    #cached per book so invalidating one book leaves the rest alone
+    return cached_json(f"book:{id}", build, not_found="Book not found")
+
+#API for handling bookmarks, adding
+@bp.route('/books/archive/<int:id>', methods=['POST'])
+@require_auth
+def archive_book(id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        #copy the book into archived_books in one INSERT ... SELECT, archiving twice is a no-op
+        if archive_ids(cursor, [id]):
+            conn.commit()
+            invalidate("archive")
+
+        return jsonify({"message": "Book archived successfully"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+#API for handling bookmarks, removing
+@bp.route('/books/archive/<int:id>', methods=['DELETE'])
+@require_auth
+def unarchive_book(id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        #delete the book from the archived_books table based on objectID
+        if unarchive_ids(cursor, [id]):
+            conn.commit()
+            invalidate("archive")
+
+        return jsonify({"message": "Book unarchived successfully"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+#API for bookmarking a list of books in one transaction, body is {"ids": [...]}
+@bp.route('/books/archive', methods=['POST'])
+@require_auth
+def archive_books():
+    ids = parse_ids(request.get_json(silent=True))
+
+    conn = get_db_connection()
+    try:
+        results = bulk_archive(conn, ids)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+    invalidate("archive")
+    #per id: archived, already_archived or not_found
+    return jsonify({"results": {str(i): outcome for i, outcome in results.items()}}), 200
+
+#API for removing a list of bookmarks in one transaction
+@bp.route('/books/archive', methods=['DELETE'])
+@require_auth
+def unarchive_books():
+    ids = parse_ids(request.get_json(silent=True))
+
+    conn = get_db_connection()
+    try:
+        results = bulk_unarchive(conn, ids)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+
+    invalidate("archive")
+    #per id: unarchived or not_archived
+    return jsonify({"results": {str(i): outcome for i, outcome in results.items()}}), 200
+
+#route to display archived books
+@bp.route('/books/archive', methods=['GET'])
+def get_archived_books():
+    def build():
+        conn = get_read_connection()
+        try:
+            #selecting from the archived books table
+            return list_resource(conn, ARCHIVED_BOOKS, request.args)
+        finally:
+            conn.close()
+
+    #cleared by archive_book / unarchive_book
+    return cached_json("archive", build)
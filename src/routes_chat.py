@@ -0,0 +1,243 @@
+import os
+import time
+import logging
+
+from flask import Blueprint, request, jsonify, g
+from flask_socketio import SocketIO, join_room, leave_room, send, emit
+
+from metrics import timed_event
+from db import get_db_connection
+from encoding import respond
+#chat messages are persisted write-behind
+from chat_writer import message_writer
+from history import conversation_history, HISTORY_DEFAULT_LIMIT
+from conversations import get_or_create_conversation, conversation_members
+from auth_tokens import require_auth
+from profiles import get_profiles
+from ratelimit import rate_limit, socket_rate_limit
+from background import start_background
+#who is in which room, unread counts and batched emits, see presence.py, unread.py and fanout.py
+from presence import presence, start_sweeper
+from unread import unread_counters
+from fanout import FanOut
+
+bp = Blueprint("chat", __name__)
+
+#bound to the app in create_app(), which also picks the async mode and message queue
+socketio = SocketIO()
+
+#the free-text join/leave notices and the bare 'message' string, for clients that do not read
+#the 'messages' / 'presence' / 'unread' events yet. Off by default, every message would go out twice
+CHAT_LEGACY_EVENTS = os.getenv("CHAT_LEGACY_EVENTS", "false").lower() in ("1", "true", "yes")
+
+
+def _emit_batch(event, items, room):
+    socketio.emit(event, items, to=room)
+
+
+fanout = FanOut(_emit_batch)
+
+
+def user_room(user_id):
+    #every socket of a user joins this, unread counts are sent there
+    return f"user_{user_id}"
+
+
+def publish_presence(room, user_id, online):
+    #keyed by user so a quick leave + join reaches the room as one update
+    fanout.publish(room, "presence", {"room": room, "user_id": user_id, "online": online}, key=user_id)
+
+
+def publish_offline(pairs):
+    for room, user_id in pairs:
+        publish_presence(room, user_id, False)
+
+
+def publish_unread(user_id, conversation_id, count):
+    fanout.publish(user_room(user_id), "unread", {"conversation_id": conversation_id, "unread": count},
+                   key=conversation_id)
+
+
+def realtime_stats():
+    return {"presence": presence.stats(), "fanout": fanout.stats(), "unread": unread_counters.stats()}
+
+
+def caller_id():
+    #users.id of the verified caller (after require_auth), None without a token or before the user is synced
+    if g.user is None:
+        return None
+    profile = get_profiles([], [g.user["uid"]])["uids"].get(g.user["uid"])
+    return profile["id"] if profile else None
+
+@bp.route('/message', methods=['POST'])
+def message_user():
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.close()
+
+@bp.route('/chat', methods=['POST'])
+@require_auth
+@rate_limit("chat", "60/minute")
+def create_chat():
+    data = request.json
+    user_id = data.get("user_id")
+    target_user_id = data.get("target_user_id")
+
+    if user_id is None or target_user_id is None:
+        return jsonify({"error": "user_id and target_user_id are required"}), 400
+    try:
+        user_id, target_user_id = int(user_id), int(target_user_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "user_id and target_user_id must be integers"}), 400
+    if user_id == target_user_id:
+        return jsonify({"error": "Cannot start a chat with yourself"}), 400
+
+    #find or create the conversation, usually answered from the pair cache without a query
+    conversation_id = get_or_create_conversation(user_id, target_user_id)
+    room_name = f"conversation_{conversation_id}"
+
+    #return room name to frontend
+    return jsonify({"room": room_name})
+
+#route to load a conversation's messages, newest first
+@bp.route('/conversations/<int:conversation_id>/messages', methods=['GET'])
+@require_auth
+def get_messages(conversation_id):
+    try:
+        limit = int(request.args.get('limit', HISTORY_DEFAULT_LIMIT))
+        before = request.args.get('before')
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({"error": "limit and before must be integers"}), 400
+
+    #with a token only the two participants may read the conversation
+    if g.user is not None:
+        members = conversation_members(conversation_id)
+        if members is None:
+            return jsonify({"error": "Conversation not found"}), 404
+        if caller_id() not in members:
+            return jsonify({"error": "Not a participant in this conversation"}), 403
+
+    #pass next_cursor back as ?before= to get older messages
+    return respond(conversation_history.page(conversation_id, before, limit))
+
+#route to show presence, fan-out batching and unread counter stats
+@bp.route('/chat/realtime', methods=['GET'])
+def get_realtime_stats():
+    return jsonify(realtime_stats())
+
+#route to show the users online in a conversation (on this worker)
+@bp.route('/conversations/<int:conversation_id>/presence', methods=['GET'])
+@require_auth
+def get_presence(conversation_id):
+    room = f"conversation_{conversation_id}"
+    return jsonify({"room": room, "online": presence.online(room)})
+
+#route to show a user's unread message counts per conversation
+@bp.route('/users/<int:id>/unread', methods=['GET'])
+@require_auth
+def get_unread(id):
+    #with a token a user may only read their own counts
+    if g.user is not None and caller_id() != id:
+        return jsonify({"error": "Cannot read another user's unread counts"}), 403
+    return jsonify({str(conversation_id): n for conversation_id, n in unread_counters.counts(id).items()})
+
+#Socket.IO connects skip Flask's before_request, so the first one starts the workers too
+@socketio.on('connect')
+def handle_connect():
+    start_background()
+    #drops users whose client stopped sending heartbeats without disconnecting
+    start_sweeper(publish_offline)
+
+@socketio.on('disconnect')
+def handle_disconnect(reason=None):
+    publish_offline(presence.disconnect(request.sid))
+
+#data: {"room", "username", "user_id"}, user_id is needed for presence by id and unread counts
+@socketio.on('join')
+@timed_event('join')
+def handle_join(data):
+    room = data['room']
+    join_room(room)
+    if CHAT_LEGACY_EVENTS:
+        send(f"{data['username']} has joined the room.", room=room)
+
+    #older clients only send a username, they get presence under that name and no unread counts
+    user_id = data.get('user_id')
+    presence_id = user_id if user_id is not None else data['username']
+    if presence.join(request.sid, room, presence_id):
+        publish_presence(room, presence_id, True)
+    emit('presence_state', {"room": room, "online": presence.online(room)})
+
+    #send the latest messages to the user who joined, usually straight from the ring buffer
+    conversation_id = int(data['room'].split('_')[-1])
+    try:
+        emit('history', conversation_history.page(conversation_id))
+    except Exception:
+        logging.error("Error loading history:", exc_info=True)
+
+    if user_id is not None:
+        join_room(user_room(user_id))
+        #the history above is the conversation read
+        unread_counters.mark_read(user_id, conversation_id)
+        try:
+            emit('unread', [{"conversation_id": c, "unread": n} for c, n in unread_counters.counts(user_id).items()])
+        except Exception:
+            logging.error("Error loading unread counts:", exc_info=True)
+
+#data: {"room", "message", "sender_id", "receiver_id", "client_id" (optional, echoed back)}
+@socketio.on('message')
+@timed_event('message')
+@socket_rate_limit("message", "10/second")
+def handle_message(data):
+    room = data['room']
+    message_text = data['message']
+    sender_id = data['sender_id']
+    receiver_id = data['receiver_id']
+    #extract conversation_id from room name
+    conversation_id = int(data['room'].split('_')[-1])  
+    delivery = {"sent_at": int(time.time() * 1000), "client_id": data.get('client_id')}
+
+    # Broadcast message to the room, batched with whatever else arrives within the fan-out window
+    if CHAT_LEGACY_EVENTS:
+        send(message_text, room=room)
+    fanout.publish(room, "messages", {"conversation_id": conversation_id, "sender_id": sender_id,
+                                      "receiver_id": receiver_id, "message": message_text, **delivery})
+
+    #stored afterwards in batches by chat_writer.py
+    message_writer.write(sender_id, receiver_id, message_text, conversation_id)
+
+    presence.heartbeat(request.sid)
+    if not presence.is_online(room, receiver_id):
+        try:
+            publish_unread(receiver_id, conversation_id, unread_counters.increment(receiver_id, conversation_id))
+        except Exception:
+            logging.error("Error counting unread message:", exc_info=True)
+
+    #ack for the sender's emit callback
+    return delivery
+
+#data: {"conversation_id", "user_id"}, when the user has seen the conversation's messages
+@socketio.on('read')
+@timed_event('read')
+def handle_read(data):
+    conversation_id = int(data['conversation_id'])
+    unread_counters.mark_read(data['user_id'], conversation_id)
+    publish_unread(data['user_id'], conversation_id, 0)
+
+#clients send this every PRESENCE_TTL / 2 seconds or so, {"ok": false} means join again
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    return {"ok": presence.heartbeat(request.sid)}
+
+@socketio.on('leave')
+@timed_event('leave')
+def handle_leave(data):
+    room = data['room']
+    leave_room(room)
+    if CHAT_LEGACY_EVENTS:
+        send(f"{data['username']} has left the room.", room=room)
+
+    user_id = presence.leave(request.sid, room)
+    if user_id is not None:
+        publish_presence(room, user_id, False)
@@ -0,0 +1,77 @@
+import os
+
+from flask import Blueprint, jsonify, Response
+
+import metrics
+from db import pool_stats
+from replicas import replica_set
+from cache import catalog_cache
+from mailer import outbox_stats
+from chat_writer import message_writer
+from history import conversation_history
+from search import book_index
+from ratelimit import limiter_stats
+from profiles import profile_stats
+
+#health and stats endpoints, exempt from admission control (see create_app() in app.py)
+bp = Blueprint("ops", __name__)
+
+@bp.get("/") # Like flask, declares get method and url
+def root(): # dBecause we use ASGI, async is added here. If the 3rd party does not support it, then remove async
+    host=os.getenv("DB_HOST", "localhost"),  # You can change 'localhost' to the service name 'db' if you're using Docker for MySQL.
+    user=os.getenv("DB_USER", "user"),
+    password=os.getenv("DB_PASSWORD", "userpassword"),
+    database=os.getenv("DB_NAME", "bookreview_DB")
+    
+    print(host, user, password)
+    return {"host": host, "user": user, "password": password, "database": database}
+
+#Prometheus text format, stats of the pool, caches and background workers are included as gauges
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+#route to show pool usage, used for sizing DB_POOL_SIZE / DB_POOL_MAX_OVERFLOW
+@bp.route('/db/pool', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_stats())
+
+#route to show email outbox queue depth and send counters
+@bp.route('/mail/outbox', methods=['GET'])
+def get_outbox_stats():
+    return jsonify(outbox_stats())
+
+#route to show chat persistence lag and batch sizes
+@bp.route('/chat/writer', methods=['GET'])
+def get_chat_writer_stats():
+    return jsonify(message_writer.stats())
+
+#route to show conversation ring buffer hits
+@bp.route('/conversations/history/stats', methods=['GET'])
+def get_history_stats():
+    return jsonify(conversation_history.stats())
+
+#route to show search index size
+@bp.route('/books/search/stats', methods=['GET'])
+def get_search_stats():
+    return jsonify(book_index.stats())
+
+#route to show replica health, lag and how reads were routed
+@bp.route('/db/replicas', methods=['GET'])
+def get_replica_stats():
+    return jsonify(replica_set.status())
+
+#route to show catalog cache hit/miss/eviction counters
+@bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(catalog_cache.stats())
+
+#route to show public profile cache hits
+@bp.route('/users/profiles/stats', methods=['GET'])
+def get_profile_stats():
+    return jsonify(profile_stats())
+
+#route to show in-flight requests, shed count and rate limit buckets
+@bp.route('/limits/stats', methods=['GET'])
+def get_limiter_stats():
+    return jsonify(limiter_stats())
@@ -0,0 +1,136 @@
+from flask import Blueprint, request, jsonify
+
+from db import get_db_connection
+from replicas import get_read_connection
+from pagination import list_resource, REVIEWS
+from streaming import wants_stream, stream_response, NDJSON
+from encoding import respond
+from auth_tokens import require_auth
+from review_stats import review_added, review_removed, get_book_stats
+from ratelimit import rate_limit
+from review_import import import_reviews, iter_json_array, iter_ndjson, as_int
+
+bp = Blueprint("reviews", __name__)
+
+# @bp.route('/reviews', methods=['DELETE'])
+# def review():
+#     #add in deleting review and removing it from DB logic
+
+# @bp.route('/users', methods=['PUT'])
+# def profilePic():
+#     #add in inserting links for profile pictures
+
+#////////////////////////////////////////////////////////////////////////////////////////
+#route to display reviews
+@bp.route('/reviews', methods=['GET'])
+def get_reviews():
+    #?bookID= only returns that book's reviews
+    where, params = None, ()
+    bookID = request.args.get('bookID')
+    if bookID is not None:
+        if not bookID.isdigit():
+            return jsonify({"error": "bookID must be an integer"}), 400
+        where, params = "bookID = %s", (int(bookID),)
+
+    if wants_stream():
+        return stream_response(REVIEWS, request.args, where, params)
+
+    conn = get_read_connection()
+    try:
+        # list of dictionaries, or a page with next_cursor
+        result = list_resource(conn, REVIEWS, request.args, where, params)
+    finally:
+        conn.close()
+
+    return respond(result)
+
+#bulk review import for the partner feed, JSON array or NDJSON body, see review_import.py
+@bp.route('/reviews/bulk', methods=['POST'])
+@require_auth
+@rate_limit("reviews_bulk", "10/minute")
+def import_reviews_bulk():
+    if request.mimetype == NDJSON:
+        rows = iter_ndjson(request.stream)
+    else:
+        rows = iter_json_array(request.stream)
+
+    conn = get_db_connection()
+    try:
+        result = import_reviews(conn, rows)
+    finally:
+        conn.close()
+
+    return jsonify(result), 200
+
+#route to display a book's rating summary, one primary key lookup
+@bp.route('/books/<int:id>/ratings', methods=['GET'])
+def get_book_ratings(id):
+    return jsonify(get_book_stats(id))
+
+#API for adding a review
+@bp.route('/comment', methods=['POST'])
+@require_auth
+@rate_limit("comment", "30/minute")
+def comment():
+    data = request.json
+    id = data.get('id')
+    review = data.get('review')
+    stars = data.get('stars')
+    bookID = data.get('bookID')
+
+    #same rules as the bulk import, checked before taking a connection
+    bookID = as_int(bookID)
+    if bookID is None:
+        return jsonify({"error": "bookID must be an integer"}), 400
+    stars = as_int(stars)
+    if stars is None or not 1 <= stars <= 5:
+        return jsonify({"error": "stars must be an integer from 1 to 5"}), 400
+
+    #connect to the database **
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+
+        cursor.execute(
+            #%s is placeholder for string **
+            "INSERT INTO bookreview_DB.reviews (id, review, stars, bookID) VALUES (%s, %s, %s, %s)",
+            (id, review, stars, bookID)
+        )
+        #rating summary is updated in the same transaction
+        review_added(cursor, bookID, stars)
+        conn.commit()
+
+        return jsonify({"message": "User commented successfully"}), 201
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+@bp.route('/remove/<int:id>', methods=['DELETE'])
+@require_auth
+def delete_review(id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        #lock the review so the rating summary is adjusted by exactly what was deleted
+        cursor.execute("SELECT bookID, stars FROM bookreview_DB.reviews WHERE reviewID = %s FOR UPDATE", (id,))
+        review = cursor.fetchone()
+
+        if review:
+            #delete the review based on reviewID
+            cursor.execute("DELETE FROM bookreview_DB.reviews WHERE reviewID = %s", (id,))
+            review_removed(cursor, review[0], review[1])
+        conn.commit()
+
+
+        return jsonify({"message": "Review deleted successfully"}), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
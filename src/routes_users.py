@@ -0,0 +1,226 @@
+import logging
+
+from flask import Blueprint, request, jsonify
+
+from metrics import timed_call
+from db import get_db_connection
+from replicas import get_read_connection
+from pagination import list_resource, USERS
+from cache import cached_json, invalidate
+#email is sent by the outbox worker in mailer.py
+from mailer import enqueue_email
+#Firebase is initialized on the first call, see firebase_app.py
+from firebase_app import get_auth
+#Firebase ID tokens are verified locally, see auth_tokens.py
+from auth_tokens import require_auth
+from ratelimit import rate_limit
+from user_sync import sync_status
+from profiles import get_profiles, parse_lookup, invalidate_profile
+
+bp = Blueprint("users", __name__)
+
+#route to display users
+@bp.route('/users', methods=['GET'])
+def get_users():
+    def build():
+        conn = get_read_connection()
+        try:
+            #list of dictionaries, or {"items", "next_cursor"} when limit/after is given
+            return list_resource(conn, USERS, request.args)
+        finally:
+            conn.close()
+
+    return cached_json("users", build)
+
+#route to look up public profiles (username, profilePic) of many users at once, ?ids=1,2,3&uids=abc,def
+#for putting names and pictures next to a page of reviews or a chat room, see profiles.py
+@bp.route('/users/profiles', methods=['GET'])
+def get_user_profiles():
+    ids, uids = parse_lookup(request.args)
+    return jsonify(get_profiles(ids, uids))
+
+@bp.route('/users/<int:id>/profilePic', methods=['PUT'])
+@require_auth
+def update_profilePic(id):
+    data = request.get_json()  # Get the JSON payload from the request
+    profilePic = data.get('profilePic')  # Extract profilePic from the payload
+
+    if not profilePic:
+        return jsonify({"error": "No profilePicture link provided"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+        "UPDATE users SET profilePic = %s WHERE id = %s", (profilePic, id)
+        )
+
+        conn.commit()
+
+        if cursor.rowcount == 0:
+                return jsonify({"error": "User not found"}), 404
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    finally:
+        # Close the cursor and the connection
+        cursor.close()
+        conn.close()
+
+    invalidate("users")
+    invalidate_profile(user_id=id)
+    return jsonify({"message": "Profile picture updated successfully!"}), 200
+
+#API for registering a new user
+@bp.route('/register', methods=['POST'])
+@rate_limit("register", "5/minute")
+def register():
+    #get username, password, and email from the request
+    data = request.json
+    logging.info(f"Incoming registration data: {data}")
+    
+    username = data.get('username')
+    password = data.get('password')
+    email = data.get('email')
+
+    logging.info(f"Registering user - Username: {username}, Email: {email}, Password Length: {len(password) if password else 'N/A'}")
+
+    if not username or not password or not email:
+        return jsonify({"error": "Username, password, and email are required"}), 400
+
+    #firebase email-password authentication 
+    try:
+        auth = get_auth()
+        #attempt to create the user in Firebase
+        try:
+            with timed_call("firebase", "create_user"):
+                user = auth.create_user(email=email, password=password, display_name=username)
+            uid = user.uid
+            logging.info(f"User created in Firebase with UID: {uid}")
+        except auth.EmailAlreadyExistsError:
+            #if user exists, fetch the user and send verification email
+            with timed_call("firebase", "get_user_by_email"):
+                existing_user = auth.get_user_by_email(email)
+            uid = existing_user.uid
+            logging.info(f"User with email {email} already exists in Firebase. Sending verification email.")
+            try:
+                send_verification_email(email, username)
+                #return jsonify({"message": "Verification email resent. Please check your inbox."}), 200
+            except Exception as e:
+                logging.error("Error queueing verification email:", exc_info=True)
+                return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
+        except Exception as e:
+            logging.error("Error creating user in Firebase:", exc_info=True)
+            return jsonify({"error": "Failed to create user in Firebase", "details": str(e)}), 501
+
+    except Exception as e:
+        logging.error("Firebase authentication process failed:", exc_info=True)
+        return jsonify({"error": "Firebase authentication process failed", "details": str(e)}), 500
+
+    #connect to the database and store the user
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        #insert new user into bookreview_DB
+        cursor.execute(
+            "INSERT INTO bookreview_DB.users (username, password, email, uid) VALUES (%s, %s, %s, %s)",
+            (username, password, email, uid)
+        )
+        conn.commit()
+        invalidate("users")
+        invalidate_profile(uid=uid)
+        logging.info(f"User {username} stored in MySQL database with UID: {uid}")
+        return jsonify({"message": "User registered successfully"}), 201
+    except Exception as e:
+        conn.rollback()
+        logging.error("Error storing user in MySQL database:", exc_info=True)
+        return jsonify({"error": "Failed to store user in MySQL database", "details": str(e)}), 501
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def send_verification_email(email, username):
+    #only queues the email, the outbox worker in mailer.py generates the link and sends it
+    enqueue_email("verification", email, username)
+    logging.info(f"Verification email for {email} queued")
+
+# @bp.route('/register', methods=['POST'])
+# def register():
+#     # Get username, password, and email from the request
+#     data = request.json
+#     logging.info(f"Incoming registration data: {data}")
+
+#     username = data.get('username')
+#     password = data.get('password')
+#     email = data.get('email')
+
+#     logging.info(f"Registering user - Username: {username}, Email: {email}, Password Length: {len(password) if password else 'N/A'}")
+
+#     if not username or not password or not email:
+#         return jsonify({"error": "Username, password, and email are required"}), 400
+
+#     # Firebase email-password authentication
+#     try:
+#         # Attempt to create the user in Firebase
+#         try:
+#             user = auth.create_user(email=email, password=password, display_name=username)
+#             uid = user.uid
+#             logging.info(f"User created in Firebase with UID: {uid}")
+
+#             # Generate and send verification email
+#             try:
+#                 verification_link = auth.generate_email_verification_link(email)
+#                 logging.info(f"Verification email sent to {email}")
+#                 return jsonify({"message": "User registered successfully. Verification email sent."}), 201
+#             except Exception as e:
+#                 logging.error("Error sending verification email:", exc_info=True)
+#                 return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
+
+#         except auth.EmailAlreadyExistsError:
+#             # If user exists, fetch the user and send verification email again
+#             existing_user = auth.get_user_by_email(email)
+#             uid = existing_user.uid
+#             logging.info(f"User with email {email} already exists in Firebase. Sending verification email.")
+#             try:
+#                 verification_link = auth.generate_email_verification_link(email)
+#                 logging.info(f"Verification email resent to {email}, {verification_link}")
+#                 return jsonify({"message": "Verification email resent. Please check your inbox."}), 200
+#             except Exception as e:
+#                 logging.error("Error sending verification email:", exc_info=True)
+#                 return jsonify({"error": "Failed to send verification email", "details": str(e)}), 503
+
+#     except Exception as e:
+#         logging.error("Firebase authentication process failed:", exc_info=True)
+#         return jsonify({"error": "Firebase authentication process failed", "details": str(e)}), 500
+
+#     # Connect to the database and store the user
+#     conn = get_db_connection()
+#     cursor = conn.cursor()
+
+#     try:
+#         # Insert new user into bookReview_DB
+#         cursor.execute(
+#             "INSERT INTO bookReview_DB.users (username, password, email, uid) VALUES (%s, %s, %s, %s)",
+#             (username, password, email, uid)
+#         )
+#         conn.commit()
+#         logging.info(f"User {username} stored in MySQL database with UID: {uid}")
+#         return jsonify({"message": "User registered successfully"}), 201
+#     except Exception as e:
+#         conn.rollback()
+#         logging.error("Error storing user in MySQL database:", exc_info=True)
+#         return jsonify({"error": "Failed to store user in MySQL database", "details": str(e)}), 501
+#     finally:
+#         cursor.close()
+#         conn.close()
+
+# Function to log all existing Firebase users
+#last Firebase -> MySQL user sync pass and its drift counts, the job itself is `python user_sync.py`
+@bp.route('/users/sync', methods=['GET'])
+def get_user_sync_status():
+    return jsonify(sync_status())
@@ -0,0 +1,209 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import logging
+import threading
+from collections import defaultdict, Counter
+
+from replicas import get_read_connection
+from pagination import BOOKS
+
+#in-memory inverted index over book title/author/genre for /books/search
+#built from the books table at startup and reloaded every SEARCH_REFRESH_INTERVAL seconds, queries never touch MySQL
+#the app has no write path to the books table (it is loaded by seed/import jobs), so a changed book shows up in
+#search results at most one refresh interval later. upsert()/remove() are there for a caller that changes a
+#book in-process and can't wait for the next reload.
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+#seconds between full reloads from the DB, the most search results lag the books table, 0 loads once at startup
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", "300"))
+
+#a title match counts more than an author match, which counts more than a genre match
+FIELD_WEIGHTS = {"title": 3, "author": 2, "genre": 1}
+
+#sort name -> (book field, highest first)
+SORTS = {
+    "points": ("points", True),
+    "num_comments": ("num_comments", True),
+    #ranking 1 is the top book
+    "ranking": ("ranking", False),
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+class SearchError(ValueError):
+    pass
+
+
+class BookIndex:
+    def __init__(self):
+        self._books = {}
+        #token -> {objectID: weight}
+        self._postings = defaultdict(dict)
+        #sorted tokens, prefix lookups are a bisect range
+        self._vocabulary = []
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+
+    def _add(self, book):
+        object_id = book["objectID"]
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in set(tokenize(book.get(field))):
+                weights[token] += weight
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                bisect.insort(self._vocabulary, token)
+            postings[object_id] = weight
+        self._books[object_id] = book
+
+    def _remove(self, object_id):
+        book = self._books.pop(object_id, None)
+        if book is None:
+            return
+        tokens = {t for field in FIELD_WEIGHTS for t in tokenize(book.get(field))}
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(object_id, None)
+            if not postings:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocabulary, token)
+                if i < len(self._vocabulary) and self._vocabulary[i] == token:
+                    del self._vocabulary[i]
+
+    def upsert(self, book):
+        with self._lock:
+            self._remove(book["objectID"])
+            self._add(book)
+
+    def remove(self, object_id):
+        with self._lock:
+            self._remove(object_id)
+
+    def load(self, books):
+        #build into a fresh index and swap it in, searches keep using the old one meanwhile
+        fresh = BookIndex()
+        for book in books:
+            fresh._add(book)
+        with self._lock:
+            self._books = fresh._books
+            self._postings = fresh._postings
+            self._vocabulary = fresh._vocabulary
+        self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _match_prefix(self, prefix):
+        #union of postings of every token starting with prefix, keeping the best weight
+        matches = {}
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            for object_id, weight in self._postings[self._vocabulary[i]].items():
+                if weight > matches.get(object_id, 0):
+                    matches[object_id] = weight
+            i += 1
+        return matches
+
+    def search(self, q="", genre=None, sort=None, limit=SEARCH_DEFAULT_LIMIT):
+        if sort is not None and sort not in SORTS:
+            raise SearchError(f"Cannot sort by {sort}, options: relevance, {', '.join(SORTS)}")
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        terms = tokenize(q)
+
+        with self._lock:
+            if terms:
+                #every term has to match (as a prefix), scores add up across terms
+                scores = None
+                for term in terms:
+                    matches = self._match_prefix(term)
+                    if scores is None:
+                        scores = matches
+                    else:
+                        scores = {i: s + matches[i] for i, s in scores.items() if i in matches}
+                    if not scores:
+                        break
+            else:
+                scores = dict.fromkeys(self._books, 0)
+
+            books = self._books
+            #facet counts are over the query results before the genre filter
+            facets = Counter(books[i].get("genre") for i in scores)
+            if genre:
+                wanted = genre.lower()
+                scores = {i: s for i, s in scores.items() if str(books[i].get("genre") or "").lower() == wanted}
+
+            if sort is None:
+                key = lambda i: (scores[i], books[i].get("points") or 0)
+                top = heapq.nlargest(limit, scores, key=key)
+            else:
+                field, highest_first = SORTS[sort]
+                if highest_first:
+                    top = heapq.nlargest(limit, scores, key=lambda i: books[i].get(field) or 0)
+                else:
+                    #books without a ranking go last
+                    top = heapq.nsmallest(limit, scores, key=lambda i: (books[i].get(field) is None, books[i].get(field) or 0))
+            items = [books[i] for i in top]
+
+        return {
+            "total": len(scores),
+            "items": items,
+            "facets": {"genre": {str(g): c for g, c in facets.most_common()}},
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"books": len(self._books), "tokens": len(self._vocabulary), "ready": self._ready.is_set()}
+
+
+book_index = BookIndex()
+
+
+def load_books():
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(BOOKS.columns)} FROM {BOOKS.table}")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return [dict(zip(BOOKS.columns, row)) for row in rows]
+
+
+def build_index():
+    start = time.monotonic()
+    books = load_books()
+    book_index.load(books)
+    logging.info(f"Search index built: {len(books)} books in {time.monotonic() - start:.2f}s")
+
+
+def _index_loop(interval=SEARCH_REFRESH_INTERVAL):
+    while True:
+        try:
+            build_index()
+        except Exception:
+            logging.error("Error building search index:", exc_info=True)
+            #retry sooner while the index has never loaded
+            if not book_index.wait_ready(0):
+                time.sleep(5)
+                continue
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+def start_indexer():
+    #built in the background so startup does not wait on the books table
+    threading.Thread(target=_index_loop, name="search-indexer", daemon=True).start()
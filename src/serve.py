@@ -0,0 +1,101 @@
+import os
+import sys
+import signal
+import argparse
+import subprocess
+
+#production launcher, gevent (or eventlet) workers with real WebSocket support
+#
+#  python serve.py --workers 4 --port 7000 --connections 1000
+#
+#each worker listens on its own port (7000, 7001, ...) so a load balancer with sticky sessions
+#(nginx ip_hash) can sit in front, long-polling clients have to keep hitting the same worker.
+#with more than one worker rooms are shared through SOCKETIO_MESSAGE_QUEUE, e.g. redis://localhost:6379/0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the backend with an async worker")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "7000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")))
+    parser.add_argument("--connections", type=int, default=int(os.getenv("WORKER_CONNECTIONS", "1000")),
+                        help="concurrent connections (greenlets) per worker")
+    parser.add_argument("--async-mode", choices=["gevent", "eventlet"], default=os.getenv("SOCKETIO_ASYNC_MODE", "gevent"))
+    parser.add_argument("--message-queue", default=os.getenv("SOCKETIO_MESSAGE_QUEUE", ""),
+                        help="shared Socket.IO message queue, required with more than one worker")
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_worker(args):
+    #patch before anything imports socket/threading so MySQL, SMTP and the background workers cooperate
+    if args.async_mode == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+    else:
+        import eventlet
+        eventlet.monkey_patch()
+
+    os.environ["SOCKETIO_ASYNC_MODE"] = args.async_mode
+    if args.message_queue:
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = args.message_queue
+    #the C extension of mysql.connector blocks the whole process, the pure python driver uses patched sockets
+    os.environ["DB_USE_PURE"] = "true"
+
+    import app
+    #warm up before taking traffic instead of on the first request (search index, SMTP worker, replica checks)
+    app.start_background()
+
+    port = args.port + (args.worker_index or 0)
+    #stop serving on SIGTERM so atexit hooks (chat writer flush) run
+    if args.async_mode == "gevent":
+        import gevent
+        from gevent.pool import Pool
+        gevent.signal_handler(signal.SIGTERM, app.socketio.stop)
+        server_options = {"spawn": Pool(args.connections)}
+    else:
+        signal.signal(signal.SIGTERM, lambda signum, frame: app.socketio.stop())
+        server_options = {"max_size": args.connections}
+
+    print(f"Worker {args.worker_index or 0} ({args.async_mode}) listening on {args.host}:{port}", flush=True)
+    app.socketio.run(app.app, host=args.host, port=port, **server_options)
+
+
+def run_workers(args):
+    if not args.message_queue:
+        sys.exit("--message-queue (or SOCKETIO_MESSAGE_QUEUE) is required with more than one worker")
+
+    workers = []
+    for i in range(args.workers):
+        command = [sys.executable, os.path.abspath(__file__), "--worker-index", str(i),
+                   "--host", args.host, "--port", str(args.port), "--connections", str(args.connections),
+                   "--async-mode", args.async_mode, "--message-queue", args.message_queue]
+        workers.append(subprocess.Popen(command))
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    #if one worker dies take the rest down too and let the supervisor restart us
+    exit_code = 0
+    while workers:
+        pid, status = os.wait()
+        workers_left = [w for w in workers if w.pid != pid]
+        if len(workers_left) == len(workers):
+            continue
+        workers = workers_left
+        if status and not exit_code:
+            exit_code = 1
+            stop(None, None)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.workers > 1 and args.worker_index is None:
+        run_workers(args)
+    else:
+        run_worker(args)
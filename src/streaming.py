@@ -0,0 +1,81 @@
+import os
+import json
+
+from flask import Response, request
+
+from replicas import get_read_connection
+from pagination import build_list_query
+
+#streamed list responses, rows are read with fetchmany() and written out batch by batch
+#so memory stays at one batch and the first byte goes out after the first fetch
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_stream():
+    #?stream=1 streams a JSON array, Accept: application/x-ndjson streams one object per line
+    if request.args.get("stream") in ("1", "true", "yes"):
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def _iter_rows(conn, sql, params, batch_size):
+    #default cursor is unbuffered, rows stay on the server until fetched
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        #if the client went away mid stream there are unread rows, closing the cursor can complain
+        #and the pool then drops the connection instead of reusing it
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        conn.close()
+
+
+def _encode(resource, fields, row):
+    item = {f: resource.format_value(f, value) for f, value in zip(fields, row)}
+    return json.dumps(item, default=str, separators=(",", ":"))
+
+
+def _json_array(resource, fields, batches):
+    yield "["
+    first = True
+    for rows in batches:
+        chunk = ",".join(_encode(resource, fields, row) for row in rows)
+        if first:
+            first = False
+        else:
+            chunk = "," + chunk
+        yield chunk
+    yield "]\n"
+
+
+def _ndjson(resource, fields, batches):
+    for rows in batches:
+        yield "".join(_encode(resource, fields, row) + "\n" for row in rows)
+
+
+def stream_response(resource, args, where=None, params=(), batch_size=STREAM_BATCH_SIZE):
+    #parse before streaming so a bad fields= or sort= still gets a normal 400
+    sql, fields = build_list_query(resource, args, where)
+    #picked while the request context is still there, the body is generated after it is gone and
+    #read-your-writes stickiness (replicas.py) needs the request
+    conn = get_read_connection()
+    batches = _iter_rows(conn, sql, params, batch_size)
+
+    if request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON:
+        response = Response(_ndjson(resource, fields, batches), mimetype=NDJSON)
+    else:
+        response = Response(_json_array(resource, fields, batches), mimetype="application/json")
+    #a body that is never iterated never reaches the generator's finally, close() is safe to call twice
+    response.call_on_close(conn.close)
+    return response
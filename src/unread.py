@@ -0,0 +1,178 @@
+import os
+import time
+import atexit
+import logging
+import threading
+
+from db import get_db_connection
+from cache import TTLCache
+
+#unread message counts per user and conversation (migrations/008_unread_counters.sql)
+#handle_message adds one for a receiver who is not in the room, 'read' resets it. Changes are collected in
+#memory and written every UNREAD_FLUSH_INTERVAL seconds with two executemany upserts (add / set), so a busy
+#conversation costs no per-message write. Counts a worker has loaded are kept for UNREAD_CACHE_TTL seconds and
+#updated in place, other workers' changes show up when they are reloaded.
+
+UNREAD_FLUSH_INTERVAL = float(os.getenv("UNREAD_FLUSH_INTERVAL", "1"))
+UNREAD_CACHE_TTL = float(os.getenv("UNREAD_CACHE_TTL", "30"))
+#users whose counts are kept
+UNREAD_CACHE_SIZE = int(os.getenv("UNREAD_CACHE_SIZE", "10000"))
+
+ADD_UNREAD = """
+    INSERT INTO bookreview_DB.unread_counters (user_id, conversation_id, unread) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE unread = unread + VALUES(unread)
+"""
+SET_UNREAD = """
+    INSERT INTO bookreview_DB.unread_counters (user_id, conversation_id, unread) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE unread = VALUES(unread)
+"""
+
+
+def _query_counts(user_id):
+    #primary, a replica may not have the last flush yet
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT conversation_id, unread FROM bookreview_DB.unread_counters WHERE user_id = %s AND unread > 0",
+            (user_id,)
+        )
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _write(add_rows, set_rows):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if set_rows:
+            cursor.executemany(SET_UNREAD, set_rows)
+        if add_rows:
+            cursor.executemany(ADD_UNREAD, add_rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class UnreadCounters:
+    def __init__(self, query=_query_counts, write=_write, flush_interval=UNREAD_FLUSH_INTERVAL,
+                 cache_ttl=UNREAD_CACHE_TTL, cache_size=UNREAD_CACHE_SIZE):
+        self._query = query
+        self._write = write
+        self.flush_interval = flush_interval
+        #user_id -> {conversation_id: [delta, reset]}, not written yet
+        #reset means the stored count is replaced by delta instead of increased by it
+        self._pending = {}
+        #user_id -> {conversation_id: count}
+        self._counts = TTLCache(ttl=cache_ttl, max_entries=cache_size)
+        self._lock = threading.Lock()
+        #held while a flush writes, so a load sees a change either in MySQL or in _pending, never both or neither
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stats = {"increments": 0, "resets": 0, "loads": 0, "flushes": 0, "flushed_rows": 0, "flush_errors": 0}
+
+    def _load(self, user_id):
+        with self._flush_lock:
+            counts = self._query(user_id)
+            with self._lock:
+                self._stats["loads"] += 1
+                for conversation_id, (delta, reset) in self._pending.get(user_id, {}).items():
+                    counts[conversation_id] = delta if reset else counts.get(conversation_id, 0) + delta
+                self._counts.set(user_id, counts, 0)
+                return dict(counts)
+
+    def counts(self, user_id):
+        #{conversation_id: unread} with zeros left out
+        with self._lock:
+            counts = self._counts.get(user_id)
+            if counts is not None:
+                return {conversation_id: n for conversation_id, n in counts.items() if n}
+        return {conversation_id: n for conversation_id, n in self._load(user_id).items() if n}
+
+    def increment(self, user_id, conversation_id):
+        #returns the user's new count for the conversation
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {}).setdefault(conversation_id, [0, False])
+            entry[0] += 1
+            self._stats["increments"] += 1
+            counts = self._counts.get(user_id)
+            if counts is not None:
+                counts[conversation_id] = counts.get(conversation_id, 0) + 1
+                return counts[conversation_id]
+        #not loaded yet, the load includes the increment above
+        return self._load(user_id).get(conversation_id, 0)
+
+    def mark_read(self, user_id, conversation_id):
+        with self._lock:
+            self._pending.setdefault(user_id, {})[conversation_id] = [0, True]
+            self._stats["resets"] += 1
+            counts = self._counts.get(user_id)
+            if counts is not None:
+                counts[conversation_id] = 0
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            add_rows, set_rows = [], []
+            for user_id, conversations in pending.items():
+                for conversation_id, (delta, reset) in conversations.items():
+                    if reset:
+                        set_rows.append((user_id, conversation_id, delta))
+                    elif delta:
+                        add_rows.append((user_id, conversation_id, delta))
+            if not add_rows and not set_rows:
+                return 0
+            try:
+                self._write(add_rows, set_rows)
+            except Exception:
+                logging.error(f"Error writing {len(add_rows) + len(set_rows)} unread counters:", exc_info=True)
+                self._restore(pending)
+                with self._lock:
+                    self._stats["flush_errors"] += 1
+                return 0
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(add_rows) + len(set_rows)
+        return len(add_rows) + len(set_rows)
+
+    def _restore(self, pending):
+        #put a failed batch back under whatever arrived since, a newer reset wins over older deltas
+        with self._lock:
+            for user_id, conversations in pending.items():
+                current = self._pending.setdefault(user_id, {})
+                for conversation_id, (delta, reset) in conversations.items():
+                    newer = current.get(conversation_id)
+                    if newer is None:
+                        current[conversation_id] = [delta, reset]
+                    elif not newer[1]:
+                        current[conversation_id] = [delta + newer[0], reset]
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="unread-writer", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(conversations) for conversations in self._pending.values())
+        stats["cached_users"] = self._counts.stats()["entries"]
+        return stats
+
+
+unread_counters = UnreadCounters()
+#write whatever is pending on shutdown
+atexit.register(unread_counters.flush)
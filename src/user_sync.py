@@ -0,0 +1,226 @@
+import os
+import logging
+import argparse
+from datetime import datetime
+
+from db import get_db_connection
+
+#incremental Firebase -> MySQL user reconciliation (migrations/007_user_sync.sql)
+#walks auth.list_users() one page at a time, diffs each page against users by uid, applies the
+#inserts/updates in batches and saves the page token in the same transaction, so a killed run
+#resumes from the last committed page. Users seen in a pass are stamped with its run id and the
+#rows left unstamped at the end are counted as missing from Firebase (reported, never deleted).
+#
+#  python user_sync.py            resume the last pass or start a new one
+#  python user_sync.py --restart  start a new pass from the first page
+
+JOB = "firebase_users"
+
+#Firebase caps list_users at 1000 per page
+USER_SYNC_PAGE_SIZE = int(os.getenv("USER_SYNC_PAGE_SIZE", "1000"))
+
+COUNTERS = ["pages", "seen", "inserted", "updated", "unchanged", "duplicates"]
+
+
+def iter_pages(list_users, page_token=None, page_size=USER_SYNC_PAGE_SIZE):
+    #yields (users, token of the next page), only one page is held at a time
+    page = list_users(page_token=page_token or None, max_results=page_size)
+    while page:
+        yield page.users, page.next_page_token or None
+        page = page.get_next_page()
+
+
+def _username(user):
+    return user.display_name or (user.email or "").split("@")[0] or user.uid
+
+
+def diff_batch(cursor, users):
+    #returns (rows to insert, rows to update, uids already in sync, extra rows sharing a uid)
+    by_uid = {user.uid: user for user in users}
+    if not by_uid:
+        return [], [], [], 0
+    uids = list(by_uid)
+    cursor.execute(f"""
+        SELECT uid, username, email, COUNT(*) FROM bookreview_DB.users
+        WHERE uid IN ({', '.join(['%s'] * len(uids))})
+        GROUP BY uid, username, email
+    """, uids)
+    existing = {}
+    duplicates = 0
+    for uid, username, email, count in cursor.fetchall():
+        duplicates += count - (0 if uid in existing else 1)
+        existing.setdefault(uid, (username, email))
+
+    inserts, updates, unchanged = [], [], []
+    for uid, user in by_uid.items():
+        current = existing.get(uid)
+        if current is None:
+            inserts.append((_username(user), user.email, uid))
+            continue
+        #only overwrite what Firebase actually has
+        username = user.display_name or current[0]
+        email = user.email or current[1]
+        if (username, email) != current:
+            updates.append((username, email, uid))
+        else:
+            unchanged.append(uid)
+    return inserts, updates, unchanged, duplicates
+
+
+def apply_batch(cursor, run_id, inserts, updates, unchanged):
+    if inserts:
+        cursor.executemany(
+            "INSERT INTO bookreview_DB.users (username, email, uid, sync_run) VALUES (%s, %s, %s, %s)",
+            [row + (run_id,) for row in inserts]
+        )
+    if updates:
+        cursor.executemany(
+            "UPDATE bookreview_DB.users SET username = %s, email = %s, sync_run = %s WHERE uid = %s",
+            [(username, email, run_id, uid) for username, email, uid in updates]
+        )
+    if unchanged:
+        cursor.execute(
+            f"UPDATE bookreview_DB.users SET sync_run = %s WHERE uid IN ({', '.join(['%s'] * len(unchanged))})",
+            [run_id] + unchanged
+        )
+
+
+def load_checkpoint(cursor):
+    cursor.execute(f"""
+        SELECT run_id, page_token, {', '.join(COUNTERS)}, missing_in_firebase, started_at, finished_at
+        FROM bookreview_DB.sync_checkpoints WHERE job = %s
+    """, (JOB,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    run_id, page_token = row[0], row[1]
+    state = {"run_id": run_id, "page_token": page_token}
+    state.update(zip(COUNTERS, row[2:2 + len(COUNTERS)]))
+    missing, started_at, finished_at = row[2 + len(COUNTERS):]
+    state["missing_in_firebase"] = missing
+    state["started_at"] = started_at.strftime('%Y-%m-%d %H:%M:%S') if started_at else None
+    state["finished_at"] = finished_at.strftime('%Y-%m-%d %H:%M:%S') if finished_at else None
+    return state
+
+
+def start_run(cursor, previous):
+    run_id = (previous["run_id"] + 1) if previous else 1
+    cursor.execute(f"""
+        INSERT INTO bookreview_DB.sync_checkpoints (job, run_id, page_token, {', '.join(COUNTERS)}, missing_in_firebase)
+        VALUES (%s, %s, NULL, {', '.join(['0'] * len(COUNTERS))}, NULL)
+        ON DUPLICATE KEY UPDATE run_id = VALUES(run_id), page_token = NULL,
+            {', '.join(f'{c} = 0' for c in COUNTERS)}, missing_in_firebase = NULL,
+            started_at = NOW(), finished_at = NULL
+    """, (JOB, run_id))
+    state = {"run_id": run_id, "page_token": None, "missing_in_firebase": None}
+    state.update((c, 0) for c in COUNTERS)
+    return state
+
+
+def save_checkpoint(cursor, state):
+    cursor.execute(f"""
+        UPDATE bookreview_DB.sync_checkpoints
+        SET page_token = %s, {', '.join(f'{c} = %s' for c in COUNTERS)}
+        WHERE job = %s
+    """, [state["page_token"]] + [state[c] for c in COUNTERS] + [JOB])
+
+
+def finish_run(cursor, state):
+    #every user Firebase returned this pass has sync_run = run_id, older stamps were not seen
+    #users registered after the pass started may simply have come after their page
+    cursor.execute("""
+        SELECT COUNT(*) FROM bookreview_DB.users
+        WHERE uid IS NOT NULL AND (sync_run IS NULL OR sync_run <> %s)
+          AND created_at < (SELECT started_at FROM bookreview_DB.sync_checkpoints WHERE job = %s)
+    """, (state["run_id"], JOB))
+    state["missing_in_firebase"] = cursor.fetchone()[0]
+    cursor.execute("""
+        UPDATE bookreview_DB.sync_checkpoints
+        SET page_token = NULL, missing_in_firebase = %s, finished_at = NOW()
+        WHERE job = %s
+    """, (state["missing_in_firebase"], JOB))
+    state["finished_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def sync_users(list_users=None, page_size=USER_SYNC_PAGE_SIZE, restart=False, max_pages=None):
+    #list_users defaults to firebase_admin.auth.list_users, anything with the same paging works
+    if list_users is None:
+        from firebase_app import get_auth
+        list_users = get_auth().list_users
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        state = load_checkpoint(cursor)
+        if restart or state is None or state["finished_at"] is not None or not state["page_token"]:
+            state = start_run(cursor, state)
+            conn.commit()
+            logging.info(f"User sync run {state['run_id']} started")
+        else:
+            logging.info(f"User sync run {state['run_id']} resuming after {state['pages']} pages")
+
+        finished = True
+        for pages, (users, next_token) in enumerate(iter_pages(list_users, state["page_token"], page_size), 1):
+            inserts, updates, unchanged, duplicates = diff_batch(cursor, users)
+            apply_batch(cursor, state["run_id"], inserts, updates, unchanged)
+
+            state["pages"] += 1
+            state["seen"] += len(users)
+            state["inserted"] += len(inserts)
+            state["updated"] += len(updates)
+            state["unchanged"] += len(unchanged)
+            state["duplicates"] += duplicates
+            state["page_token"] = next_token
+            #the batch and the token that points past it commit together
+            save_checkpoint(cursor, state)
+            conn.commit()
+
+            if max_pages and pages >= max_pages and next_token:
+                finished = False
+                break
+
+        if finished:
+            finish_run(cursor, state)
+            conn.commit()
+            logging.info(f"User sync run {state['run_id']} finished: {state}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    state.pop("page_token", None)
+    state["finished"] = finished
+    return state
+
+
+def sync_status():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        state = load_checkpoint(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    if state is None:
+        return {"run_id": None}
+    state["in_progress"] = state["finished_at"] is None
+    state.pop("page_token", None)
+    return state
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Reconcile Firebase users into the users table")
+    parser.add_argument("--restart", action="store_true", help="start a new pass instead of resuming")
+    parser.add_argument("--page-size", type=int, default=USER_SYNC_PAGE_SIZE)
+    parser.add_argument("--max-pages", type=int, help="stop after this many pages, the next run resumes")
+    args = parser.parse_args()
+
+    #Firebase is initialized from FIREBASE_CREDENTIALS when the sync starts, see firebase_app.py
+    result = sync_users(page_size=args.page_size, restart=args.restart, max_pages=args.max_pages)
+    print(result)
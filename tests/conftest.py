@@ -0,0 +1,102 @@
+import os
+import sys
+
+#the app is a flat set of modules in src/, run from the repo root with: python -m pytest tests
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+import pytest
+
+
+class FakeCursor:
+    def __init__(self, db, dictionary=False):
+        self.db = db
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = 1
+
+    def execute(self, sql, params=()):
+        self.db.log.append((sql, params))
+        self.rows = list(self.db.responder(sql, params) or [])
+        self.rowcount = len(self.rows) or 1
+
+    def executemany(self, sql, seq):
+        seq = list(seq)
+        self.db.log.append((sql, seq))
+        self.rowcount = len(seq)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self.db, dictionary)
+
+    def commit(self):
+        self.db.log.append(("COMMIT", ()))
+
+    def rollback(self):
+        pass
+
+    def start_transaction(self, **kwargs):
+        self.db.log.append(("BEGIN", ()))
+
+    def ping(self, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    #stands in for MySQL: statements go to log, responder(sql, params) returns the rows
+    def __init__(self):
+        self.log = []
+        self.responder = lambda sql, params: []
+
+    def connect(self, *args, **kwargs):
+        return FakeConnection(self)
+
+    def statements(self, fragment):
+        return [(sql, params) for sql, params in self.log if fragment in sql]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    import db
+    fake = FakeDB()
+    monkeypatch.setattr(db, "_pool", db.ConnectionPool(connect=fake.connect, size=5, max_overflow=0, timeout=0.5))
+    return fake
+
+
+@pytest.fixture
+def app(fake_db, monkeypatch):
+    #the module level app, without the background workers and with an empty response cache
+    import background
+    import app as appmod
+    from cache import catalog_cache
+    monkeypatch.setattr(background, "_started", True)
+    catalog_cache.clear()
+    return appmod.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import SRC
+
+
+def test_create_app_twice(fake_db, monkeypatch):
+    import background
+    from app import create_app, BLUEPRINTS
+    monkeypatch.setattr(background, "_started", True)
+
+    first, second = create_app(), create_app()
+    assert first is not second
+    for app in (first, second):
+        assert set(app.blueprints) == {bp.name for bp in BLUEPRINTS}
+        response = app.test_client().get("/chat/realtime")
+        response.close()
+        assert response.status_code == 200
+
+
+def test_factory_needs_no_credentials():
+    #fresh interpreter so nothing another test imported counts
+    script = """
+import sys, json
+import app
+apps = [app.create_app(), app.create_app()]
+print(json.dumps({
+    "blueprints": [sorted(a.blueprints) for a in apps],
+    "rules": len(list(apps[1].url_map.iter_rules())),
+    "loaded": [m for m in ("firebase_admin", "mysql.connector", "smtplib") if m in sys.modules],
+}))
+"""
+    env = dict(os.environ, FIREBASE_CREDENTIALS="/nonexistent/credentials.json")
+    output = subprocess.run([sys.executable, "-c", script], cwd=SRC, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+
+    assert result["blueprints"][0] == result["blueprints"][1] == ["books", "chat", "ops", "reviews", "users"]
+    assert result["rules"] > 20
+    assert result["loaded"] == []
@@ -0,0 +1,68 @@
+import pytest
+
+from archive import parse_ids, BulkRequestError, ARCHIVE_BULK_MAX
+
+
+def test_parse_ids_keeps_order_and_drops_repeats():
+    assert parse_ids({"ids": [3, "1", 3, 2]}) == [3, 1, 2]
+
+
+@pytest.mark.parametrize("data", [None, [], {}, {"ids": []}, {"ids": "1,2"}, {"ids": [1, "x"]}, {"ids": [None]},
+                                  {"ids": list(range(ARCHIVE_BULK_MAX + 1))}])
+def test_parse_ids_rejects(data):
+    with pytest.raises(BulkRequestError):
+        parse_ids(data)
+
+
+def bulk(client, method, ids):
+    response = client.open("/books/archive", method=method, json={"ids": ids})
+    response.close()
+    return response
+
+
+def test_bulk_archive_outcomes(client, fake_db):
+    #1 is a book not archived yet, 2 is archived already, 3 does not exist
+    fake_db.responder = lambda sql, params: [(1, 0), (2, 1)] if "LEFT JOIN" in sql else []
+    response = bulk(client, "POST", [1, 2, 3])
+    assert response.status_code == 200
+    assert response.json == {"results": {"1": "archived", "2": "already_archived", "3": "not_found"}}
+    (sql, params), = fake_db.statements("INSERT INTO bookreview_DB.archived_books")
+    assert params == [1, 2, 3]
+    assert fake_db.log[-1] == ("COMMIT", ())
+
+
+def test_bulk_archive_nothing_to_do(client, fake_db):
+    fake_db.responder = lambda sql, params: [(2, 1)] if "LEFT JOIN" in sql else []
+    response = bulk(client, "POST", [2, 3])
+    assert response.json == {"results": {"2": "already_archived", "3": "not_found"}}
+    assert not fake_db.statements("INSERT INTO bookreview_DB.archived_books")
+
+
+def test_bulk_unarchive_outcomes(client, fake_db):
+    fake_db.responder = lambda sql, params: [(5,)] if sql.strip().startswith("SELECT") else []
+    response = bulk(client, "DELETE", [5, 6])
+    assert response.status_code == 200
+    assert response.json == {"results": {"5": "unarchived", "6": "not_archived"}}
+    (sql, params), = fake_db.statements("DELETE FROM bookreview_DB.archived_books")
+    assert params == [5]
+
+
+def test_bulk_request_errors_are_400(client, fake_db):
+    response = bulk(client, "POST", ["x"])
+    assert response.status_code == 400
+    assert response.json["error"] == "ids must be integers"
+    assert not fake_db.log
+
+
+def test_bulk_archive_invalidates_the_list(client, fake_db):
+    fake_db.responder = lambda sql, params: [(1, "Title")] if "FROM bookreview_DB.archived_books" in sql else []
+    response = client.get("/books/archive?fields=objectID,title")
+    response.close()
+    etag = response.headers["ETag"]
+
+    fake_db.responder = lambda sql, params: [(1, 0)] if "LEFT JOIN" in sql else []
+    bulk(client, "POST", [1])
+    response = client.get("/books/archive?fields=objectID,title", headers={"If-None-Match": etag})
+    response.close()
+    #rebuilt rather than answered from the cache
+    assert len(fake_db.statements("SELECT objectID, title FROM bookreview_DB.archived_books")) == 2
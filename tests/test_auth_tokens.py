@@ -0,0 +1,144 @@
+import time
+import datetime
+
+import jwt
+import pytest
+from flask import Flask, g, jsonify
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import auth_tokens
+from auth_tokens import CertificateCache, CertificateFetchError, InvalidTokenError, TokenVerifier
+
+PROJECT = "demo-project"
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def certificate_pem(key):
+    #self-signed, the verifier only reads the public key out of it
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    return make_key()
+
+
+@pytest.fixture
+def verifier(signing_key):
+    certificates = CertificateCache(fetch=lambda: ({"kid-1": certificate_pem(signing_key)}, 3600))
+    return TokenVerifier(project_id=PROJECT, certificates=certificates)
+
+
+def mint(key, kid="kid-1", **overrides):
+    now = int(time.time())
+    claims = {
+        "iss": f"https://securetoken.google.com/{PROJECT}",
+        "aud": PROJECT,
+        "sub": "user-123",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_valid_token(verifier, signing_key):
+    claims = verifier.verify(mint(signing_key))
+    assert claims["uid"] == "user-123"
+
+
+def test_verified_token_is_cached(verifier, signing_key):
+    token = mint(signing_key)
+    verifier.verify(token)
+    verifier.verify(token)
+    assert verifier.certificates.refreshes == 1
+    assert verifier.cache.stats()["entries"] == 1
+
+
+def test_expired_token(verifier, signing_key):
+    past = int(time.time()) - 2 * 3600
+    with pytest.raises(InvalidTokenError, match="expired"):
+        verifier.verify(mint(signing_key, iat=past, exp=past + 600, auth_time=past))
+
+
+def test_wrong_audience(verifier, signing_key):
+    with pytest.raises(InvalidTokenError, match="[Aa]udience"):
+        verifier.verify(mint(signing_key, aud="someone-else"))
+
+
+def test_wrong_issuer(verifier, signing_key):
+    with pytest.raises(InvalidTokenError, match="[Ii]ssuer"):
+        verifier.verify(mint(signing_key, iss="https://securetoken.google.com/someone-else"))
+
+
+def test_bad_signature(verifier):
+    #right kid, signed by a key Google never published
+    with pytest.raises(InvalidTokenError, match="[Ss]ignature"):
+        verifier.verify(mint(make_key()))
+
+
+def test_unknown_kid(verifier, signing_key):
+    with pytest.raises(InvalidTokenError, match="unknown key"):
+        verifier.verify(mint(signing_key, kid="kid-2"))
+
+
+def test_not_rs256(verifier):
+    token = jwt.encode({"sub": "x"}, "a-shared-secret-that-is-32-bytes!", algorithm="HS256", headers={"kid": "kid-1"})
+    with pytest.raises(InvalidTokenError, match="RS256"):
+        verifier.verify(token)
+
+
+def failing_fetch():
+    raise OSError("network down")
+
+
+def test_certificate_fetch_failure(signing_key):
+    verifier = TokenVerifier(project_id=PROJECT, certificates=CertificateCache(fetch=failing_fetch))
+    with pytest.raises(CertificateFetchError):
+        verifier.verify(mint(signing_key))
+
+
+@pytest.fixture
+def protected():
+    app = Flask(__name__)
+
+    @app.route("/me")
+    @auth_tokens.require_auth
+    def me():
+        return jsonify(g.user and g.user["uid"])
+
+    return app.test_client()
+
+
+def test_require_auth_statuses(protected, monkeypatch, signing_key, verifier):
+    monkeypatch.setattr(auth_tokens, "token_verifier", verifier)
+    ok = protected.get("/me", headers={"Authorization": f"Bearer {mint(signing_key)}"})
+    assert (ok.status_code, ok.json) == (200, "user-123")
+    bad = protected.get("/me", headers={"Authorization": f"Bearer {mint(make_key())}"})
+    assert bad.status_code == 401
+
+
+def test_require_auth_503_without_certificates(protected, monkeypatch, signing_key):
+    broken = TokenVerifier(project_id=PROJECT, certificates=CertificateCache(fetch=failing_fetch))
+    monkeypatch.setattr(auth_tokens, "token_verifier", broken)
+    response = protected.get("/me", headers={"Authorization": f"Bearer {mint(signing_key)}"})
+    assert response.status_code == 503
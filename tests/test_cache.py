@@ -0,0 +1,109 @@
+import pytest
+from flask import Flask
+
+import cache
+from cache import cached_json, invalidate, catalog_cache
+
+
+@pytest.fixture
+def cached_app(monkeypatch):
+    monkeypatch.setattr(cache, "_invalidated_at", {})
+    catalog_cache.clear()
+    app = Flask(__name__)
+    builds = []
+
+    @app.route("/things")
+    def things():
+        def build():
+            builds.append(1)
+            return [{"id": len(builds)}]
+        return cached_json("things", build)
+
+    app.builds = builds
+    yield app
+    catalog_cache.clear()
+
+
+def get(client, path="/things", **kwargs):
+    response = client.get(path, **kwargs)
+    response.get_data()
+    response.close()
+    return response
+
+
+def test_second_request_is_served_from_cache(cached_app):
+    client = cached_app.test_client()
+    first = get(client)
+    second = get(client)
+    assert first.json == second.json == [{"id": 1}]
+    assert len(cached_app.builds) == 1
+
+
+def test_matching_etag_gets_304(cached_app):
+    client = cached_app.test_client()
+    etag = get(client).headers["ETag"]
+    response = get(client, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert get(client, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_key_includes_query_args_and_media_type(cached_app):
+    client = cached_app.test_client()
+    get(client, "/things?limit=5&sort=id")
+    #same args in another order share the entry
+    get(client, "/things?sort=id&limit=5")
+    assert len(cached_app.builds) == 1
+    get(client, "/things?limit=6&sort=id")
+    assert len(cached_app.builds) == 2
+    response = get(client, "/things?limit=5&sort=id", headers={"Accept": "application/msgpack"})
+    assert response.mimetype == "application/msgpack"
+    assert len(cached_app.builds) == 3
+
+
+def test_invalidate_drops_the_entry(cached_app):
+    client = cached_app.test_client()
+    etag = get(client).headers["ETag"]
+    invalidate("things")
+    response = get(client, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json == [{"id": 2}]
+
+
+def test_build_interleaved_with_invalidate_is_not_cached(monkeypatch):
+    monkeypatch.setattr(cache, "_invalidated_at", {})
+    catalog_cache.clear()
+    app = Flask(__name__)
+    builds = []
+
+    @app.route("/things")
+    def things():
+        def build():
+            builds.append(1)
+            rows = [{"name": "old"}] if len(builds) == 1 else [{"name": "new"}]
+            if len(builds) == 1:
+                #a write commits and invalidates after this build read the old rows
+                invalidate("things")
+            return rows
+        return cached_json("things", build)
+
+    client = app.test_client()
+    assert get(client).json == [{"name": "old"}]
+    assert get(client).json == [{"name": "new"}]
+    assert get(client).json == [{"name": "new"}]
+    assert len(builds) == 2
+
+
+def test_write_route_invalidates_list(client, fake_db):
+    path = "/users?fields=id,profilePic"
+    fake_db.responder = lambda sql, params: [(1, "a.png")] if sql.startswith("SELECT") else []
+    etag = get(client, path).headers["ETag"]
+    fake_db.responder = lambda sql, params: [(1, "b.png")] if sql.startswith("SELECT") else []
+    assert get(client, path, headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.put("/users/1/profilePic", json={"profilePic": "b.png"})
+    response.close()
+    assert response.status_code == 200
+    response = get(client, path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json == [{"id": 1, "profilePic": "b.png"}]
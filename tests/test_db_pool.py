@@ -0,0 +1,107 @@
+import gc
+import time
+
+import pytest
+
+from db import ConnectionPool, PoolExhaustedError
+
+
+class FakeRaw:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor()
+
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def close(self):
+        pass
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault("size", 2)
+    kwargs.setdefault("max_overflow", 0)
+    kwargs.setdefault("timeout", 0.2)
+    return ConnectionPool(connect=FakeRaw, **kwargs)
+
+
+def test_close_returns_connection():
+    pool = make_pool()
+    conn = pool.connection()
+    raw = conn._raw
+    conn.close()
+    assert pool.stats()["in_use"] == 0
+    with pool.connection() as again:
+        assert again._raw is raw
+
+
+def test_exhausted_pool_times_out():
+    pool = make_pool()
+    held = [pool.connection(), pool.connection()]
+    with pytest.raises(PoolExhaustedError):
+        pool.connection()
+    for conn in held:
+        conn.close()
+
+
+def test_leaked_connection_is_reclaimed():
+    pool = make_pool()
+
+    def leak():
+        conn = pool.connection()
+        conn.cursor()
+
+    for _ in range(5):
+        leak()
+    gc.collect()
+    stats = pool.stats()
+    assert stats["leaked"] == 5
+    assert stats["open"] == 0
+    pool.connection().close()
+
+
+def test_waiter_gets_slot_of_leaked_connection():
+    pool = make_pool(size=1, timeout=3)
+    conn = pool.connection()
+    raw = conn._raw
+    del conn
+    gc.collect()
+    with pool.connection() as conn:
+        assert conn._raw is not raw
+    assert raw.closed
+
+
+def test_recycle_by_age():
+    pool = make_pool(recycle=0.01)
+    conn = pool.connection()
+    raw = conn._raw
+    conn.close()
+    time.sleep(0.02)
+    with pool.connection() as conn:
+        assert conn._raw is not raw
+    assert pool.stats()["recycled"] == 1
+
+
+def test_use_pure_only_passed_when_enabled(monkeypatch):
+    import mysql.connector
+    import db
+    calls = []
+    monkeypatch.setattr(mysql.connector, "connect", lambda **kwargs: calls.append(kwargs))
+
+    monkeypatch.setattr(db, "DB_USE_PURE", False)
+    db._connect()
+    monkeypatch.setattr(db, "DB_USE_PURE", True)
+    db._connect()
+
+    assert "use_pure" not in calls[0]
+    assert calls[1]["use_pure"] is True
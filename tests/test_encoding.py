@@ -0,0 +1,109 @@
+import gzip
+import json
+from decimal import Decimal
+
+import brotli
+import msgpack
+import pytest
+from flask import Flask
+
+import encoding
+from encoding import respond, to_columns, COMPRESS_MIN_SIZE
+
+ROWS = [{"objectID": i, "title": f"Title {i}", "rating": Decimal("4.50")} for i in range(1, 4)]
+#well over COMPRESS_MIN_SIZE
+BIG = [{"objectID": i, "title": "x" * 50} for i in range(COMPRESS_MIN_SIZE // 10)]
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    encoding.init_app(app)
+
+    @app.route("/rows")
+    def rows():
+        return respond(ROWS)
+
+    @app.route("/big")
+    def big():
+        return respond(BIG)
+
+    return app.test_client()
+
+
+def get(client, path, **kwargs):
+    response = client.get(path, **kwargs)
+    response.get_data()
+    response.close()
+    return response
+
+
+def test_plain_json_by_default(client):
+    response = get(client, "/rows")
+    assert response.mimetype == "application/json"
+    assert response.json == [{"objectID": i, "title": f"Title {i}", "rating": "4.50"} for i in range(1, 4)]
+    assert "Accept" in response.vary
+
+
+@pytest.mark.parametrize("accept", ["application/msgpack", "application/x-msgpack"])
+def test_msgpack(client, accept):
+    response = get(client, "/rows", headers={"Accept": accept})
+    assert response.mimetype == "application/msgpack"
+    assert msgpack.unpackb(response.data, raw=False) == json.loads(get(client, "/rows").data)
+
+
+def test_json_preferred_over_msgpack_by_quality(client):
+    response = get(client, "/rows", headers={"Accept": "application/msgpack;q=0.5, application/json"})
+    assert response.mimetype == "application/json"
+
+
+def test_columns_shape(client):
+    response = get(client, "/rows?shape=columns")
+    assert response.json["columns"] == ["objectID", "title", "rating"]
+    assert response.json["rows"][0] == [1, "Title 1", "4.50"]
+
+
+def test_columns_shape_keeps_page_fields():
+    page = {"items": [{"a": 1}], "next_cursor": "abc"}
+    assert to_columns(page) == {"columns": ["a"], "rows": [[1]], "next_cursor": "abc"}
+    assert to_columns([]) == {"columns": [], "rows": []}
+    assert to_columns({"a": 1}) == {"a": 1}
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = get(client, "/rows", headers={"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.vary
+
+
+def test_brotli_preferred_then_gzip(client):
+    response = get(client, "/big", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data)) == BIG
+
+    response = get(client, "/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data)) == BIG
+
+    response = get(client, "/big", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json == BIG
+
+
+def test_cached_list_compressed_with_its_own_etag(app, fake_db):
+    books = [(i, "x" * 50) for i in range(COMPRESS_MIN_SIZE // 10)]
+    fake_db.responder = lambda sql, params: books if "FROM bookreview_DB.books" in sql else []
+    client = app.test_client()
+    path = "/books?fields=objectID,title"
+
+    plain = get(client, path)
+    compressed = get(client, path, headers={"Accept-Encoding": "br"})
+    assert compressed.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(compressed.data) == plain.data
+    assert compressed.headers["ETag"] == plain.headers["ETag"][:-1] + '-br"'
+    #one build, the compressed copy came from the cached body
+    assert len(fake_db.statements("FROM bookreview_DB.books")) == 1
+
+    assert get(client, path, headers={"Accept-Encoding": "br", "If-None-Match": compressed.headers["ETag"]}).status_code == 304
+    #the plain ETag does not match the compressed representation
+    assert get(client, path, headers={"Accept-Encoding": "br", "If-None-Match": plain.headers["ETag"]}).status_code == 200
@@ -0,0 +1,72 @@
+import os
+import sys
+import subprocess
+
+from conftest import SRC
+from history import ConversationHistory
+
+
+def row(conversation_id, text):
+    return (1, 2, text, conversation_id)
+
+
+def stored(conversation_id, ids):
+    #what the DB returns, newest first
+    return [{"message_id": i, "sender_id": 1, "receiver_id": 2, "message_text": f"m{i}",
+             "conversation_id": conversation_id} for i in sorted(ids, reverse=True)]
+
+
+def make_history(ids, buffer_size=50):
+    queries = []
+
+    def query(conversation_id, before=None, limit=50):
+        queries.append((conversation_id, before, limit))
+        return stored(conversation_id, [i for i in ids if before is None or i < before])[:limit]
+
+    history = ConversationHistory(query=query, buffer_size=buffer_size)
+    history.queries = queries
+    return history
+
+
+def ids(page):
+    return [m["message_id"] for m in page["items"]]
+
+
+def test_page_served_from_buffer_after_first_load():
+    history = make_history([1, 2, 3])
+    assert ids(history.page(7)) == [3, 2, 1]
+    history.on_persisted([row(7, "m4")], 4)
+    assert ids(history.page(7)) == [4, 3, 2, 1]
+    assert len(history.queries) == 1
+
+
+def test_out_of_order_batches_are_kept():
+    history = make_history([1, 2])
+    history.page(7)
+    #a direct write under backpressure commits id 6 before the batch holding ids 3-5
+    history.on_persisted([row(7, "m6")], 6)
+    history.on_persisted([row(7, "m3"), row(7, "m4"), row(7, "m5")], 3)
+    #and a repeat is ignored
+    history.on_persisted([row(7, "m4")], 4)
+    assert ids(history.page(7)) == [6, 5, 4, 3, 2, 1]
+
+
+def test_out_of_order_insert_into_full_ring():
+    history = make_history([1, 2, 3], buffer_size=3)
+    history.page(7)
+    history.on_persisted([row(7, "m5")], 5)
+    history.on_persisted([row(7, "m4")], 4)
+    page = history.page(7, limit=3)
+    assert ids(page) == [5, 4, 3]
+    assert page["next_cursor"] == 3
+    #older than everything in a full ring, it is only in the DB
+    history.on_persisted([row(7, "m0")], 0)
+    assert ids(history.page(7, limit=3)) == [5, 4, 3]
+
+
+def test_shared_ttl_with_message_queue():
+    script = "import history; print(history.HISTORY_TTL)"
+    env = {**os.environ, "SOCKETIO_MESSAGE_QUEUE": "redis://localhost:6379/0"}
+    env.pop("HISTORY_TTL", None)
+    output = subprocess.run([sys.executable, "-c", script], cwd=SRC, env=env, capture_output=True, text=True, check=True)
+    assert float(output.stdout) == 3
@@ -0,0 +1,138 @@
+import socket
+from email.mime.text import MIMEText
+
+import pytest
+
+import mailer
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Sink:
+    #accepts everything except recipients at reject.local
+    def __init__(self):
+        self.received = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith("@reject.local"):
+            return "550 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_sink():
+    sink = Sink()
+    controller = aiosmtpd.Controller(sink, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield sink, controller.port
+    controller.stop()
+
+
+@pytest.fixture(autouse=True)
+def plain_messages(monkeypatch):
+    #the real builder asks Firebase for a verification link
+    def build(email, username):
+        msg = MIMEText(f"hello {username}")
+        msg["To"] = email
+        return msg
+    monkeypatch.setitem(mailer.MESSAGE_BUILDERS, "verification", build)
+
+
+def outbox(fake_db, rows):
+    def responder(sql, params):
+        if "FROM bookreview_DB.email_outbox" in sql and "FOR UPDATE SKIP LOCKED" in sql:
+            return [dict(row) for row in rows]
+        return []
+    fake_db.responder = responder
+
+
+def row(i, recipient, attempts=0):
+    return {"id": i, "kind": "verification", "recipient": recipient, "username": f"user{i}", "attempts": attempts}
+
+
+def updates(fake_db, status):
+    return [params for sql, params in fake_db.log if f"SET status = '{status}'" in sql]
+
+
+def test_claimed_batch_is_sent_over_one_session(fake_db, smtp_sink):
+    sink, port = smtp_sink
+    outbox(fake_db, [row(1, "a@example.com"), row(2, "b@example.com")])
+    session = mailer.SMTPSession(host="127.0.0.1", port=port, starttls=False, sender="app@example.com", password="")
+
+    assert mailer.process_once(session) == 2
+    session.close()
+
+    assert sink.received == ["a@example.com", "b@example.com"]
+    assert session.connects == 1
+    #claimed rows are marked 'sending' in the claim transaction, then 'sent'
+    assert updates(fake_db, "sending") == [[(1,), (2,)]]
+    assert updates(fake_db, "sent") == [[(1,), (2,)]]
+
+
+def test_rejected_recipient_is_retried_with_backoff(fake_db, smtp_sink):
+    sink, port = smtp_sink
+    outbox(fake_db, [row(1, "a@example.com"), row(2, "nobody@reject.local", attempts=1)])
+    session = mailer.SMTPSession(host="127.0.0.1", port=port, starttls=False, sender="app@example.com", password="")
+
+    mailer.process_once(session)
+    session.close()
+
+    assert sink.received == ["a@example.com"]
+    assert updates(fake_db, "sent") == [[(1,)]]
+    [[(attempts, error, delay, i)]] = updates(fake_db, "pending")
+    assert (attempts, delay, i) == (2, mailer._retry_delay(1), 2)
+    assert "550" in error
+
+
+def test_unreachable_server_retries_whole_batch(fake_db):
+    outbox(fake_db, [row(1, "a@example.com"), row(2, "b@example.com")])
+    session = mailer.SMTPSession(host="127.0.0.1", port=free_port(), starttls=False, sender="app@example.com", password="")
+
+    mailer.process_once(session)
+
+    [retries] = updates(fake_db, "pending")
+    assert [(attempts, i) for attempts, _, _, i in retries] == [(1, 1), (1, 2)]
+    assert updates(fake_db, "sent") == []
+
+
+def test_last_attempt_marks_failed(fake_db, smtp_sink):
+    _, port = smtp_sink
+    outbox(fake_db, [row(1, "nobody@reject.local", attempts=mailer.MAIL_MAX_ATTEMPTS - 1)])
+    session = mailer.SMTPSession(host="127.0.0.1", port=port, starttls=False, sender="app@example.com", password="")
+
+    mailer.process_once(session)
+    session.close()
+
+    [[(attempts, _, i)]] = updates(fake_db, "failed")
+    assert (attempts, i) == (mailer.MAIL_MAX_ATTEMPTS, 1)
+    assert updates(fake_db, "pending") == []
+
+
+def test_purge_deletes_in_batches(fake_db):
+    #the fake's rowcount is the number of rows the responder returns
+    deleted = iter([3, 3, 1])
+    fake_db.responder = lambda sql, params: [()] * next(deleted) if sql.startswith("DELETE") else []
+
+    assert mailer.purge_sent(retention_days=7, batch_size=3) == 7
+    statements = fake_db.statements("DELETE FROM bookreview_DB.email_outbox")
+    assert [params for _, params in statements] == [(7, 3)] * 3
+
+
+def test_status_counts_are_cached(fake_db, monkeypatch):
+    monkeypatch.setattr(mailer, "_status_counts", (None, {}))
+    fake_db.responder = lambda sql, params: [("pending", 2), ("sent", 5)] if "GROUP BY status" in sql else []
+
+    assert mailer.status_counts(ttl=60) == {"pending": 2, "sent": 5}
+    assert mailer.status_counts(ttl=60) == {"pending": 2, "sent": 5}
+    assert len(fake_db.statements("GROUP BY status")) == 1
@@ -0,0 +1,43 @@
+import pytest
+
+from pagination import BOOKS, PaginationError, build_list_query, build_page_query, decode_cursor, encode_cursor
+
+
+def test_list_query_without_sort_is_unordered():
+    sql, fields = build_list_query(BOOKS, {"fields": "objectID,title"})
+    assert sql == "SELECT objectID, title FROM bookreview_DB.books"
+    assert fields == ["objectID", "title"]
+
+
+def test_list_query_honours_sort():
+    sql, _ = build_list_query(BOOKS, {"sort": "-points"})
+    assert sql.endswith("ORDER BY points DESC, objectID DESC")
+
+
+def test_list_query_rejects_unknown_sort():
+    with pytest.raises(PaginationError):
+        build_list_query(BOOKS, {"sort": "title"})
+
+
+def test_page_query_orders_and_fetches_one_extra():
+    sql, params, plan = build_page_query(BOOKS, {"limit": "10", "sort": "points"})
+    assert "ORDER BY points ASC, objectID ASC LIMIT %s" in sql
+    assert params == [11]
+    assert plan["limit"] == 10
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor("-points", 42, 7)) == ("-points", 42, 7)
+
+
+def test_books_list_sorted_without_limit(client, fake_db):
+    response = client.get("/books?sort=-points&fields=objectID,points")
+    response.close()
+    assert response.status_code == 200
+    assert "ORDER BY points DESC, objectID DESC" in fake_db.statements("FROM bookreview_DB.books")[-1][0]
+
+
+def test_books_list_bad_sort_is_400(client, fake_db):
+    response = client.get("/books?sort=nope")
+    response.close()
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+import pytest
+
+import ratelimit
+from ratelimit import MemoryBackend, parse_rule
+
+
+@pytest.fixture
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(ratelimit, "backend", MemoryBackend())
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+
+
+@pytest.fixture
+def proxied_client(fake_db, fresh_buckets, monkeypatch):
+    #one load balancer hop in front, like serve.py's nginx setup
+    import background
+    from app import create_app
+    monkeypatch.setattr(background, "_started", True)
+    monkeypatch.setenv("TRUSTED_PROXIES", "1")
+    return create_app().test_client()
+
+
+def open_chat(client, ip):
+    response = client.post("/chat", json={}, headers={"X-Forwarded-For": ip}, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    response.close()
+    return response.status_code
+
+
+def test_forwarded_clients_get_their_own_buckets(proxied_client):
+    _, burst = parse_rule(ratelimit.configured_rule("chat", "60/minute"))
+    #the handler answers 400 for the empty body once the limiter lets the request through
+    assert {open_chat(proxied_client, "203.0.113.7") for _ in range(int(burst))} == {400}
+    assert open_chat(proxied_client, "203.0.113.7") == 429
+    assert open_chat(proxied_client, "198.51.100.23") == 400
+
+
+def test_without_trusted_proxies_forwarded_header_is_ignored(client, fresh_buckets):
+    _, burst = parse_rule(ratelimit.configured_rule("chat", "60/minute"))
+    for i in range(int(burst)):
+        open_chat(client, f"203.0.113.{i}")
+    #everyone came through 10.0.0.1, a spoofed header does not buy a fresh bucket
+    assert open_chat(client, "198.51.100.23") == 429
+
+
+def test_bucket_refills(monkeypatch):
+    backend = MemoryBackend()
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    assert backend.take("k", rate=1, burst=2) == (True, 0)
+    assert backend.take("k", rate=1, burst=2) == (True, 0)
+    allowed, retry = backend.take("k", rate=1, burst=2)
+    assert not allowed and retry == pytest.approx(1)
+    now[0] += 1
+    assert backend.take("k", rate=1, burst=2)[0]
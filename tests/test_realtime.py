@@ -0,0 +1,229 @@
+import pytest
+
+from presence import PresenceRegistry
+from unread import UnreadCounters
+from fanout import FanOut
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import presence
+    clock = Clock()
+    monkeypatch.setattr(presence.time, "monotonic", clock)
+    return clock
+
+
+def test_presence_tracks_users_across_tabs(clock):
+    registry = PresenceRegistry(ttl=60)
+    assert registry.join("tab1", "conversation_1", 7)
+    #a second tab of the same user is not a new arrival
+    assert not registry.join("tab2", "conversation_1", 7)
+    assert registry.join("tab3", "conversation_1", 8)
+    assert sorted(registry.online("conversation_1")) == [7, 8]
+
+    assert registry.leave("tab1", "conversation_1") is None
+    assert registry.is_online("conversation_1", 7)
+    assert registry.disconnect("tab2") == [("conversation_1", 7)]
+    assert not registry.is_online("conversation_1", 7)
+    assert registry.stats()["room_members"] == 1
+
+
+def test_presence_sweep_drops_silent_sockets(clock):
+    registry = PresenceRegistry(ttl=60)
+    registry.join("quiet", "conversation_1", 7)
+    registry.join("chatty", "conversation_1", 8)
+    clock.now += 45
+    assert registry.heartbeat("chatty")
+    clock.now += 30
+
+    assert registry.sweep() == [("conversation_1", 7)]
+    assert registry.online("conversation_1") == [8]
+    #the client learns it has to join again
+    assert not registry.heartbeat("quiet")
+
+
+class UnreadStore:
+    #what unread_counters holds in MySQL
+    def __init__(self, counts=None):
+        self.counts = counts or {}
+        self.queries = 0
+        self.writes = []
+        self.fail = False
+
+    def query(self, user_id):
+        self.queries += 1
+        return {c: n for (u, c), n in self.counts.items() if u == user_id and n}
+
+    def write(self, add_rows, set_rows):
+        if self.fail:
+            raise ConnectionError("MySQL went away")
+        self.writes.append((add_rows, set_rows))
+        for user_id, conversation_id, n in set_rows:
+            self.counts[(user_id, conversation_id)] = n
+        for user_id, conversation_id, n in add_rows:
+            self.counts[(user_id, conversation_id)] = self.counts.get((user_id, conversation_id), 0) + n
+
+
+def test_unread_counts_batch_into_one_write():
+    store = UnreadStore({(1, 5): 2})
+    counters = UnreadCounters(query=store.query, write=store.write)
+
+    assert counters.increment(1, 5) == 3
+    assert counters.increment(1, 5) == 4
+    assert counters.increment(1, 6) == 1
+    assert counters.counts(1) == {5: 4, 6: 1}
+    #loaded once, then kept up to date in memory
+    assert store.queries == 1
+
+    assert counters.flush() == 2
+    assert store.writes == [([(1, 5, 2), (1, 6, 1)], [])]
+    assert store.counts == {(1, 5): 4, (1, 6): 1}
+
+
+def test_unread_mark_read_wins_over_earlier_increments():
+    store = UnreadStore({(1, 5): 2})
+    counters = UnreadCounters(query=store.query, write=store.write)
+    counters.increment(1, 5)
+    counters.mark_read(1, 5)
+    counters.increment(1, 5)
+
+    assert counters.counts(1) == {5: 1}
+    counters.flush()
+    assert store.writes == [([], [(1, 5, 1)])]
+    assert store.counts[(1, 5)] == 1
+
+
+def test_unread_failed_flush_is_retried():
+    store = UnreadStore()
+    counters = UnreadCounters(query=store.query, write=store.write)
+    counters.increment(1, 5)
+    store.fail = True
+    assert counters.flush() == 0
+    counters.increment(1, 5)
+    store.fail = False
+
+    counters.flush()
+    assert store.counts == {(1, 5): 2}
+    assert counters.stats()["flush_errors"] == 1
+
+
+def test_unread_load_sees_pending_changes():
+    store = UnreadStore({(1, 5): 2})
+    counters = UnreadCounters(query=store.query, write=store.write, cache_ttl=0.001)
+    counters.increment(1, 5)
+    counters._counts.clear()
+    #reloaded from MySQL (still 2) plus the unflushed increment
+    assert counters.counts(1) == {5: 3}
+
+
+def test_fanout_coalesces_and_replaces_keyed_items():
+    emitted = []
+    fanout = FanOut(lambda event, items, room: emitted.append((event, room, items)), window=60, max_batch=2)
+    #a long window so nothing flushes behind the test's back
+    fanout._thread = object()
+    for i in range(3):
+        fanout.publish("conversation_1", "messages", {"n": i})
+    fanout.publish("user_7", "unread", {"conversation_id": 1, "unread": 1}, key=1)
+    fanout.publish("user_7", "unread", {"conversation_id": 1, "unread": 2}, key=1)
+    fanout.flush()
+
+    assert emitted == [
+        ("messages", "conversation_1", [{"n": 0}, {"n": 1}]),
+        ("messages", "conversation_1", [{"n": 2}]),
+        ("unread", "user_7", [{"conversation_id": 1, "unread": 2}]),
+    ]
+    stats = fanout.stats()
+    assert (stats["published"], stats["replaced"], stats["emits"]) == (5, 1, 3)
+
+
+def test_fanout_without_window_emits_inline():
+    emitted = []
+    fanout = FanOut(lambda event, items, room: emitted.append(items), window=0)
+    fanout.publish("conversation_1", "messages", {"n": 1})
+    assert emitted == [[{"n": 1}]]
+
+
+@pytest.fixture
+def sockets(app, monkeypatch):
+    import routes_chat
+    from routes_chat import socketio
+    from presence import PresenceRegistry
+    from unread import UnreadCounters
+
+    store = UnreadStore()
+    monkeypatch.setattr(routes_chat, "fanout", FanOut(routes_chat._emit_batch, window=0))
+    monkeypatch.setattr(routes_chat, "presence", PresenceRegistry())
+    monkeypatch.setattr(routes_chat, "unread_counters", UnreadCounters(query=store.query, write=store.write))
+    monkeypatch.setattr(routes_chat, "start_sweeper", lambda on_offline: None)
+    monkeypatch.setattr(routes_chat.message_writer, "write", lambda *args: None)
+    monkeypatch.setattr(routes_chat.conversation_history, "page", lambda conversation_id: {"items": []})
+    #create_app() in other tests rebinds the module level SocketIO, bind it back to this app
+    socketio.init_app(app)
+    clients = []
+
+    def connect(room, user_id):
+        client = socketio.test_client(app)
+        client.emit("join", {"room": room, "username": f"user{user_id}", "user_id": user_id})
+        client.get_received()
+        clients.append(client)
+        return client
+
+    yield connect, store
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+
+def events(client):
+    return [(packet["name"], packet["args"]) for packet in client.get_received()]
+
+
+def test_message_is_emitted_once_and_acked(sockets):
+    connect, _ = sockets
+    alice = connect("conversation_4", 1)
+    bob = connect("conversation_4", 2)
+    alice.get_received()
+
+    ack = alice.emit("message", {"room": "conversation_4", "message": "hi", "sender_id": 1, "receiver_id": 2,
+                                 "client_id": "c1"}, callback=True)
+    assert ack["client_id"] == "c1"
+
+    received = events(bob)
+    assert [name for name, _ in received] == ["messages"]
+    [[[item]]] = [args for _, args in received]
+    assert (item["message"], item["sender_id"]) == ("hi", 1)
+
+
+def test_offline_receiver_gets_unread_count(sockets):
+    connect, store = sockets
+    alice = connect("conversation_4", 1)
+    #bob is connected, but only to another conversation
+    bob = connect("conversation_9", 2)
+    bob.get_received()
+
+    alice.emit("message", {"room": "conversation_4", "message": "hi", "sender_id": 1, "receiver_id": 2})
+    alice.emit("message", {"room": "conversation_4", "message": "again", "sender_id": 1, "receiver_id": 2})
+    unread = [args[0][0] for name, args in events(bob) if name == "unread"]
+    assert unread == [{"conversation_id": 4, "unread": 1}, {"conversation_id": 4, "unread": 2}]
+
+    bob.emit("read", {"conversation_id": 4, "user_id": 2})
+    assert [args[0][0] for name, args in events(bob) if name == "unread"] == [{"conversation_id": 4, "unread": 0}]
+
+
+def test_presence_events(sockets):
+    connect, _ = sockets
+    alice = connect("conversation_4", 1)
+    connect("conversation_4", 2)
+    assert ("presence", [[{"room": "conversation_4", "user_id": 2, "online": True}]]) in events(alice)
+
+    bob = connect("conversation_4", 3)
+    bob.disconnect()
+    assert ("presence", [[{"room": "conversation_4", "user_id": 3, "online": False}]]) in events(alice)
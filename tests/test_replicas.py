@@ -0,0 +1,90 @@
+import pytest
+from flask import Flask, jsonify
+
+import replicas
+from replicas import ReplicaSet, get_read_connection
+from pagination import BOOKS
+from streaming import stream_response
+from conftest import FakeDB
+
+
+@pytest.fixture
+def replica_db(fake_db, monkeypatch):
+    replica = FakeDB()
+    replica_set = ReplicaSet([("replica", 3306)], connect=lambda host, port: replica.connect(), lag_probe=lambda conn: 0)
+    replica_set.check()
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+    monkeypatch.setattr(replicas, "_recent_writers", {})
+    return replica
+
+
+@pytest.fixture
+def client(replica_db, fake_db):
+    app = Flask(__name__)
+    replicas.init_app(app)
+
+    @app.route("/write", methods=["POST"])
+    def write():
+        return jsonify(ok=True)
+
+    @app.route("/read")
+    def read():
+        conn = get_read_connection()
+        try:
+            return jsonify(primary=conn._raw.db is fake_db)
+        finally:
+            conn.close()
+
+    @app.route("/stream")
+    def stream():
+        return stream_response(BOOKS, {"fields": "objectID"})
+
+    return app.test_client()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def reads_primary(client, **kwargs):
+    response = client.get("/read", **kwargs)
+    response.close()
+    return response.json["primary"]
+
+
+def test_writer_reads_its_writes_other_callers_do_not(client):
+    client.post("/write", headers=bearer("alice")).close()
+    assert reads_primary(client, headers=bearer("alice"))
+    #same proxy address, different user
+    assert not reads_primary(client, headers=bearer("bob"))
+    assert not reads_primary(client)
+
+
+def test_anonymous_callers_keyed_by_address(client):
+    client.post("/write", environ_base={"REMOTE_ADDR": "203.0.113.7"}).close()
+    assert reads_primary(client, environ_base={"REMOTE_ADDR": "203.0.113.7"})
+    assert not reads_primary(client, environ_base={"REMOTE_ADDR": "198.51.100.23"})
+
+
+def test_streamed_read_after_write_uses_primary(client, fake_db, replica_db):
+    client.post("/write", headers=bearer("alice")).close()
+    response = client.get("/stream", headers=bearer("alice"))
+    response.get_data()
+    response.close()
+    assert fake_db.statements("FROM bookreview_DB.books")
+    assert not replica_db.statements("FROM bookreview_DB.books")
+
+
+def test_stream_without_write_uses_replica(client, fake_db, replica_db):
+    response = client.get("/stream", headers=bearer("bob"))
+    response.get_data()
+    response.close()
+    assert replica_db.statements("FROM bookreview_DB.books")
+    assert not fake_db.statements("FROM bookreview_DB.books")
+
+
+def test_unread_stream_returns_its_connection(client):
+    import db
+    client.post("/write", headers=bearer("alice")).close()
+    client.get("/stream", headers=bearer("alice")).close()
+    assert db.pool_stats()["in_use"] == 0
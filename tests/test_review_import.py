@@ -0,0 +1,114 @@
+import pytest
+
+import review_import
+from review_import import import_reviews, check_row
+from conftest import FakeDB, FakeCursor
+
+BOOKS = {10, 11}
+USERS = {1, 2}
+
+
+def existing(sql, params):
+    #the per-chunk lookups of which books and users exist
+    if "FROM bookreview_DB.books WHERE objectID IN" in sql:
+        return [(i,) for i in params if i in BOOKS]
+    if "FROM bookreview_DB.users WHERE id IN" in sql:
+        return [(i,) for i in params if i in USERS]
+    return []
+
+
+@pytest.fixture
+def feed_db(fake_db):
+    fake_db.responder = existing
+    return fake_db
+
+
+def review(user=1, book=10, stars=5, text="Great"):
+    return {"id": user, "bookID": book, "stars": stars, "review": text}
+
+
+def post(client, **kwargs):
+    response = client.post("/reviews/bulk", **kwargs)
+    response.close()
+    return response
+
+
+def test_check_row():
+    assert check_row(review(stars="4")) == ((1, "Great", 4, 10), None)
+    assert check_row([1]) == (None, "not a JSON object")
+    assert check_row(review(user=True))[1] == "id must be an integer"
+    assert check_row(review(book="ten"))[1] == "bookID must be an integer"
+    assert check_row(review(stars=6))[1] == "stars must be an integer from 1 to 5"
+    assert check_row(review(text="  "))[1] == "review must be a non-empty string"
+    assert check_row(review(text="x" * 70000))[1] == "review is longer than 65535 bytes"
+
+
+def test_bad_rows_reported_by_position_rest_inserted(client, feed_db):
+    rows = [review(), review(stars=0), review(book=99), review(user=3), "nope", review(user=2, book=11, stars=3)]
+    response = post(client, json=rows)
+    assert response.status_code == 200
+    assert response.json == {
+        "received": 6,
+        "inserted": 2,
+        "failed": 4,
+        "errors": [
+            {"row": 1, "error": "stars must be an integer from 1 to 5"},
+            {"row": 2, "error": "book 99 does not exist"},
+            {"row": 3, "error": "user 3 does not exist"},
+            {"row": 4, "error": "not a JSON object"},
+        ],
+        "truncated": False,
+        "errors_truncated": False,
+    }
+    (sql, params), = feed_db.statements("INSERT INTO bookreview_DB.reviews")
+    assert params == [(1, "Great", 5, 10), (2, "Great", 3, 11)]
+    assert feed_db.statements("book_review_stats")
+
+
+def test_ndjson_rows_numbered_by_line(client, feed_db):
+    body = '{"id": 1, "bookID": 10, "stars": 5, "review": "ok"}\n\n{not json\n{"id": 1, "bookID": 10, "stars": 9, "review": "ok"}\n'
+    response = post(client, data=body, content_type="application/x-ndjson")
+    assert response.json["received"] == 3
+    assert response.json["inserted"] == 1
+    assert response.json["errors"] == [{"row": 2, "error": "invalid JSON"},
+                                       {"row": 3, "error": "stars must be an integer from 1 to 5"}]
+
+
+def test_body_that_is_not_an_array_is_400(client, feed_db):
+    response = post(client, json={"id": 1})
+    assert response.status_code == 400
+    assert response.json["error"] == "Body must be a JSON array of reviews"
+    assert not feed_db.statements("INSERT")
+
+
+def test_failed_chunk_does_not_stop_the_others(monkeypatch):
+    db = FakeDB()
+    db.responder = existing
+    executemany = FakeCursor.executemany
+
+    def failing(self, sql, seq):
+        seq = list(seq)
+        if any(values[1] == "boom" for values in seq):
+            raise RuntimeError("deadlock")
+        executemany(self, sql, seq)
+
+    monkeypatch.setattr(FakeCursor, "executemany", failing)
+    rows = enumerate([review(), review(text="boom"), review(stars=7), review(), review()])
+    result = import_reviews(db.connect(), rows, chunk_size=2)
+    assert result["inserted"] == 2
+    assert result["errors"] == [
+        {"row": 0, "error": "not inserted: deadlock"},
+        {"row": 1, "error": "not inserted: deadlock"},
+        {"row": 2, "error": "stars must be an integer from 1 to 5"},
+    ]
+    assert len(db.statements("INSERT INTO bookreview_DB.reviews")) == 2
+
+
+def test_error_list_is_capped(monkeypatch):
+    monkeypatch.setattr(review_import, "REVIEW_IMPORT_MAX_ERRORS", 2)
+    db = FakeDB()
+    db.responder = existing
+    result = import_reviews(db.connect(), enumerate([review(stars=0)] * 5))
+    assert result["failed"] == 5
+    assert [error["row"] for error in result["errors"]] == [0, 1]
+    assert result["errors_truncated"]
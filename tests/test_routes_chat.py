@@ -0,0 +1,117 @@
+import pytest
+
+
+def test_post_message_returns_its_connection(client, fake_db):
+    import db
+    for _ in range(3):
+        client.post("/message", json={}).close()
+    stats = db.pool_stats()
+    assert stats["in_use"] == 0
+    assert stats["leaked"] == 0
+
+
+class StubVerifier:
+    #the bearer token is the uid
+    def verify(self, token):
+        return {"uid": token, "sub": token}
+
+
+@pytest.fixture
+def chat_db(fake_db, monkeypatch):
+    import auth_tokens
+    import routes_chat
+    from history import ConversationHistory
+    from profiles import profile_cache, uid_cache
+    from conversations import members_cache
+    monkeypatch.setattr(auth_tokens, "token_verifier", StubVerifier())
+    monkeypatch.setattr(routes_chat, "conversation_history", ConversationHistory(query=lambda *args: []))
+    for cache in (profile_cache, uid_cache, members_cache):
+        cache.clear()
+    users = {"alice": 1, "bob": 2, "carol": 3}
+
+    def respond(sql, params):
+        if "FROM bookreview_DB.users" in sql:
+            return [(users[uid], uid, None, uid) for uid in params if uid in users]
+        if "FROM conversations" in sql:
+            return [(1, 2)] if params == (7,) else []
+        return []
+
+    fake_db.responder = respond
+    return fake_db
+
+
+def get_messages(client, conversation_id, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    response = client.get(f"/conversations/{conversation_id}/messages", headers=headers)
+    response.close()
+    return response
+
+
+def test_participants_read_their_conversation(client, chat_db):
+    assert get_messages(client, 7, "alice").status_code == 200
+    assert get_messages(client, 7, "bob").status_code == 200
+
+
+def test_non_participant_gets_403(client, chat_db):
+    assert get_messages(client, 7, "carol").status_code == 403
+    #a uid with no users row yet is not a participant either
+    assert get_messages(client, 7, "mallory").status_code == 403
+    assert get_messages(client, 8, "alice").status_code == 404
+
+
+def create_chat(client, data):
+    response = client.post("/chat", json=data)
+    response.close()
+    return response
+
+
+def test_create_chat_returns_the_pair_room(client, fake_db):
+    from conversations import conversation_cache
+    conversation_cache.clear()
+    response = create_chat(client, {"user_id": "2", "target_user_id": 1})
+    assert response.status_code == 200
+    assert response.json == {"room": "conversation_1"}
+    #stored as (min, max)
+    assert fake_db.statements("INSERT INTO conversations")[0][1] == (1, 2)
+
+
+def test_create_chat_rejects_bad_ids(client, fake_db):
+    assert create_chat(client, {"user_id": 1}).status_code == 400
+    assert create_chat(client, {"user_id": "abc", "target_user_id": 2}).status_code == 400
+    assert create_chat(client, {"user_id": 1, "target_user_id": [2]}).status_code == 400
+    assert create_chat(client, {"user_id": 3, "target_user_id": 3}).status_code == 400
+    assert not fake_db.statements("INSERT INTO conversations")
+
+
+class StubCounters:
+    def counts(self, user_id):
+        return {7: 2}
+
+
+def get(client, path, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    response = client.get(path, headers=headers)
+    response.close()
+    return response
+
+
+def test_unread_counts_only_for_the_caller(client, chat_db, monkeypatch):
+    import routes_chat
+    monkeypatch.setattr(routes_chat, "unread_counters", StubCounters())
+    response = get(client, "/users/1/unread", "alice")
+    assert (response.status_code, response.json) == (200, {"7": 2})
+    assert get(client, "/users/2/unread", "alice").status_code == 403
+    assert get(client, "/users/1/unread", "mallory").status_code == 403
+
+
+def test_presence_requires_a_valid_token(client, chat_db, monkeypatch):
+    import auth_tokens
+    from auth_tokens import InvalidTokenError
+
+    class Rejecting:
+        def verify(self, token):
+            raise InvalidTokenError("bad signature")
+
+    assert get(client, "/conversations/7/presence", "alice").status_code == 200
+    monkeypatch.setattr(auth_tokens, "token_verifier", Rejecting())
+    assert get(client, "/conversations/7/presence", "alice").status_code == 401
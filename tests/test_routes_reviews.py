@@ -0,0 +1,31 @@
+def comment(client, data):
+    response = client.post("/comment", json=data)
+    response.close()
+    return response
+
+
+def test_comment_rejects_bad_book_id(client, fake_db):
+    for book_id in (None, "abc", 1.5, True):
+        response = comment(client, {"id": 1, "review": "Great", "stars": 5, "bookID": book_id})
+        assert response.status_code == 400
+        assert response.json["error"] == "bookID must be an integer"
+    assert not fake_db.log
+
+
+def test_comment_rejects_bad_stars(client, fake_db):
+    for stars in (None, 0, 6, "five", 4.5, False):
+        response = comment(client, {"id": 1, "review": "Great", "stars": stars, "bookID": 10})
+        assert response.status_code == 400
+        assert response.json["error"] == "stars must be an integer from 1 to 5"
+    assert not fake_db.log
+
+
+def test_comment_updates_book_stats(client, fake_db):
+    response = comment(client, {"id": 1, "review": "Great", "stars": "4", "bookID": 10})
+    assert response.status_code == 201
+    (insert, params), = fake_db.statements("INSERT INTO bookreview_DB.reviews")
+    assert params == (1, "Great", 4, 10)
+    (stats, params), = fake_db.statements("book_review_stats")
+    #bookID, stars_sum, then the stars_1..stars_5 histogram
+    assert params == [10, 4, 0, 0, 0, 1, 0]
+    assert fake_db.log[-1] == ("COMMIT", ())
@@ -0,0 +1,52 @@
+import threading
+
+import search
+from search import BookIndex
+
+
+def book(object_id, title, author="", genre="", points=0):
+    return {"objectID": object_id, "title": title, "author": author, "genre": genre, "points": points,
+            "num_comments": 0, "ranking": None}
+
+
+def titles(result):
+    return [b["title"] for b in result["items"]]
+
+
+def test_prefix_search_and_upsert():
+    index = BookIndex()
+    index.load([book(1, "The Lost City"), book(2, "Night Garden")])
+    assert titles(index.search(q="lo")) == ["The Lost City"]
+
+    index.upsert(book(1, "The Found City"))
+    assert index.search(q="lost")["total"] == 0
+    assert titles(index.search(q="found")) == ["The Found City"]
+
+    index.remove(2)
+    assert index.search(q="night")["total"] == 0
+
+
+def test_indexer_reloads_on_interval(monkeypatch):
+    #each load sees the books table as it is then
+    tables = iter([[book(1, "Old Title")], [book(1, "New Title")]])
+    reloaded = threading.Event()
+    index = BookIndex()
+
+    def load_books():
+        try:
+            return next(tables)
+        except StopIteration:
+            #both loads happened, park the daemon thread
+            reloaded.set()
+            threading.Event().wait()
+
+    monkeypatch.setattr(search, "book_index", index)
+    monkeypatch.setattr(search, "load_books", load_books)
+    thread = threading.Thread(target=search._index_loop, args=(0.01,), daemon=True)
+    thread.start()
+    assert reloaded.wait(2)
+    assert titles(index.search(q="new")) == ["New Title"]
+
+
+def test_refresh_is_on_by_default():
+    assert search.SEARCH_REFRESH_INTERVAL > 0
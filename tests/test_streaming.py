@@ -0,0 +1,54 @@
+import json
+
+BOOKS = [(i, f"Title {i}") for i in range(1, 6)]
+
+
+def serve_books(fake_db):
+    #rows as SELECT objectID, title returns them
+    fake_db.responder = lambda sql, params: BOOKS if "FROM bookreview_DB.books" in sql else []
+
+
+def test_stream_json_array(client, fake_db):
+    serve_books(fake_db)
+    response = client.get("/books?stream=1&fields=objectID,title")
+    body = response.get_data(as_text=True)
+    response.close()
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert json.loads(body) == [{"objectID": i, "title": f"Title {i}"} for i in range(1, 6)]
+    #skips the response cache
+    assert "ETag" not in response.headers
+
+
+def test_stream_ndjson(client, fake_db):
+    serve_books(fake_db)
+    response = client.get("/books?fields=objectID,title", headers={"Accept": "application/x-ndjson"})
+    lines = response.get_data(as_text=True).splitlines()
+    response.close()
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in lines] == [{"objectID": i, "title": f"Title {i}"} for i in range(1, 6)]
+
+
+def test_empty_stream_is_an_empty_array(client, fake_db):
+    response = client.get("/books?stream=1")
+    body = response.get_data(as_text=True)
+    response.close()
+    assert json.loads(body) == []
+
+
+def test_bad_fields_is_400_before_streaming(client, fake_db):
+    import db
+    response = client.get("/books?stream=1&fields=objectID,nope")
+    response.close()
+    assert response.status_code == 400
+    assert "nope" in response.json["error"]
+    assert not fake_db.statements("FROM bookreview_DB.books")
+    assert db.pool_stats()["in_use"] == 0
+
+
+def test_unread_stream_returns_its_connection(client, fake_db):
+    import db
+    serve_books(fake_db)
+    response = client.get("/books?stream=1&fields=objectID,title")
+    response.close()
+    assert db.pool_stats()["in_use"] == 0
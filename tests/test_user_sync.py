@@ -0,0 +1,220 @@
+import copy
+from datetime import datetime, timedelta
+
+import pytest
+
+import firebase_app
+import user_sync
+from user_sync import COUNTERS, sync_users, sync_status
+
+
+class FirebaseUser:
+    def __init__(self, uid, email, display_name=None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+
+class Page:
+    def __init__(self, auth, start, size):
+        self._auth = auth
+        self._size = size
+        self.users = auth.users[start:start + size]
+        self._next = start + size if start + size < len(auth.users) else None
+        self.next_page_token = str(self._next) if self._next is not None else ""
+
+    def get_next_page(self):
+        if self._next is None:
+            return None
+        return self._auth.page(self._next, self._size)
+
+
+class FakeAuth:
+    #stands in for firebase_admin.auth, list_users pages like the real one
+    def __init__(self, users):
+        self.users = users
+        self.requested = []
+        self.fail_at = None
+
+    def page(self, start, size):
+        self.requested.append(start)
+        if self.fail_at == start:
+            self.fail_at = None
+            raise ConnectionError("Firebase unavailable")
+        return Page(self, start, size)
+
+    def list_users(self, page_token=None, max_results=1000):
+        return self.page(int(page_token or 0), max_results)
+
+
+class Store:
+    #committed state of the users and sync_checkpoints tables
+    def __init__(self):
+        long_ago = datetime.now() - timedelta(days=30)
+        self.state = {"users": {}, "checkpoint": None}
+        self.add_user("existing", "old name", "old@example.com", long_ago)
+        self.add_user("same", "same", "same@example.com", long_ago)
+        #in MySQL but no longer in Firebase
+        self.add_user("gone", "gone", "gone@example.com", long_ago)
+
+    def add_user(self, uid, username, email, created_at):
+        self.state["users"][uid] = {"username": username, "email": email, "sync_run": None, "created_at": created_at}
+
+    def connect(self):
+        return Connection(self)
+
+
+class Connection:
+    def __init__(self, store):
+        self.store = store
+        self.work = copy.deepcopy(store.state)
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.store.state = copy.deepcopy(self.work)
+
+    def rollback(self):
+        self.work = copy.deepcopy(self.store.state)
+
+    def close(self):
+        pass
+
+
+class Cursor:
+    #understands exactly the statements user_sync.py issues
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        work = self.conn.work
+        users = work["users"]
+        checkpoint = work["checkpoint"]
+        self.rows = []
+        if "SELECT uid, username, email, COUNT(*)" in sql:
+            self.rows = [(uid, users[uid]["username"], users[uid]["email"], 1) for uid in params if uid in users]
+        elif "UPDATE bookreview_DB.users SET sync_run" in sql:
+            for uid in params[1:]:
+                users[uid]["sync_run"] = params[0]
+        elif "FROM bookreview_DB.sync_checkpoints WHERE job" in sql:
+            if checkpoint:
+                self.rows = [tuple([checkpoint["run_id"], checkpoint["page_token"]]
+                                   + [checkpoint[c] for c in COUNTERS]
+                                   + [checkpoint["missing_in_firebase"], checkpoint["started_at"], checkpoint["finished_at"]])]
+        elif "INSERT INTO bookreview_DB.sync_checkpoints" in sql:
+            work["checkpoint"] = dict({c: 0 for c in COUNTERS}, run_id=params[1], page_token=None,
+                                      missing_in_firebase=None, started_at=datetime.now(), finished_at=None)
+        elif "SET page_token = %s" in sql:
+            checkpoint["page_token"] = params[0]
+            checkpoint.update(zip(COUNTERS, params[1:1 + len(COUNTERS)]))
+        elif "SELECT COUNT(*) FROM bookreview_DB.users" in sql:
+            run_id = params[0]
+            self.rows = [(sum(1 for u in users.values()
+                              if u["sync_run"] != run_id and u["created_at"] < checkpoint["started_at"]),)]
+        elif "SET page_token = NULL, missing_in_firebase" in sql:
+            checkpoint.update(page_token=None, missing_in_firebase=params[0], finished_at=datetime.now())
+        else:
+            raise AssertionError(f"unexpected statement {sql}")
+
+    def executemany(self, sql, rows):
+        users = self.conn.work["users"]
+        for row in rows:
+            if "INSERT INTO bookreview_DB.users" in sql:
+                username, email, uid, run_id = row
+                users[uid] = {"username": username, "email": email, "sync_run": run_id, "created_at": datetime.now()}
+            elif "UPDATE bookreview_DB.users SET username" in sql:
+                username, email, run_id, uid = row
+                users[uid].update(username=username, email=email, sync_run=run_id)
+            else:
+                raise AssertionError(f"unexpected statement {sql}")
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = Store()
+    monkeypatch.setattr(user_sync, "get_db_connection", store.connect)
+    return store
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    auth = FakeAuth([
+        FirebaseUser("existing", "new@example.com", "new name"),
+        FirebaseUser("same", "same@example.com", "same"),
+        FirebaseUser("fresh1", "fresh1@example.com"),
+        FirebaseUser("fresh2", "fresh2@example.com", "Fresh Two"),
+        FirebaseUser("fresh3", None, None),
+    ])
+    #sync_users() without list_users asks firebase_app for the auth module
+    monkeypatch.setattr(firebase_app, "get_auth", lambda: auth)
+    return auth
+
+
+def test_full_pass(store, auth):
+    result = sync_users(page_size=2)
+
+    assert result["finished"]
+    assert {c: result[c] for c in COUNTERS} == {
+        "pages": 3, "seen": 5, "inserted": 3, "updated": 1, "unchanged": 1, "duplicates": 0,
+    }
+    assert result["missing_in_firebase"] == 1
+    users = store.state["users"]
+    assert users["existing"]["username"] == "new name"
+    assert users["fresh1"]["username"] == "fresh1"
+    assert users["fresh3"]["username"] == "fresh3"
+    assert {uid for uid, u in users.items() if u["sync_run"] == result["run_id"]} == set(users) - {"gone"}
+
+
+def test_failed_page_resumes_from_checkpoint(store, auth):
+    auth.fail_at = 2
+    with pytest.raises(ConnectionError):
+        sync_users(page_size=2)
+
+    #the first page and the token past it were committed together
+    status = sync_status()
+    assert status["in_progress"] and status["pages"] == 1 and status["inserted"] == 0
+    assert store.state["checkpoint"]["page_token"] == "2"
+    assert store.state["users"]["existing"]["username"] == "new name"
+
+    auth.requested.clear()
+    result = sync_users(page_size=2)
+    assert result["finished"] and result["run_id"] == 1
+    #page one is not fetched again
+    assert auth.requested == [2, 4]
+    assert (result["pages"], result["seen"], result["inserted"]) == (3, 5, 3)
+
+
+def test_max_pages_then_resume(store, auth):
+    first = sync_users(page_size=2, max_pages=1)
+    assert not first["finished"] and first["pages"] == 1
+
+    second = sync_users(page_size=2)
+    assert second["finished"] and second["run_id"] == first["run_id"]
+    assert second["pages"] == 3
+
+
+def test_next_pass_gets_new_run_id(store, auth):
+    first = sync_users(page_size=10)
+    second = sync_users(page_size=10)
+    assert second["run_id"] == first["run_id"] + 1
+    assert (second["inserted"], second["updated"], second["unchanged"]) == (0, 0, 5)
+
+
+def test_restart_discards_checkpoint(store, auth):
+    sync_users(page_size=2, max_pages=1)
+    auth.requested.clear()
+    result = sync_users(page_size=2, restart=True)
+    assert result["run_id"] == 2
+    assert auth.requested[0] == 0